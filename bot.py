@@ -10,7 +10,8 @@ from time import sleep
 import psutil
 
 from config import Config
-from database import BotDBUtil, session, DBVersion
+from database import BotDBUtil
+from database.update import update_database
 
 from loguru import logger
 
@@ -33,6 +34,7 @@ def enqueue_output(out, queue):
 
 
 def init_bot():
+    update_database()
     cache_path = os.path.abspath(Config('cache_path'))
     if os.path.exists(cache_path):
         shutil.rmtree(cache_path)
@@ -116,10 +118,6 @@ if __name__ == '__main__':
     init_bot()
     logger.remove()
     logger.add(sys.stderr, format='{message}', level="INFO")
-    query_dbver = session.query(DBVersion).all()
-    if not query_dbver:
-        session.add_all([DBVersion(value=1)])
-        session.commit()
     try:
         while True:
             try:
@@ -10,7 +10,7 @@ from bots.aiocqhttp.message_guild import MessageSession as MessageSessionGuild
 from config import Config
 from core.elements import MsgInfo, Session, EnableDirtyWordCheck, PrivateAssets, Url
 from core.parser.message import parser
-from core.utils import init, load_prompt, init_async, MessageTaskManager
+from core.utils import init, load_prompt, init_async, MessageTaskManager, HttpClient, SharedSchedule
 from database import BotDBUtil
 from database.logging_message import UnfriendlyActions
 
@@ -27,6 +27,13 @@ async def startup():
     bot.logger.setLevel(logging.WARNING)
 
 
+@bot.server_app.after_serving
+async def shutdown():
+    SharedSchedule.stop()
+    BotDBUtil.Analytics.flush()
+    await HttpClient.close()
+
+
 @bot.on_websocket_connection
 async def _(event: Event):
     await load_prompt(FetchTarget)
@@ -18,6 +18,7 @@ from core.elements import Plain, Image, MsgInfo, Session, Voice, FetchTarget as
     FetchedSession as FS, FinishedSession as FinS
 from core.elements.message.chain import MessageChain
 from core.logger import Logger
+from core.metrics import timed
 from database import BotDBUtil
 
 
@@ -49,6 +50,7 @@ class MessageSession(MS):
         wait = True
         quote = True
 
+    @timed('send')
     async def sendMessage(self, msgchain, quote=True, disable_secret_check=False) -> FinishedSession:
         msg = MessageSegment.text('')
         if quote and self.target.targetFrom == 'QQ|Group' and self.session.message:
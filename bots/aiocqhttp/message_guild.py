@@ -10,6 +10,7 @@ from core.builtins.message import MessageSession as MS
 from core.elements import Plain, Image, ExecutionLockList, FinishedSession as FinS
 from core.elements.message.chain import MessageChain
 from core.logger import Logger
+from core.metrics import timed
 
 
 class FinishedSession(FinS):
@@ -30,6 +31,7 @@ class MessageSession(MS):
         wait = True
         quote = False
 
+    @timed('send')
     async def sendMessage(self, msgchain, quote=True, disable_secret_check=False) -> FinishedSession:
         msg = MessageSegment.text('')
         msgchain = MessageChain(msgchain)
@@ -7,7 +7,8 @@ from bots.aiogram.message import MessageSession, FetchTarget
 from core.utils.tasks import MessageTaskManager
 from core.elements import MsgInfo, Session, PrivateAssets, Url
 from core.parser.message import parser
-from core.utils import init, load_prompt, init_async
+from core.utils import init, load_prompt, init_async, HttpClient, SharedSchedule
+from database import BotDBUtil
 
 PrivateAssets.set(os.path.abspath(os.path.dirname(__file__) + '/assets'))
 init()
@@ -36,5 +37,11 @@ async def on_startup(dispatcher):
     await load_prompt(FetchTarget)
 
 
+async def on_shutdown(dispatcher):
+    SharedSchedule.stop()
+    BotDBUtil.Analytics.flush()
+    await HttpClient.close()
+
+
 if dp:
-    executor.start_polling(dp, skip_updates=True, on_startup=on_startup)
+    executor.start_polling(dp, skip_updates=True, on_startup=on_startup, on_shutdown=on_shutdown)
@@ -8,6 +8,7 @@ from core.builtins.message import MessageSession as MS
 from core.elements import Plain, Image, MsgInfo, Session, Voice, FetchTarget as FT, FetchedSession as FS, FinishedSession as FinS
 from core.elements.message.chain import MessageChain
 from core.logger import Logger
+from core.metrics import timed
 from database import BotDBUtil
 
 
@@ -36,6 +37,7 @@ class MessageSession(MS):
         quote = True
         wait = True
 
+    @timed('send')
     async def sendMessage(self, msgchain, quote=True, disable_secret_check=False) -> FinishedSession:
         msgchain = MessageChain(msgchain)
         if not msgchain.is_safe and not disable_secret_check:
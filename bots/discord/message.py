@@ -13,6 +13,7 @@ from core.elements import Plain, Image, MsgInfo, Session, FetchTarget as FT, \
 from core.elements.message.chain import MessageChain
 from core.elements.message.internal import Embed
 from core.logger import Logger
+from core.metrics import timed
 from database import BotDBUtil
 
 
@@ -68,6 +69,7 @@ class MessageSession(MS):
         quote = True
         wait = True
 
+    @timed('send')
     async def sendMessage(self, msgchain, quote=True, disable_secret_check=False) -> FinishedSession:
         msgchain = MessageChain(msgchain)
         if not msgchain.is_safe and not disable_secret_check:
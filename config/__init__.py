@@ -1,31 +1,89 @@
+import os
+import time
+import traceback
 from configparser import ConfigParser
 from os.path import abspath
+from typing import Callable, Dict, List, Union
 
 from core.exceptions import ConfigFileNotFound
+from core.logger import Logger
 
 config_filename = 'config.cfg'
 config_path = abspath('./config/' + config_filename)
 
 
 class CFG:
-    def config(self, q):
-        cp = ConfigParser()
+    """
+    配置文件的读取器。解析后的配置保存在内存中，查询时只需一次字典查找；
+    距上次检查超过check_interval秒时会检查配置文件的修改时间，文件变化后重新解析，并通知订阅了变化的键的回调。
+    """
+    check_interval = 1
+
+    def __init__(self):
+        self._values: Dict[str, Union[str, bool]] = {}
+        self._mtime = None
+        self._last_check = 0.0
+        self._subscribers: List[Callable[[Dict[str, Union[str, bool]]], None]] = []
+
+    @staticmethod
+    def _parse() -> Dict[str, Union[str, bool]]:
+        cp = ConfigParser(interpolation=None)  # 与原先逐项读取一样，值中的%不做插值
         cp.read(config_path)
+        section = cp.sections()
+        if len(section) == 0:
+            raise ConfigFileNotFound(config_path) from None
+        values = {}
+        for key, value in cp.items(section[0]):
+            if value.upper() == 'TRUE':
+                value = True
+            elif value.upper() == 'FALSE':
+                value = False
+            values[key] = value
+        return values
+
+    def reload(self, force: bool = False):
+        """
+        配置文件的修改时间变化时重新读取
+        :param force: 是否无视修改时间强制重新读取
+        """
+        self._last_check = time.monotonic()
         try:
-            section = cp.sections()
-            if len(section) == 0:
-                raise ConfigFileNotFound(config_path) from None
-            section = section[0]
-            value = cp.get(section, q)
+            mtime = os.stat(config_path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._mtime and not force:
+            return
+        self._mtime = mtime
+        try:
+            values = self._parse()
         except Exception:
-            return False
-        if value.upper() == 'TRUE':
-            return True
-        if value.upper() == 'FALSE':
-            return False
-        return value
+            if self._values:  # 文件正在编辑或暂时无法解析时保留上次读取的配置
+                Logger.error(f'Failed to reload {config_path}, keeping the previous config:\n'
+                             f'{traceback.format_exc()}')
+            return
+        previous, self._values = self._values, values
+        changed = {k: values.get(k, False) for k in previous.keys() | values.keys() if previous.get(k) != values.get(k)}
+        if changed and previous:
+            for callback in self._subscribers:
+                try:
+                    callback(changed)
+                except Exception:
+                    traceback.print_exc()
+
+    def subscribe(self, callback: Callable[[Dict[str, Union[str, bool]]], None]):
+        """
+        订阅配置的变化，配置文件重新读取后以{键: 新的值}调用，被删除的键的值为False
+        """
+        self._subscribers.append(callback)
+        return callback
+
+    def config(self, q):
+        if time.monotonic() - self._last_check > self.check_interval:
+            self.reload()
+        return self._values.get(q.lower(), False)
 
 
-Config = CFG().config
+cfg = CFG()
+Config = cfg.config
 CachePath = Config('cache_path')
 DBPath = Config('db_path')
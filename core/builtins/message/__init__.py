@@ -1,4 +1,5 @@
 import asyncio
+from contextlib import AsyncExitStack
 
 from core.elements import ExecutionLockList, Plain, confirm_command
 from core.elements.message import *
@@ -8,17 +9,24 @@ from core.utils import MessageTaskManager
 
 
 class MessageSession(MessageSession):
+    def _wait_lock(self):
+        """
+        并行执行的子命令共用同一个等待锁，依次向用户提问，避免后一个等待取消前一个
+        """
+        return self.wait_lock if self.wait_lock is not None else AsyncExitStack()
+
     async def waitConfirm(self, msgchain=None, quote=True, delete=True) -> bool:
         send = None
         ExecutionLockList.remove(self)
-        if msgchain is not None:
-            msgchain = MessageChain(msgchain)
-            msgchain.append(Plain('（发送“是”或符合确认条件的词语来确认）'))
-            send = await self.sendMessage(msgchain, quote)
-        flag = asyncio.Event()
-        MessageTaskManager.add_task(self, flag)
-        await flag.wait()
-        result = MessageTaskManager.get_result(self)
+        async with self._wait_lock():
+            if msgchain is not None:
+                msgchain = MessageChain(msgchain)
+                msgchain.append(Plain('（发送“是”或符合确认条件的词语来确认）'))
+                send = await self.sendMessage(msgchain, quote)
+            flag = asyncio.Event()
+            task = MessageTaskManager.add_task(self, flag)
+            await flag.wait()
+        result = task.result
         if result:
             if msgchain is not None and delete:
                 await send.delete()
@@ -31,13 +39,14 @@ class MessageSession(MessageSession):
     async def waitNextMessage(self, msgchain=None, quote=True, delete=False) -> MessageSession:
         send = None
         ExecutionLockList.remove(self)
-        if msgchain is not None:
-            msgchain = MessageChain(msgchain)
-            await self.sendMessage(msgchain, quote)
-        flag = asyncio.Event()
-        MessageTaskManager.add_task(self, flag)
-        await flag.wait()
-        result = MessageTaskManager.get_result(self)
+        async with self._wait_lock():
+            if msgchain is not None:
+                msgchain = MessageChain(msgchain)
+                await self.sendMessage(msgchain, quote)
+            flag = asyncio.Event()
+            task = MessageTaskManager.add_task(self, flag)
+            await flag.wait()
+        result = task.result
         if result:
             return result
         else:
@@ -45,13 +54,14 @@ class MessageSession(MessageSession):
 
     async def waitReply(self, msgchain, quote=True) -> MessageSession:
         ExecutionLockList.remove(self)
-        msgchain = MessageChain(msgchain)
-        msgchain.append(Plain('（请使用指定的词语回复本条消息）'))
-        send = await self.sendMessage(msgchain, quote)
-        flag = asyncio.Event()
-        MessageTaskManager.add_task(self, flag, reply=send.messageId)
-        await flag.wait()
-        result = MessageTaskManager.get_result(self)
+        async with self._wait_lock():
+            msgchain = MessageChain(msgchain)
+            msgchain.append(Plain('（请使用指定的词语回复本条消息）'))
+            send = await self.sendMessage(msgchain, quote)
+            flag = asyncio.Event()
+            task = MessageTaskManager.add_task(self, flag, reply=send.messageId)
+            await flag.wait()
+        result = task.result
         if result:
             return result
         else:
@@ -60,17 +70,18 @@ class MessageSession(MessageSession):
     async def waitAnyone(self, msgchain=None, delete=False) -> MessageSession:
         send = None
         ExecutionLockList.remove(self)
-        if msgchain is not None:
-            msgchain = MessageChain(msgchain)
-            send = await self.sendMessage(msgchain, quote=False)
-        flag = asyncio.Event()
-        MessageTaskManager.add_task(self, flag, all_=True)
-        await flag.wait()
-        result = MessageTaskManager.get()[self.target.targetId]['all']
-        if 'result' in result:
+        async with self._wait_lock():
+            if msgchain is not None:
+                msgchain = MessageChain(msgchain)
+                send = await self.sendMessage(msgchain, quote=False)
+            flag = asyncio.Event()
+            task = MessageTaskManager.add_task(self, flag, all_=True)
+            await flag.wait()
+        result = task.result
+        if result:
             if send is not None and delete:
                 await send.delete()
-            return MessageTaskManager.get()[self.target.targetId]['all']['result']
+            return result
         else:
             raise WaitCancelException
 
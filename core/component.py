@@ -1,5 +1,5 @@
 import re
-from typing import Union
+from typing import Union, Tuple
 
 from apscheduler.triggers.combining import AndTrigger, OrTrigger
 from apscheduler.triggers.cron import CronTrigger
@@ -9,6 +9,7 @@ from apscheduler.triggers.interval import IntervalTrigger
 from core.elements import Command, RegexCommand, Schedule, StartUp
 from core.elements.module.component_meta import *
 from core.loader import ModulesManager
+from core.parser.regex import extract_prefilter
 
 
 class Bind:
@@ -23,7 +24,8 @@ class Bind:
                    required_admin: bool = False,
                    required_superuser: bool = False,
                    available_for: Union[str, list, tuple] = '*',
-                   exclude_from: Union[str, list, tuple] = ''):
+                   exclude_from: Union[str, list, tuple] = '',
+                   rate_limit: Tuple[int, float] = None):
             def decorator(function):
                 nonlocal help_doc
                 if isinstance(help_doc, str):
@@ -36,7 +38,8 @@ class Bind:
                                                                             required_admin=required_admin,
                                                                             required_superuser=required_superuser,
                                                                             available_for=available_for,
-                                                                            exclude_from=exclude_from))
+                                                                            exclude_from=exclude_from,
+                                                                            rate_limit=rate_limit))
                 return function
             return decorator
 
@@ -50,7 +53,9 @@ class Bind:
                                                                           pattern=pattern,
                                                                           mode=mode,
                                                                           flags=flags,
-                                                                          show_typing=show_typing))
+                                                                          show_typing=show_typing,
+                                                                          prefilter=extract_prefilter(pattern,
+                                                                                                      flags)))
                 return function
             return decorator
 
@@ -75,7 +80,8 @@ def on_command(
     base: bool = False,
     required_superuser: bool = False,
     available_for: Union[str, list, tuple] = '*',
-    exclude_from: Union[str, list, tuple] = ''
+    exclude_from: Union[str, list, tuple] = '',
+    rate_limit: Tuple[int, float] = None
 ):
     """
 
@@ -90,6 +96,7 @@ def on_command(
     :param required_superuser: 将此命令设为机器人的超级管理员才可执行。
     :param available_for: 此命令支持的平台列表。
     :param exclude_from: 此命令排除的平台列表。
+    :param rate_limit: 每个用户使用此命令的频率限制，格式为(次数, 秒数)。只需限制开销较大的子命令时，可在handle中单独设置。
     :return: 此类型的模块。
     """
     module = Command(alias=alias,
@@ -101,7 +108,8 @@ def on_command(
                      required_admin=required_admin,
                      required_superuser=required_superuser,
                      available_for=available_for,
-                     exclude_from=exclude_from)
+                     exclude_from=exclude_from,
+                     rate_limit=rate_limit)
     ModulesManager.add_module(module)
     return Bind.Command(bind_prefix)
 
@@ -116,7 +124,8 @@ def on_regex(
     base: bool = False,
     required_superuser: bool = False,
     available_for: Union[str, list, tuple] = '*',
-    exclude_from: Union[str, list, tuple] = ''
+    exclude_from: Union[str, list, tuple] = '',
+    rate_limit: Tuple[int, float] = None
 ):
     """
 
@@ -131,6 +140,7 @@ def on_regex(
     :param required_superuser: 将此命令设为机器人的超级管理员才可执行。
     :param available_for: 此命令支持的平台列表。
     :param exclude_from: 此命令排除的平台列表。
+    :param rate_limit: 每个用户使用此命令的频率限制，格式为(次数, 秒数)。
     :return: 此类型的模块。
     """
 
@@ -143,7 +153,8 @@ def on_regex(
                           base=base,
                           required_superuser=required_superuser,
                           available_for=available_for,
-                          exclude_from=exclude_from
+                          exclude_from=exclude_from,
+                          rate_limit=rate_limit
                           )
     ModulesManager.add_module(module)
     return Bind.Regex(bind_prefix)
@@ -8,6 +8,7 @@ from core.elements import Plain, Image as BImage, Session, MsgInfo, FetchTarget
 from core.elements.message.chain import MessageChain
 from core.elements.others import confirm_command
 from core.logger import Logger
+from core.metrics import timed
 
 
 class FinishedSession(FinS):
@@ -27,6 +28,7 @@ class Template(MS):
         delete = True
         wait = True
 
+    @timed('send')
     async def sendMessage(self, msgchain, quote=True, disable_secret_check=False) -> FinishedSession:
         Logger.info(msgchain)
         msgchain = MessageChain(msgchain)
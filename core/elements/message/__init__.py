@@ -76,7 +76,7 @@ class MessageSession:
     """
     消息会话，囊括了处理一条消息所需要的东西。
     """
-    __slots__ = ("target", "session", "trigger_msg", "parsed_msg", "matched_msg", "sent")
+    __slots__ = ("target", "session", "trigger_msg", "parsed_msg", "matched_msg", "sent", "context", "wait_lock")
 
     def __init__(self,
                  target: MsgInfo,
@@ -84,6 +84,8 @@ class MessageSession:
         self.target = target
         self.session = session
         self.sent: List[MessageChain] = []
+        self.context = None  # 由消息处理器载入的BotDBUtil.RequestContext
+        self.wait_lock = None  # 并行执行的命令共用的等待锁，由消息处理器设置
 
     async def sendMessage(self,
                           msgchain,
@@ -78,15 +78,15 @@ class Image:
 
     @retry(stop=stop_after_attempt(3))
     async def get_image(self):
+        from core.utils.http import HttpClient
         url = self.path
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=aiohttp.ClientTimeout(total=20)) as req:
-                raw = await req.read()
-                ft = filetype.match(raw).extension
-                img_path = f'{CachePath}{str(uuid.uuid4())}.{ft}'
-                with open(img_path, 'wb+') as image_cache:
-                    image_cache.write(raw)
-                return img_path
+        async with HttpClient.session().get(url, timeout=aiohttp.ClientTimeout(total=20)) as req:
+            raw = await req.read()
+            ft = filetype.match(raw).extension
+            img_path = f'{CachePath}{str(uuid.uuid4())}.{ft}'
+            with open(img_path, 'wb+') as image_cache:
+                image_cache.write(raw)
+            return img_path
 
     def __str__(self):
         return self.path
@@ -1,4 +1,4 @@
-from typing import Callable, Union, Dict, List
+from typing import Callable, Union, Dict, List, Tuple
 
 from apscheduler.triggers.combining import AndTrigger, OrTrigger
 from apscheduler.triggers.cron import CronTrigger
@@ -27,7 +27,8 @@ class Command:
                  base: bool = False,
                  required_superuser: bool = False,
                  available_for: Union[str, list, tuple] = '*',
-                 exclude_from: Union[str, list, tuple] = ''):
+                 exclude_from: Union[str, list, tuple] = '',
+                 rate_limit: Tuple[int, float] = None):
         self.bind_prefix: str = bind_prefix
         if isinstance(alias, str):
             alias = {alias: bind_prefix}
@@ -42,6 +43,7 @@ class Command:
         self.required_superuser: bool = required_superuser
         self.available_for: List[str] = convert2lst(available_for)
         self.exclude_from: List[str] = convert2lst(exclude_from)
+        self.rate_limit: Tuple[int, float] = rate_limit
         self.match_list = CommandMatches()
 
 
@@ -56,7 +58,8 @@ class RegexCommand:
                  base: bool = False,
                  required_superuser: bool = False,
                  available_for: Union[str, list, tuple] = '*',
-                 exclude_from: Union[str, list, tuple] = ''):
+                 exclude_from: Union[str, list, tuple] = '',
+                 rate_limit: Tuple[int, float] = None):
         self.bind_prefix: str = bind_prefix
         if isinstance(alias, str):
             alias = {alias: bind_prefix}
@@ -71,6 +74,7 @@ class RegexCommand:
         self.required_superuser: bool = required_superuser
         self.available_for: List[str] = convert2lst(available_for)
         self.exclude_from: List[str] = convert2lst(exclude_from)
+        self.rate_limit: Tuple[int, float] = rate_limit
         self.match_list = RegexMatches()
 
 
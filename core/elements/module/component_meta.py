@@ -1,5 +1,5 @@
 import re
-from typing import Callable, Union
+from typing import Callable, Tuple, Union
 
 
 class Meta:
@@ -16,6 +16,7 @@ class CommandMeta:
                  required_superuser: bool = False,
                  available_for: Union[str, list, tuple] = '*',
                  exclude_from: Union[str, list, tuple] = '',
+                 rate_limit: Tuple[int, float] = None,
                  ):
         self.function = function
         if isinstance(help_doc, str):
@@ -36,6 +37,7 @@ class CommandMeta:
             exclude_from = list(exclude_from)
         self.available_for = available_for
         self.exclude_from = exclude_from
+        self.rate_limit = tuple(rate_limit) if rate_limit else None
 
 
 class RegexMeta:
@@ -45,12 +47,15 @@ class RegexMeta:
                  mode: str = None,
                  flags: re.RegexFlag = 0,
                  show_typing: bool = True,
+                 prefilter: tuple = None,
                  ):
         self.function = function
         self.pattern = pattern
-        self.mode = mode
+        self.mode = mode.upper() if mode is not None else mode
         self.flags = flags
         self.show_typing = show_typing
+        self.compiled = re.compile(pattern, flags=flags) if pattern is not None else None
+        self.prefilter = prefilter
 
 
 class ScheduleMeta:
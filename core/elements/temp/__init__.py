@@ -1,54 +1,166 @@
+import asyncio
+import time
+from collections import OrderedDict
 from typing import Union
 
+from config import Config
 from core.elements import MessageSession
 
 
+class LRUCache:
+    """
+    有容量上限与过期时间的LRU缓存
+    :param maxsize: 最多保存的条目数，超出时淘汰最久未使用的条目
+    :param ttl: 条目的有效时间（秒），为0时不过期
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is not None:
+            value, expires = item
+            if not expires or expires > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return default
+
+    def set(self, key, value):
+        self._data[key] = (value, time.monotonic() + self.ttl if self.ttl else 0)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {'size': len(self._data), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0}
+
+
+_cache_size = int(Config('db_cache_size') or 10000)
+_cache_ttl = float(Config('db_cache_ttl') or 300)
+
+
 class EnabledModulesCache:
-    _cache = {}
+    _cache = LRUCache(_cache_size, _cache_ttl)
 
     @staticmethod
     def add_cache(key, value):
-        EnabledModulesCache._cache[key] = value
+        EnabledModulesCache._cache.set(key, value)
 
     @staticmethod
     def get_cache(key):
         return EnabledModulesCache._cache.get(key, False)
 
+    @staticmethod
+    def del_cache(key):
+        EnabledModulesCache._cache.delete(key)
+
+    @staticmethod
+    def get_stats() -> dict:
+        return EnabledModulesCache._cache.stats()
+
 
 class SenderInfoCache:
-    _cache = {}
+    _cache = LRUCache(_cache_size, _cache_ttl)
 
     @staticmethod
     def add_cache(key, value):
-        SenderInfoCache._cache[key] = value
+        SenderInfoCache._cache.set(key, value)
 
     @staticmethod
     def get_cache(key) -> Union[dict, bool]:
         return SenderInfoCache._cache.get(key, False)
 
+    @staticmethod
+    def del_cache(key):
+        SenderInfoCache._cache.delete(key)
+
+    @staticmethod
+    def get_stats() -> dict:
+        return SenderInfoCache._cache.stats()
+
 
 class ExecutionLockList:
-    _list = set()
+    """
+    按发送者排队执行命令。同一发送者的命令依次执行，正在执行与排队中的命令总数超过command_queue_depth时拒绝新的命令。
+    命令在等待用户回复或休眠时会提前释放，使排队中的命令可以继续执行
+    """
+    _queues = {}
+    depth = int(Config('command_queue_depth') or 3)
+
+    class SenderQueue:
+        __slots__ = ("lock", "pending", "holder")
+
+        def __init__(self):
+            self.lock = asyncio.Lock()
+            self.pending = 0  # 正在执行与排队中的命令数
+            self.holder = None  # 正在执行的命令所属消息的MsgInfo
+
+    @staticmethod
+    async def acquire(msg: MessageSession) -> bool:
+        """
+        排队等待执行，队列已满时返回False
+        """
+        senderId = msg.target.senderId
+        queue = ExecutionLockList._queues.get(senderId)
+        if queue is None:
+            queue = ExecutionLockList._queues[senderId] = ExecutionLockList.SenderQueue()
+        if queue.pending >= ExecutionLockList.depth:
+            return False
+        queue.pending += 1
+        try:
+            await queue.lock.acquire()
+        except asyncio.CancelledError:
+            ExecutionLockList._release(senderId, queue)
+            raise
+        queue.holder = msg.target
+        return True
 
     @staticmethod
-    def add(msg: MessageSession):
-        targetId = msg.target.senderId
-        ExecutionLockList._list.add(targetId)
+    def _release(senderId, queue: SenderQueue):
+        queue.pending -= 1
+        if queue.pending == 0:
+            del ExecutionLockList._queues[senderId]
 
     @staticmethod
     def remove(msg: MessageSession):
-        targetId = msg.target.senderId
-        if targetId in ExecutionLockList._list:
-            ExecutionLockList._list.remove(targetId)
+        """
+        结束该消息的执行，使下一条排队的命令开始执行。重复调用或该消息并未在执行时不做任何事
+        """
+        senderId = msg.target.senderId
+        queue = ExecutionLockList._queues.get(senderId)
+        if queue is None or queue.holder is not msg.target:
+            return
+        queue.holder = None
+        queue.lock.release()
+        ExecutionLockList._release(senderId, queue)
 
     @staticmethod
     def check(msg: MessageSession):
-        targetId = msg.target.senderId
-        return True if targetId in ExecutionLockList._list else False
+        queue = ExecutionLockList._queues.get(msg.target.senderId)
+        return queue is not None and queue.holder is not None
 
     @staticmethod
     def get():
-        return ExecutionLockList._list
+        return {senderId for senderId, queue in ExecutionLockList._queues.items() if queue.holder is not None}
 
 
-__all__ = ["EnabledModulesCache", "SenderInfoCache", "ExecutionLockList"]
+__all__ = ["LRUCache", "EnabledModulesCache", "SenderInfoCache", "ExecutionLockList"]
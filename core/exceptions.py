@@ -20,3 +20,17 @@ class FinishedException(BaseException):
 
 class WaitCancelException(BaseException):
     pass
+
+
+class RenderTimeoutError(Exception):
+    pass
+
+
+class CircuitOpenError(ConnectionError):
+    pass
+
+
+class HttpStatusError(ValueError):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
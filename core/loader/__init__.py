@@ -1,18 +1,31 @@
 import importlib
 import os
 import re
+import time
 import traceback
 from typing import Dict, Union
 
+from config import Config
 from core.elements import Command, Schedule, RegexCommand, StartUp, PrivateAssets
 from core.logger import Logger
+from core.parser.regex import RegexDispatcher
+from core.profiler import ImportProfiler
+from .manifest import build_module, dump_package, load_manifest, module_package, package_signature, save_manifest
 
 load_dir_path = os.path.abspath('./modules/')
 
 
 def load_modules():
+    """
+    注册modules下的所有模块。清单中签名未变的包直接从清单注册，其余的包在此导入，并据此更新清单
+    """
+    start = time.perf_counter()
     err_prompt = []
     fun_file = None
+    eager = Config('eager_load_modules')
+    manifest = {} if eager else load_manifest()
+    new_manifest = {}
+    imported = 0
     dir_list = os.listdir(load_dir_path)
     for file_name in dir_list:
         try:
@@ -21,15 +34,40 @@ def load_modules():
             if os.path.isdir(file_path):
                 if file_name[0] != '_':
                     fun_file = file_name
-            if fun_file is not None:
+            if fun_file is not None and fun_file not in new_manifest:  # 已随其他包导入的包无需再处理
+                signature = package_signature(file_path)
+                entry = manifest.get(fun_file)
+                if entry is not None and entry['signature'] == signature and not entry['eager']:
+                    for m in entry['modules']:
+                        if m['bind_prefix'] not in ModulesManager.modules:  # 可能已被其他包导入
+                            ModulesManager.add_module(build_module(fun_file, m), package=fun_file)
+                    new_manifest[fun_file] = entry
+                    continue
                 Logger.info(f'Loading modules.{fun_file}...')
-                modules = 'modules.' + fun_file
-                importlib.import_module(modules)
+                before = set(ModulesManager.modules)
+                import_start = time.perf_counter()
+                importlib.import_module('modules.' + fun_file)
+                ImportProfiler.record(fun_file, time.perf_counter() - import_start)
+                imported += 1
+                registered = {fun_file: []}  # 导入时一并导入的其他包中的模块按处理函数所在的包记录
+                for k, v in ModulesManager.modules.items():
+                    if k not in before:
+                        package = module_package(v)
+                        if package is None or not os.path.isdir(f'{load_dir_path}/{package}'):
+                            package = fun_file
+                        registered.setdefault(package, []).append(v)
+                for package, modules in registered.items():
+                    new_manifest[package] = dump_package(package_signature(f'{load_dir_path}/{package}'), modules)
                 Logger.info(f'Succeeded loaded modules.{fun_file}!')
         except:
             tb = traceback.format_exc()
             Logger.info(f'Failed to load modules.{fun_file}: \n{tb}')
             err_prompt.append(str(tb))
+    if new_manifest != manifest:
+        try:
+            save_manifest(new_manifest)
+        except Exception:
+            Logger.warn(f'Failed to save the module manifest: \n{traceback.format_exc()}')
     loadercache = os.path.abspath(PrivateAssets.path + '/.cache_loader')
     openloadercache = open(loadercache, 'w')
     if err_prompt:
@@ -38,22 +76,128 @@ def load_modules():
     else:
         openloadercache.write('所有模块已正确加载。')
     openloadercache.close()
+    seconds = time.perf_counter() - start
+    try:
+        ImportProfiler.save_startup(seconds)
+    except Exception:
+        Logger.warn(f'Failed to save the startup import report: \n{traceback.format_exc()}')
+    Logger.info(f'Registered {len(ModulesManager.modules)} modules ({len(ModulesManager.lazy_modules)} deferred, '
+                f'{imported} packages imported) in {seconds:.2f}s.')
+
+
+class DispatchIndex:
+    """
+    某一平台下消息分发所需的模块索引，由ModulesManager构建，在模块变动前保持不变
+    """
+    __slots__ = ["version", "targetFrom", "modules", "alias_map", "regex_modules", "regex_dispatcher",
+                 "command_parsers"]
+
+    def __init__(self,
+                 version: int,
+                 targetFrom: str,
+                 modules: Dict[str, Union[Command, RegexCommand, Schedule, StartUp]],
+                 alias_map: Dict[str, str],
+                 regex_modules: Dict[str, RegexCommand]):
+        self.version = version
+        self.targetFrom = targetFrom
+        self.modules = modules
+        self.alias_map = alias_map
+        self.regex_modules = regex_modules
+        self.regex_dispatcher = RegexDispatcher(regex_modules)
+        self.command_parsers = {}
+
+    def get_command_parser(self, bind_prefix: str):
+        """
+        返回该模块在此平台下的命令解析器，其中的语法在首次使用时编译并缓存
+        """
+        from core.parser.command import CommandParser  # core.parser.command经由core.utils导入本模块
+        command_parser = self.command_parsers.get(bind_prefix)
+        if command_parser is None:
+            command_parser = CommandParser(self.modules[bind_prefix], targetFrom=self.targetFrom)
+            self.command_parsers[bind_prefix] = command_parser
+        return command_parser
+
+    def __repr__(self):
+        return f'DispatchIndex(version={self.version}, targetFrom={self.targetFrom}, ' \
+               f'modules={len(self.modules)}, alias_map={len(self.alias_map)}, ' \
+               f'regex_modules={len(self.regex_modules)})'
 
 
 class ModulesManager:
     modules: Dict[str, Union[Command, Schedule, RegexCommand, StartUp]] = {}
+    lazy_modules: Dict[str, str] = {}  # 从清单注册、代码尚未导入的模块 -> 所在的包
+    _version = 0
+    _dispatch_index: Dict[str, DispatchIndex] = {}
 
     @staticmethod
-    def add_module(module: Union[Command, Schedule, RegexCommand, StartUp]):
-        if module.bind_prefix not in ModulesManager.modules:
-            ModulesManager.modules.update({module.bind_prefix: module})
+    def add_module(module: Union[Command, Schedule, RegexCommand, StartUp], package: str = None):
+        """
+        :param module: 模块
+        :param package: 不为None时表示模块从清单注册，其代码位于此包中、尚未导入
+        """
+        if module.bind_prefix not in ModulesManager.modules or \
+                (package is None and module.bind_prefix in ModulesManager.lazy_modules):
+            ModulesManager.modules.update({module.bind_prefix: module})  # 包被导入后替换从清单注册的模块
+            if package is not None:
+                ModulesManager.lazy_modules[module.bind_prefix] = package
+            else:
+                ModulesManager.lazy_modules.pop(module.bind_prefix, None)
+            ModulesManager.invalidate_dispatch_index()
         else:
             raise ValueError(f'Duplicate bind prefix "{module.bind_prefix}"')
 
+    @staticmethod
+    def load_package(package: str, bind_prefix: str) -> Union[Command, RegexCommand]:
+        """
+        导入从清单注册的模块所在的包，返回导入后的模块
+        """
+        if bind_prefix in ModulesManager.lazy_modules:
+            start = time.perf_counter()
+            importlib.import_module('modules.' + package)
+            ImportProfiler.record(package, time.perf_counter() - start)
+            Logger.info(f'Loaded modules.{package} on first use in {time.perf_counter() - start:.2f}s.')
+            if bind_prefix in ModulesManager.lazy_modules:
+                raise RuntimeError(f'modules.{package} did not register "{bind_prefix}", '
+                                   f'the module manifest may be outdated.')
+        return ModulesManager.modules[bind_prefix]
+
     @staticmethod
     def bind_to_module(bind_prefix: str, meta):
         if bind_prefix in ModulesManager.modules:
             ModulesManager.modules[bind_prefix].match_list.add(meta)
+            ModulesManager.invalidate_dispatch_index()
+
+    @staticmethod
+    def invalidate_dispatch_index():
+        """
+        模块或其绑定的命令发生变动时调用，使已构建的分发索引失效
+        """
+        ModulesManager._version += 1
+        ModulesManager._dispatch_index.clear()
+
+    @staticmethod
+    def build_dispatch_index(targetFrom: str) -> DispatchIndex:
+        """
+        构建指定平台的分发索引。各进程服务的平台在收到消息前无从得知，索引在首次收到该平台的消息时构建，耗时不到1毫秒
+        """
+        index = DispatchIndex(version=ModulesManager._version,
+                              targetFrom=targetFrom,
+                              modules=ModulesManager.return_modules_list_as_dict(targetFrom),
+                              alias_map=ModulesManager.return_modules_alias_map(),
+                              regex_modules=ModulesManager.return_specified_type_modules(RegexCommand,
+                                                                                          targetFrom=targetFrom))
+        ModulesManager._dispatch_index[targetFrom] = index
+        return index
+
+    @staticmethod
+    def get_dispatch_index(targetFrom: str) -> DispatchIndex:
+        """
+        返回指定平台的分发索引，仅在首次访问或模块变动后重新构建
+        """
+        index = ModulesManager._dispatch_index.get(targetFrom)
+        if index is None or index.version != ModulesManager._version:
+            index = ModulesManager.build_dispatch_index(targetFrom)
+        return index
 
     @staticmethod
     def return_modules_list_as_dict(targetFrom: str = None) ->\
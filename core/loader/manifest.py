@@ -0,0 +1,168 @@
+'''模块清单。
+
+清单按modules下的包记录其中以on_command、on_regex声明的模块的全部信息（别名、帮助信息、可用平台、正则表达式等），
+以包内源文件的修改时间与大小作为签名。签名未变的包可直接从清单注册模块，处理函数在首次被调用时才导入包的代码。
+含有on_schedule或on_startup的包需要在启动时取得函数与触发器，总是直接导入。'''
+import hashlib
+import os
+from typing import Dict, List, Optional, Union
+
+import ujson as json
+
+from core.elements import Command, RegexCommand, Schedule, StartUp
+from core.elements.module.component_meta import CommandMeta, RegexMeta
+from core.logger import Logger
+from core.parser.regex import extract_prefilter
+
+manifest_path = os.path.abspath('./assets/.cache_modules.json')
+manifest_version = 1  # 清单格式变动时递增，旧版本的清单将被丢弃
+
+
+class LazyHandler:
+    """
+    清单中登记的处理函数，首次调用时导入模块所在的包，再转交给包中真正的处理函数
+    :param package: 模块所在的包名
+    :param bind_prefix: 模块名
+    :param index: 处理函数在模块的match_list中的位置
+    """
+    __slots__ = ('package', 'bind_prefix', 'index')
+
+    def __init__(self, package: str, bind_prefix: str, index: int):
+        self.package = package
+        self.bind_prefix = bind_prefix
+        self.index = index
+
+    async def __call__(self, msg):
+        from core.loader import ModulesManager
+        module = ModulesManager.load_package(self.package, self.bind_prefix)
+        return await module.match_list.set[self.index].function(msg)
+
+    def __repr__(self):
+        return f'LazyHandler({self.package}, {self.bind_prefix}, {self.index})'
+
+
+def package_signature(path: str) -> str:
+    digest = hashlib.sha1()
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(x for x in dirs if x != '__pycache__')
+        for file in sorted(files):
+            if file.endswith('.py'):
+                stat = os.stat(os.path.join(root, file))
+                digest.update(f'{os.path.relpath(os.path.join(root, file), path)}:{stat.st_mtime_ns}:'
+                              f'{stat.st_size};'.encode())
+    return digest.hexdigest()
+
+
+def module_package(module: Union[Command, RegexCommand, Schedule, StartUp]) -> Optional[str]:
+    """
+    根据处理函数所在的模块返回模块所属的包。包在导入时可能一并导入其他包，注册的模块不一定属于正在导入的包
+    :return: modules下的包名，无法判断时返回None
+    """
+    if isinstance(module, (Command, RegexCommand)):
+        functions = [meta.function for meta in module.match_list.set]
+    else:
+        functions = [module.function]
+    for function in functions:
+        name = getattr(function, '__module__', None) or ''
+        if name.startswith('modules.'):
+            return name.split('.')[1]
+    return None
+
+
+def dump_module(module: Union[Command, RegexCommand]) -> dict:
+    entry = {'type': 'regex' if isinstance(module, RegexCommand) else 'command',
+             'bind_prefix': module.bind_prefix,
+             'alias': module.alias,
+             'desc': module.desc,
+             'recommend_modules': module.recommend_modules,
+             'developers': module.developers,
+             'required_admin': module.required_admin,
+             'base': module.base,
+             'required_superuser': module.required_superuser,
+             'available_for': module.available_for,
+             'exclude_from': module.exclude_from,
+             'rate_limit': module.rate_limit}
+    if isinstance(module, RegexCommand):
+        entry['metas'] = [{'pattern': meta.pattern,
+                           'mode': meta.mode,
+                           'flags': int(meta.flags),
+                           'show_typing': meta.show_typing} for meta in module.match_list.set]
+    else:
+        entry['metas'] = [{'help_doc': meta.help_doc,
+                           'options_desc': meta.options_desc,
+                           'required_admin': meta.required_admin,
+                           'required_superuser': meta.required_superuser,
+                           'available_for': meta.available_for,
+                           'exclude_from': meta.exclude_from,
+                           'rate_limit': meta.rate_limit} for meta in module.match_list.set]
+    return entry
+
+
+def build_module(package: str, entry: dict) -> Union[Command, RegexCommand]:
+    """
+    根据清单创建模块，其中的处理函数均为LazyHandler
+    """
+    bind_prefix = entry['bind_prefix']
+    cls = RegexCommand if entry['type'] == 'regex' else Command
+    module = cls(bind_prefix=bind_prefix,
+                 alias=entry['alias'],
+                 desc=entry['desc'],
+                 recommend_modules=entry['recommend_modules'],
+                 developers=entry['developers'],
+                 required_admin=entry['required_admin'],
+                 base=entry['base'],
+                 required_superuser=entry['required_superuser'],
+                 available_for=entry['available_for'],
+                 exclude_from=entry['exclude_from'],
+                 rate_limit=tuple(entry['rate_limit']) if entry['rate_limit'] else None)
+    for i, meta in enumerate(entry['metas']):
+        function = LazyHandler(package, bind_prefix, i)
+        if cls is RegexCommand:
+            module.match_list.add(RegexMeta(function=function,
+                                            pattern=meta['pattern'],
+                                            mode=meta['mode'],
+                                            flags=meta['flags'],
+                                            show_typing=meta['show_typing'],
+                                            prefilter=extract_prefilter(meta['pattern'], meta['flags'])))
+        else:
+            module.match_list.add(CommandMeta(function=function, **meta))
+    return module
+
+
+def dump_package(signature: str, modules: List[Union[Command, RegexCommand, Schedule, StartUp]]) -> dict:
+    """
+    :param signature: 包的签名
+    :param modules: 导入包时注册的模块
+    """
+    eager = any(isinstance(m, (Schedule, StartUp)) for m in modules)
+    return {'signature': signature,
+            'eager': eager,
+            'modules': [] if eager else [dump_module(m) for m in modules]}
+
+
+def load_manifest() -> Dict[str, dict]:
+    """
+    :return: 包名 -> 包的清单，清单不存在或版本不符时返回空字典
+    """
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except Exception:
+        Logger.warn('Failed to read the module manifest, all modules will be imported.')
+        return {}
+    if not isinstance(manifest, dict) or manifest.get('version') != manifest_version:
+        Logger.info('The module manifest is outdated, all modules will be imported.')
+        return {}
+    return manifest['packages']
+
+
+def save_manifest(manifest: Dict[str, dict]):
+    tmp_path = f'{manifest_path}.{os.getpid()}.tmp'  # 各平台的进程可能同时写入
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': manifest_version, 'packages': manifest}, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+
+__all__ = ['LazyHandler', 'package_signature', 'module_package', 'dump_package', 'build_module', 'load_manifest', 'save_manifest']
@@ -0,0 +1,186 @@
+'''消息处理各阶段的耗时统计。
+
+parser()与各平台的sendMessage会将每个阶段的耗时记录到按阶段、模块与平台区分的直方图中，
+可通过~stats命令查看，或在配置了metrics_port时以Prometheus文本格式从本地端口读取。'''
+import bisect
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, List, Tuple
+
+from aiohttp import web
+
+from config import Config
+from core.logger import Logger
+
+# 直方图的桶上界（秒），读取缓存、正则匹配等阶段通常不足1毫秒，因此包含亚毫秒级的桶
+BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+           0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGES = {'context': '读取数据库信息',
+          'resolve': '别名与正则匹配',
+          'parse': '命令语法解析',
+          'execute': '模块执行',
+          'send': '发送消息'}
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # 最后一个桶对应+Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """
+        根据桶内计数线性插值估算分位数
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, c in enumerate(self.counts):
+            if cumulative + c >= rank and c:
+                lower = BUCKETS[i - 1] if i > 0 else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else self.max
+                return min(lower + (upper - lower) * (rank - cumulative) / c, self.max)
+            cumulative += c
+        return self.max
+
+
+class Metrics:
+    _histograms: Dict[Tuple[str, str, str], Histogram] = {}
+    _collectors: List[Tuple[Callable[[], List[str]], Callable[[], None]]] = []
+    started_at = time.time()
+
+    @staticmethod
+    def observe(stage: str, seconds: float, module: str = '', platform: str = ''):
+        key = (stage, module, platform)
+        histogram = Metrics._histograms.get(key)
+        if histogram is None:
+            histogram = Metrics._histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+    @staticmethod
+    @contextmanager
+    def timer(stage: str, module: str = '', platform: str = ''):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            Metrics.observe(stage, time.perf_counter() - start, module, platform)
+
+    @staticmethod
+    def get() -> Dict[Tuple[str, str, str], Histogram]:
+        return Metrics._histograms
+
+    @staticmethod
+    def register_collector(render: Callable[[], List[str]], reset: Callable[[], None] = None):
+        """
+        注册其他模块维护的指标
+        :param render: 返回Prometheus文本格式的若干行
+        :param reset: 清空统计时调用
+        """
+        Metrics._collectors.append((render, reset))
+
+    @staticmethod
+    def reset():
+        Metrics._histograms.clear()
+        for _, reset in Metrics._collectors:
+            if reset is not None:
+                reset()
+        Metrics.started_at = time.time()
+
+    @staticmethod
+    def summary(stage: str = None) -> List[Tuple[str, str, str, int, float, float, float]]:
+        """
+        返回各直方图的(阶段, 模块, 平台, 次数, 平均值, p50, p99)，按p99从高到低排列
+        """
+        rows = []
+        for (stage_, module, platform), h in Metrics._histograms.items():
+            if stage is not None and stage_ != stage:
+                continue
+            rows.append((stage_, module, platform, h.count, h.sum / h.count if h.count else 0,
+                         h.quantile(0.5), h.quantile(0.99)))
+        rows.sort(key=lambda x: x[6], reverse=True)
+        return rows
+
+    @staticmethod
+    def render_prometheus() -> str:
+        lines = ['# HELP akaribot_stage_seconds Time spent in each stage of the message pipeline.',
+                 '# TYPE akaribot_stage_seconds histogram']
+        for (stage, module, platform), h in sorted(Metrics._histograms.items()):
+            labels = f'stage="{stage}",module="{_escape(module)}",platform="{_escape(platform)}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS, h.counts):
+                cumulative += count
+                lines.append(f'akaribot_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'akaribot_stage_seconds_bucket{{{labels},le="+Inf"}} {h.count}')
+            lines.append(f'akaribot_stage_seconds_sum{{{labels}}} {h.sum}')
+            lines.append(f'akaribot_stage_seconds_count{{{labels}}} {h.count}')
+        for render, _ in Metrics._collectors:
+            lines += render()
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def timed(stage: str):
+    """
+    装饰MessageSession的协程方法，按平台记录其耗时
+    """
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(self, *args, **kwargs)
+            finally:
+                Metrics.observe(stage, time.perf_counter() - start, platform=self.target.targetFrom)
+
+        return wrapper
+
+    return decorator
+
+
+async def _handle_metrics(request):
+    return web.Response(text=Metrics.render_prometheus(), content_type='text/plain', charset='utf-8')
+
+
+async def start_metrics_server(attempts: int = 16):
+    """
+    在配置的metrics_port上提供/metrics。每个平台各自运行在一个进程中，端口被占用时依次尝试后续端口
+    """
+    port = Config('metrics_port')
+    if not port:
+        return None
+    app = web.Application()
+    app.router.add_get('/metrics', _handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    for offset in range(attempts):
+        site = web.TCPSite(runner, '127.0.0.1', int(port) + offset)
+        try:
+            await site.start()
+        except OSError:
+            continue
+        Logger.info(f'Metrics are served at http://127.0.0.1:{int(port) + offset}/metrics')
+        return runner
+    Logger.warn(f'Failed to start the metrics server: ports {port}-{int(port) + attempts - 1} are in use.')
+    await runner.cleanup()
+    return None
+
+
+__all__ = ['Metrics', 'Histogram', 'timed', 'start_metrics_server', 'STAGES', 'BUCKETS']
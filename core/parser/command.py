@@ -5,14 +5,14 @@ from typing import Union
 
 from core.elements import Command, Schedule, StartUp, RegexCommand, command_prefix, MessageSession
 from core.exceptions import InvalidCommandFormatError, InvalidHelpDocTypeError
-from core.utils.docopt import docopt, DocoptExit
+from core.utils.docopt import DocoptExit, DocoptGrammar
 
 command_prefix_first = command_prefix[0]
 
 
 class CommandParser:
     def __init__(self, args: Union[str, list, tuple, Command, Schedule, StartUp, RegexCommand], prefix=None,
-                 msg: MessageSession = None):
+                 msg: MessageSession = None, targetFrom: str = None):
         """
         Format: https://github.com/jazzband/docopt-ng#usage-pattern-format
         * {} - Detail help information
@@ -20,12 +20,15 @@ class CommandParser:
         self.bind_prefix = prefix
         self.origin_template = args
         self.msg: Union[MessageSession, None] = msg
+        self.targetFrom = msg.target.targetFrom if msg is not None else targetFrom
         self.options_desc = []
+        self._grammar = None
+        self._sub_grammars = None
         if isinstance(args, Command):
             self.bind_prefix = args.bind_prefix
             help_doc_list = []
             none_doc = True
-            for match in (args.match_list.set if self.msg is None else args.match_list.get(self.msg.target.targetFrom)):
+            for match in self.match_list:
                 if match.help_doc is not None:
                     none_doc = False
                     help_doc_list = help_doc_list + match.help_doc
@@ -84,6 +87,38 @@ class CommandParser:
             args += '\n参数：\n' + '\n'.join(self.options_desc)
         return args
 
+    @property
+    def match_list(self):
+        if not isinstance(self.origin_template, Command):
+            return []
+        if self.targetFrom is None:
+            return self.origin_template.match_list.set
+        return self.origin_template.match_list.get(self.targetFrom)
+
+    @property
+    def grammar(self) -> DocoptGrammar:
+        if self._grammar is None:
+            self._grammar = DocoptGrammar(self.args)
+        return self._grammar
+
+    @property
+    def sub_grammars(self):
+        """
+        每个子命令的语法及其可能的首个字面量，首个位置参数不是字面量时为None
+        """
+        if self._sub_grammars is None:
+            sub_grammars = []
+            for match in self.match_list:
+                if match.help_doc is None:
+                    continue
+                sub_args = CommandParser(match.help_doc, prefix=self.bind_prefix).args
+                if sub_args is None:
+                    continue
+                grammar = DocoptGrammar(sub_args)
+                sub_grammars.append((match, grammar, grammar.leading_commands()))
+            self._sub_grammars = sub_grammars
+        return self._sub_grammars
+
     def parse(self, command):
         if self.args is None:
             return None
@@ -96,27 +131,25 @@ class CommandParser:
             if not isinstance(self.origin_template, Command):
                 if len(split_command) == 1:
                     return None
-                return docopt(self.args, argvs=split_command[1:], default_help=False)
+                return self.grammar.match(split_command[1:])
             else:
                 if len(split_command) == 1:
-                    for match in (self.origin_template.match_list.set if self.msg is None else
-                    self.origin_template.match_list.get(self.msg.target.targetFrom)):
+                    for match in self.match_list:
                         if match.help_doc is None:
                             return match, None
                     raise InvalidCommandFormatError
                 else:
-                    base_match = docopt(self.args, argvs=split_command[1:], default_help=False)
-                    for match in (self.origin_template.match_list.set if self.msg is None else
-                    self.origin_template.match_list.get(self.msg.target.targetFrom)):
-                        if match.help_doc is None:
-                            continue
-                        try:
-                            sub_args = CommandParser(match.help_doc, prefix=self.bind_prefix).args
-                            if sub_args is not None:
-                                get_parse = docopt(sub_args,
-                                                   argvs=split_command[1:], default_help=False)
-                            else:
+                    argvs = split_command[1:]
+                    base_match = self.grammar.match(argvs)
+                    first_argument = self.grammar.first_argument(argvs)
+                    for match, sub_grammar, leading_commands in self.sub_grammars:
+                        if leading_commands is not None:  # 首个位置参数为字面量，不符合时无需尝试
+                            if first_argument is None and leading_commands:
                                 continue
+                            if first_argument is not None and first_argument not in leading_commands:
+                                continue
+                        try:
+                            get_parse = sub_grammar.match(argvs)
                         except DocoptExit:
                             continue
                         correct = True
@@ -1,61 +1,83 @@
-import re
+import asyncio
+import copy
+import time
 import traceback
-from datetime import datetime
+from typing import Dict, List, Union
 
 from aiocqhttp.exceptions import ActionFailed
 
 from config import Config
 from core.builtins.message import MessageSession
-from core.elements import Command, command_prefix, ExecutionLockList, RegexCommand, ErrorMessage
+from core.elements import Command, RegexCommand, command_prefix, ExecutionLockList, ErrorMessage
+from core.elements.module.component_meta import CommandMeta
+from core.elements.temp import LRUCache
 from core.exceptions import AbuseWarning, FinishedException, InvalidCommandFormatError, InvalidHelpDocTypeError, \
     WaitCancelException
 from core.loader import ModulesManager
 from core.logger import Logger
-from core.parser.command import CommandParser
+from core.metrics import Metrics
 from core.tos import warn_target
-from core.utils import removeIneffectiveText, removeDuplicateSpace
+from core.utils import removeIneffectiveText, removeDuplicateSpace, RateLimiter
 from database import BotDBUtil
 
 
 enable_tos = Config('enable_tos')
 enable_analytics = Config('enable_analytics')
+command_concurrency = int(Config('command_concurrency') or 3)  # 并行命令同时执行的数量上限
 
-counter_same = {}  # 命令使用次数计数（重复使用单一命令）
-counter_all = {}  # 命令使用次数计数（使用所有命令）
+same_command_limiter = RateLimiter(10, 300)  # 命令使用频率（重复使用单一命令）
+all_command_limiter = RateLimiter(20, 300)  # 命令使用频率（使用所有命令）
+target_limiter = RateLimiter.from_config('rate_limit_target')  # 单个对象的命令使用频率，未配置时不限制
+global_limiter = RateLimiter.from_config('rate_limit_global')  # 机器人整体的命令使用频率，未配置时不限制
+module_limiters = {}  # 各模块自行设置的频率限制
 
-temp_ban_counter = {}  # 临时封禁计数
+temp_ban_counter = LRUCache(maxsize=10000, ttl=300)  # 临时封禁计数
 
 
 async def remove_temp_ban(msg: MessageSession):
-    is_temp_banned = temp_ban_counter.get(msg.target.senderId)
-    if is_temp_banned is not None:
-        del temp_ban_counter[msg.target.senderId]
+    temp_ban_counter.delete(msg.target.senderId)
 
 
 async def msg_counter(msg: MessageSession, command: str):
-    same = counter_same.get(msg.target.senderId)
-    if same is None or datetime.now().timestamp() - same['ts'] > 300 or same[
-        'command'] != command:  # 检查是否滥用（重复使用同一命令）
-        counter_same[msg.target.senderId] = {'command': command, 'count': 1,
-                                             'ts': datetime.now().timestamp()}
-    else:
-        same['count'] += 1
-        if same['count'] > 10:
-            raise AbuseWarning('一段时间内使用相同命令的次数过多')
-    all_ = counter_all.get(msg.target.senderId)
-    if all_ is None or datetime.now().timestamp() - all_['ts'] > 300:  # 检查是否滥用（重复使用同一命令）
-        counter_all[msg.target.senderId] = {'count': 1,
-                                            'ts': datetime.now().timestamp()}
-    else:
-        all_['count'] += 1
-        if all_['count'] > 20:
-            raise AbuseWarning('一段时间内使用命令的次数过多')
+    now = time.monotonic()
+    if same_command_limiter.hit((msg.target.senderId, command), now):  # 检查是否滥用（重复使用同一命令）
+        raise AbuseWarning('一段时间内使用相同命令的次数过多')
+    if all_command_limiter.hit(msg.target.senderId, now):  # 检查是否滥用（使用所有命令）
+        raise AbuseWarning('一段时间内使用命令的次数过多')
+
+
+def rate_limit_check(msg: MessageSession, module: Union[Command, RegexCommand],
+                     submodule: CommandMeta = None) -> float:
+    """
+    检查模块、对象与全局的频率限制，全部未超出时才消耗令牌
+    :param submodule: 解析得到的子命令，设置了rate_limit时代替模块的频率限制，同一模块中限制相同的子命令共用一个限制
+    :return: 需要等待的秒数，未超出限制时返回0
+    """
+    if msg.target.senderInfo.query.isSuperUser:
+        return 0
+    now = time.monotonic()
+    checks = []
+    rate_limit = submodule.rate_limit if submodule is not None and submodule.rate_limit else module.rate_limit
+    if rate_limit is not None:
+        limiter = module_limiters.get((module.bind_prefix, rate_limit))
+        if limiter is None:
+            limiter = module_limiters[(module.bind_prefix, rate_limit)] = RateLimiter(*rate_limit)
+        checks.append((limiter, msg.target.senderId))
+    if target_limiter is not None:
+        checks.append((target_limiter, msg.target.targetId))
+    if global_limiter is not None:
+        checks.append((global_limiter, None))
+    wait = max((limiter.wait_time(key, now) for limiter, key in checks), default=0)
+    if wait == 0:
+        for limiter, key in checks:
+            limiter.hit(key, now)
+    return wait
 
 
 async def temp_ban_check(msg: MessageSession):
     is_temp_banned = temp_ban_counter.get(msg.target.senderId)
     if is_temp_banned is not None:
-        ban_time = datetime.now().timestamp() - is_temp_banned['ts']
+        ban_time = time.time() - is_temp_banned['ts']
         if ban_time < 300:
             if is_temp_banned['count'] < 2:
                 is_temp_banned['count'] += 1
@@ -70,6 +92,30 @@ async def temp_ban_check(msg: MessageSession):
                 raise AbuseWarning('无视临时封禁警告')
 
 
+def split_batches(command_list: List[str], modules: Dict[str, Union[Command, RegexCommand]],
+                  modules_aliases: Dict[str, str]) -> List[List[str]]:
+    """
+    将并行命令按顺序分组，同一组内的命令可以同时执行。
+    基础模块（如module、mute）的命令可能改变后续命令的执行条件，因此单独成组，并与前后的命令保持先后顺序
+    """
+    batches = []
+    concurrent = False
+    for command in command_list:
+        command_spilt = command.split(' ')
+        first_word = command_spilt[0].lower()
+        if first_word == 'sudo' and len(command_spilt) > 1:
+            first_word = command_spilt[1].lower()
+        first_word = modules_aliases.get(first_word, first_word).split(' ')[0]
+        module = modules.get(first_word)
+        independent = module is None or not module.base
+        if independent and concurrent:
+            batches[-1].append(command)
+        else:
+            batches.append([command])
+        concurrent = independent
+    return batches
+
+
 async def parser(msg: MessageSession, require_enable_modules: bool = True, prefix: list = None,
                  running_mention: bool = False):
     """
@@ -81,15 +127,19 @@ async def parser(msg: MessageSession, require_enable_modules: bool = True, prefi
     :return: 无返回
     """
     try:
-        modules = ModulesManager.return_modules_list_as_dict(msg.target.targetFrom)
-        modulesAliases = ModulesManager.return_modules_alias_map()
-        modulesRegex = ModulesManager.return_specified_type_modules(RegexCommand, targetFrom=msg.target.targetFrom)
+        dispatch_index = ModulesManager.get_dispatch_index(msg.target.targetFrom)
+        modules = dispatch_index.modules
+        modulesAliases = dispatch_index.alias_map
+        regexDispatcher = dispatch_index.regex_dispatcher
         display = removeDuplicateSpace(msg.asDisplay())  # 将消息转换为一般显示形式
         identify_str = f'[{msg.target.senderId}{f" ({msg.target.targetId})" if msg.target.targetFrom != msg.target.senderFrom else ""}]'
         # Logger.info(f'{identify_str} -> [Bot]: {display}')
         msg.trigger_msg = display
-        msg.target.senderInfo = senderInfo = BotDBUtil.SenderInfo(msg.target.senderId)
-        enabled_modules_list = BotDBUtil.Module(msg).check_target_enabled_module_list()
+        platform = msg.target.targetFrom
+        with Metrics.timer('context', platform=platform):
+            msg.context = context = BotDBUtil.RequestContext(msg)  # 一次性取得本条消息所需的数据库信息
+        msg.target.senderInfo = senderInfo = context.sender_info
+        enabled_modules_list = context.enabled_modules
         if len(display) == 0:
             return
         disable_prefix = False
@@ -112,11 +162,10 @@ async def parser(msg: MessageSession, require_enable_modules: bool = True, prefi
             command_list = removeIneffectiveText(command_prefix, command.split('&&'))  # 并行命令处理
             if len(command_list) > 5 and not senderInfo.query.isSuperUser:
                 return await msg.sendMessage('你不是本机器人的超级管理员，最多只能并排执行5个命令。')
-            if not ExecutionLockList.check(msg):
-                ExecutionLockList.add(msg)
-            else:
-                return await msg.sendMessage('您有命令正在执行，请稍后再试。')
-            for command in command_list:
+            if not await ExecutionLockList.acquire(msg):
+                return await msg.sendMessage('您有过多命令正在排队执行，请稍后再试。')
+
+            async def execute(msg: MessageSession, command: str):
                 command_spilt = command.split(' ')  # 切割消息
                 msg.trigger_msg = command  # 触发该命令的消息，去除消息前缀
                 command_first_word = command_spilt[0].lower()
@@ -132,10 +181,9 @@ async def parser(msg: MessageSession, require_enable_modules: bool = True, prefi
                     command_first_word = command_spilt[0].lower()
                     msg.trigger_msg = ' '.join(command_spilt)
                 if senderInfo.query.isInBlockList and not senderInfo.query.isInAllowList and not sudo:  # 如果是以 sudo 执行的命令，则不检查是否已 ban
-                    return ExecutionLockList.remove(msg)
-                in_mute = BotDBUtil.Muting(msg).check()
-                if in_mute and not mute:
-                    return ExecutionLockList.remove(msg)
+                    return
+                if context.is_muted and not mute:  # mute命令会更新context，同一条消息中其后的命令读取到的是最新状态
+                    return
                 if command_first_word in modulesAliases:
                     command_spilt[0] = modulesAliases[command_first_word]
                     command = ' '.join(command_spilt)
@@ -153,127 +201,158 @@ async def parser(msg: MessageSession, require_enable_modules: bool = True, prefi
                                 if command_first_word not in enabled_modules_list:
                                     desc += f'\n{command_first_word}模块未启用，请发送~enable {command_first_word}启用本模块。'
                                 await msg.sendMessage(desc)
-                            continue
+                            return
                         if module.required_superuser:
                             if not msg.checkSuperUser():
                                 await msg.sendMessage('你没有使用该命令的权限。')
-                                continue
+                                return
                         elif not module.base:
                             if command_first_word not in enabled_modules_list and not sudo and require_enable_modules:  # 若未开启
                                 await msg.sendMessage(f'{command_first_word}模块未启用，请发送~enable {command_first_word}启用本模块。')
-                                continue
+                                return
                         elif module.required_admin:
                             if not await msg.checkPermission():
                                 await msg.sendMessage(f'{command_first_word}命令仅能被该群组的管理员所使用，请联系管理员执行此命令。')
-                                continue
+                                return
                         if not module.match_list.set:
                             await msg.sendMessage(ErrorMessage(f'{command_first_word}未绑定任何命令，请联系开发者处理。'))
-                            continue
+                            return
                         none_doc = True
                         for func in module.match_list.get(msg.target.targetFrom):
                             if func.help_doc is not None:
                                 none_doc = False
                         if not none_doc:
                             try:
-                                command_parser = CommandParser(module, msg=msg)
+                                command_parser = dispatch_index.get_command_parser(command_first_word)
                                 try:
-                                    parsed_msg = command_parser.parse(msg.trigger_msg)
+                                    with Metrics.timer('parse', command_first_word, platform):
+                                        parsed_msg = command_parser.parse(msg.trigger_msg)
                                     submodule = parsed_msg[0]
                                     msg.parsed_msg = parsed_msg[1]
                                     if submodule.required_superuser:
                                         if not msg.checkSuperUser():
                                             await msg.sendMessage('你没有使用该命令的权限。')
-                                            continue
+                                            return
                                     elif submodule.required_admin:
                                         if not await msg.checkPermission():
                                             await msg.sendMessage(
                                                 f'此命令仅能被该群组的管理员所使用，请联系管理员执行此命令。')
-                                            continue
-                                    if not senderInfo.query.disable_typing:
-                                        async with msg.Typing(msg):
-                                            await parsed_msg[0].function(msg)  # 将msg传入下游模块
-                                    else:
-                                        await parsed_msg[0].function(msg)
+                                            return
+                                    wait = rate_limit_check(msg, module, submodule)
+                                    if wait:
+                                        await msg.sendMessage(f'使用命令过于频繁，请{int(wait) + 1}秒后再试。')
+                                        return
+                                    with Metrics.timer('execute', command_first_word, platform):
+                                        if not senderInfo.query.disable_typing:
+                                            async with msg.Typing(msg):
+                                                await parsed_msg[0].function(msg)  # 将msg传入下游模块
+                                        else:
+                                            await parsed_msg[0].function(msg)
                                     raise FinishedException(msg.sent)  # if not using msg.finish
                                 except InvalidCommandFormatError:
                                     await msg.sendMessage('语法错误。\n' + command_parser.return_formatted_help_doc())
-                                    continue
+                                    return
                             except InvalidHelpDocTypeError:
                                 Logger.error(traceback.format_exc())
                                 await msg.sendMessage(ErrorMessage(f'{command_first_word}模块的帮助信息有误，请联系开发者处理。'))
-                                continue
+                                return
                         else:
                             msg.parsed_msg = None
+                            wait = rate_limit_check(msg, module)
+                            if wait:
+                                await msg.sendMessage(f'使用命令过于频繁，请{int(wait) + 1}秒后再试。')
+                                return
                             for func in module.match_list.set:
                                 if func.help_doc is None:
-                                    if not senderInfo.query.disable_typing:
-                                        async with msg.Typing(msg):
-                                            await func.function(msg)  # 将msg传入下游模块
-                                    else:
-                                        await func.function(msg)
+                                    with Metrics.timer('execute', command_first_word, platform):
+                                        if not senderInfo.query.disable_typing:
+                                            async with msg.Typing(msg):
+                                                await func.function(msg)  # 将msg传入下游模块
+                                        else:
+                                            await func.function(msg)
                                     raise FinishedException(msg.sent)  # if not using msg.finish
                     except ActionFailed:
-                        ExecutionLockList.remove(msg)
                         await msg.sendMessage('消息发送失败，可能被风控，请稍后再试。')
-                        continue
+                        return
                     except FinishedException as e:
                         Logger.info(f'Successfully finished session from {identify_str}, returns: {str(e)}')
                         if msg.target.targetFrom != 'QQ|Guild' or command_first_word != 'module' and enable_tos:
                             await msg_counter(msg, msg.trigger_msg)
-                        ExecutionLockList.remove(msg)
                         if enable_analytics:
                             BotDBUtil.Analytics(msg).add(msg.trigger_msg, command_first_word, 'normal')
-                        continue
+                        return
                     except Exception as e:
                         Logger.error(traceback.format_exc())
-                        ExecutionLockList.remove(msg)
                         await msg.sendMessage(ErrorMessage('执行命令时发生错误，请报告机器人开发者：\n' + str(e)))
+                        return
+
+            try:
+                with Metrics.timer('resolve', platform=platform):
+                    batches = split_batches(command_list, modules, modulesAliases)
+                for batch in batches:
+                    if len(batch) == 1:
+                        await execute(msg, batch[0])
                         continue
-            ExecutionLockList.remove(msg)
+                    semaphore = asyncio.Semaphore(command_concurrency)
+                    wait_lock = asyncio.Lock()  # 同一发送者的等待会相互取消，子命令需要依次等待用户的回复
+                    sub_msgs = []
+                    for _ in batch:
+                        sub_msg = copy.copy(msg)
+                        # 子命令等待回复或休眠时不释放发送者的执行权，整批命令结束后才由msg统一释放
+                        sub_msg.target = copy.copy(msg.target)
+                        sub_msg.sent = []
+                        sub_msg.wait_lock = wait_lock
+                        sub_msgs.append(sub_msg)
+
+                    async def run(sub_msg: MessageSession, command: str):
+                        async with semaphore:
+                            await execute(sub_msg, command)
+
+                    results = await asyncio.gather(*(run(s, c) for s, c in zip(sub_msgs, batch)),
+                                                   return_exceptions=True)
+                    for sub_msg in sub_msgs:
+                        msg.sent.extend(sub_msg.sent)
+                    for result in results:
+                        if isinstance(result, BaseException):
+                            raise result
+            finally:
+                ExecutionLockList.remove(msg)
             return msg
         if not is_command:
             if running_mention:
                 if display.find('小可') != -1:
                     if ExecutionLockList.check(msg):
                         return await msg.sendMessage('您先前的命令正在执行中。')
-            for regex in modulesRegex:  # 遍历正则模块列表
+            # 遍历可能匹配该消息的正则模块
+            resolve_start = time.perf_counter()
+            candidates = regexDispatcher.candidates(display, enabled_modules_list)
+            resolve_time = time.perf_counter() - resolve_start
+            for regex, regex_module, rfuncs in candidates:
                 try:
-                    if regex in enabled_modules_list:
-                        regex_module = modulesRegex[regex]
-                        if regex_module.required_superuser:
-                            if not msg.checkSuperUser():
-                                continue
-                        elif regex_module.required_admin:
-                            if not await msg.checkPermission():
-                                continue
-                        for rfunc in regex_module.match_list.set:
-                            msg.matched_msg = False
-                            matched = False
-                            if rfunc.mode.upper() in ['M', 'MATCH']:
-                                msg.matched_msg = re.match(rfunc.pattern, display, flags=rfunc.flags)
-                                if msg.matched_msg is not None:
-                                    matched = True
-                            elif rfunc.mode.upper() in ['A', 'FINDALL']:
-                                msg.matched_msg = re.findall(rfunc.pattern, display, flags=rfunc.flags)
-                                if msg.matched_msg:
-                                    matched = True
-                            if matched:
-                                if regex_module.required_superuser:
-                                    if not msg.checkSuperUser():
-                                        continue
-                                elif regex_module.required_admin:
-                                    if not await msg.checkPermission():
-                                        continue
-                                if not ExecutionLockList.check(msg):
-                                    ExecutionLockList.add(msg)
-                                else:
-                                    return await msg.sendMessage('您有命令正在执行，请稍后再试。')
+                    if regex_module.required_superuser:
+                        if not msg.checkSuperUser():
+                            continue
+                    elif regex_module.required_admin:
+                        if not await msg.checkPermission():
+                            continue
+                    for rfunc in rfuncs:
+                        resolve_start = time.perf_counter()
+                        msg.matched_msg = regexDispatcher.match(rfunc, display)
+                        resolve_time += time.perf_counter() - resolve_start
+                        if msg.matched_msg is not None:
+                            if not await ExecutionLockList.acquire(msg):
+                                return await msg.sendMessage('您有过多命令正在排队执行，请稍后再试。')
+                            wait = rate_limit_check(msg, regex_module)
+                            if wait:
+                                await msg.sendMessage(f'使用命令过于频繁，请{int(wait) + 1}秒后再试。')
+                                break
+                            with Metrics.timer('execute', regex, platform):
                                 if rfunc.show_typing and not senderInfo.query.disable_typing:
                                     async with msg.Typing(msg):
                                         await rfunc.function(msg)  # 将msg传入下游模块
                                 else:
                                     await rfunc.function(msg)  # 将msg传入下游模块
-                                raise FinishedException(msg.sent)  # if not using msg.finish
+                            raise FinishedException(msg.sent)  # if not using msg.finish
 
                 except ActionFailed:
                     ExecutionLockList.remove(msg)
@@ -290,12 +369,12 @@ async def parser(msg: MessageSession, require_enable_modules: bool = True, prefi
 
                     continue
                 ExecutionLockList.remove(msg)
+            Metrics.observe('resolve', resolve_time, platform=platform)
             return msg
     except AbuseWarning as e:
         if enable_tos:
             await warn_target(msg, str(e))
-            temp_ban_counter[msg.target.senderId] = {'count': 1,
-                                                     'ts': datetime.now().timestamp()}
+            temp_ban_counter.set(msg.target.senderId, {'count': 1, 'ts': time.time()})
             return
     except WaitCancelException:
         Logger.info('Waiting task cancelled by user.')
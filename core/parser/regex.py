@@ -0,0 +1,192 @@
+'''正则模块的分发引擎。
+
+所有通过Bind.Regex.handle注册的表达式在注册时即被预编译，并从中提取出匹配时必定出现的字面量片段（如“[[”、“随个”）。
+收到消息时先对所有片段做一次子串检查，只有可能匹配的表达式才会真正执行。'''
+import re
+from typing import Dict, List, Tuple, Union
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+from core.elements import RegexCommand
+from core.elements.module.component_meta import RegexMeta
+
+_LITERAL = sre_constants.LITERAL
+_SUBPATTERN = sre_constants.SUBPATTERN
+_BRANCH = sre_constants.BRANCH
+_REPEATS = tuple(getattr(sre_constants, x) for x in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT')
+                 if hasattr(sre_constants, x))
+_ATOMIC_GROUP = getattr(sre_constants, 'ATOMIC_GROUP', None)
+
+_MAX_ALTERNATIVES = 8  # 分支展开的上限，超过时放弃该部分的预筛选
+
+# 预筛选条件：若干备选项，每个备选项为一组必须全部出现的字面量；为None时表示无法预筛选
+Prefilter = Union[Tuple[Tuple[str, ...], ...], None]
+
+
+def _caseless(char: str) -> bool:
+    return char.lower() == char.upper()
+
+
+def _merge(alternatives: List[Tuple[str, ...]], requirement: Prefilter) -> List[Tuple[str, ...]]:
+    if requirement is None:
+        return alternatives
+    merged = [alt + req for alt in alternatives for req in requirement]
+    if len(merged) > _MAX_ALTERNATIVES:
+        return alternatives
+    return merged
+
+
+def _sequence_requirement(subpattern, ignorecase: bool) -> Prefilter:
+    alternatives = [()]
+    run = []
+
+    def flush():
+        nonlocal alternatives
+        if run:
+            alternatives = [alt + (''.join(run),) for alt in alternatives]
+            run.clear()
+
+    for op, av in subpattern:
+        if op is _LITERAL:
+            char = chr(av)
+            if not ignorecase or _caseless(char):
+                run.append(char)
+                continue
+            flush()
+        elif op is _SUBPATTERN:
+            flush()
+            group_ignorecase = ignorecase
+            add_flags, del_flags = av[1], av[2]
+            if add_flags & re.I:
+                group_ignorecase = True
+            if del_flags & re.I:
+                group_ignorecase = False
+            alternatives = _merge(alternatives, _sequence_requirement(av[3], group_ignorecase))
+        elif op is _ATOMIC_GROUP:
+            flush()
+            alternatives = _merge(alternatives, _sequence_requirement(av, ignorecase))
+        elif op in _REPEATS:
+            flush()
+            if av[0] >= 1:
+                alternatives = _merge(alternatives, _sequence_requirement(av[2], ignorecase))
+        elif op is _BRANCH:
+            flush()
+            alternatives = _merge(alternatives, _branch_requirement(av[1], ignorecase))
+        else:
+            flush()
+    flush()
+    if any(not alt for alt in alternatives):  # 存在无需任何字面量即可匹配的路径
+        return None
+    return tuple(alternatives)
+
+
+def _branch_requirement(branches, ignorecase: bool) -> Prefilter:
+    alternatives = []
+    for branch in branches:
+        requirement = _sequence_requirement(branch, ignorecase)
+        if requirement is None:  # 任意一个分支无需字面量即可匹配，整个分支就无法预筛选
+            return None
+        alternatives.extend(requirement)
+    if len(alternatives) > _MAX_ALTERNATIVES:
+        return None
+    return tuple(alternatives)
+
+
+def extract_prefilter(pattern: str, flags: Union[re.RegexFlag, int] = 0) -> Prefilter:
+    """
+    提取表达式匹配时必定出现的字面量片段
+    :param pattern: 正则表达式
+    :param flags: 正则表达式的标志
+    :return: 若干备选项，消息需至少满足其中一项（包含该项中的所有片段）才可能被匹配；无法提取时返回None
+    """
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except re.error:
+        return None
+    state = parsed.state if hasattr(parsed, 'state') else parsed.pattern
+    return _sequence_requirement(parsed, bool(state.flags & re.I))
+
+
+def check_prefilter(prefilter: Prefilter, present: Dict[str, bool], text: str) -> bool:
+    if prefilter is None:
+        return True
+    for alternative in prefilter:
+        for fragment in alternative:
+            found = present.get(fragment)
+            if found is None:
+                found = present[fragment] = fragment in text
+            if not found:
+                break
+        else:
+            return True
+    return False
+
+
+class RegexDispatcher:
+    """
+    某一平台下所有正则模块的分发器，随ModulesManager的分发索引一同构建
+    """
+
+    def __init__(self, regex_modules: Dict[str, RegexCommand]):
+        self.entries: List[Tuple[str, RegexCommand, List[RegexMeta]]] = []
+        self._always: List[Tuple[int, int]] = []  # 无法预筛选的表达式，每条消息都需要执行
+        self._by_fragment: Dict[str, List[Tuple[int, int]]] = {}  # 以每个备选项中最长的片段为键建立索引
+        for entry_pos, (bind_prefix, module) in enumerate(regex_modules.items()):
+            rfuncs = list(module.match_list.set)
+            self.entries.append((bind_prefix, module, rfuncs))
+            for rfunc_pos, rfunc in enumerate(rfuncs):
+                if rfunc.prefilter is None:
+                    self._always.append((entry_pos, rfunc_pos))
+                    continue
+                for alternative in rfunc.prefilter:
+                    key = max(alternative, key=len)
+                    self._by_fragment.setdefault(key, []).append((entry_pos, rfunc_pos))
+
+    def candidates(self, text: str, enabled_modules: Union[list, set, frozenset] = None) \
+            -> List[Tuple[str, RegexCommand, List[RegexMeta]]]:
+        """
+        返回可能匹配该消息的正则模块及其表达式，保持模块的注册顺序
+        :param text: 消息的显示文本
+        :param enabled_modules: 已启用的模块列表，为None时不过滤
+        """
+        hits = list(self._always)
+        present = {}
+        for fragment, refs in self._by_fragment.items():
+            present[fragment] = found = fragment in text
+            if found:
+                hits.extend(refs)
+        if not hits:
+            return []
+        results = []
+        last_entry_pos = None
+        for entry_pos, rfunc_pos in sorted(set(hits)):
+            bind_prefix, module, rfuncs = self.entries[entry_pos]
+            if enabled_modules is not None and bind_prefix not in enabled_modules:
+                continue
+            rfunc = rfuncs[rfunc_pos]
+            if not check_prefilter(rfunc.prefilter, present, text):
+                continue
+            if entry_pos != last_entry_pos:
+                results.append((bind_prefix, module, []))
+                last_entry_pos = entry_pos
+            results[-1][2].append(rfunc)
+        return results
+
+    @staticmethod
+    def match(rfunc: RegexMeta, text: str):
+        """
+        使用预编译的表达式匹配消息，未匹配时返回None
+        """
+        if rfunc.mode in ['M', 'MATCH']:
+            return rfunc.compiled.match(text)
+        elif rfunc.mode in ['A', 'FINDALL']:
+            return rfunc.compiled.findall(text) or None
+        return None
+
+
+__all__ = ['RegexDispatcher', 'extract_prefilter', 'check_prefilter']
@@ -0,0 +1,161 @@
+'''模块导入的耗时与内存分析。
+
+以python -X importtime -m core.profiler运行时，依次导入modules下的每个包，记录导入耗时、tracemalloc统计的内存增量、
+进程RSS的增量与新导入的模块数，并在导入每个包前向标准错误输出分隔标记。
+ImportProfiler.run()在子进程中执行上述过程，据标记将-X importtime的输出按包拆分，得到每个包引入的耗时最多的依赖。
+报告保存在assets/.cache_import_profile.json中，保留最近的若干次结果，以便比较不同版本。
+开启tracemalloc后导入会明显变慢，报告中的耗时适合相互比较，而非实际的启动耗时。
+实际的启动耗时由load_modules在启动时通过ImportProfiler.save_startup()写入assets/.cache_import_startup_<平台>.json。'''
+import asyncio
+import importlib
+import os
+import sys
+import time
+import traceback
+from typing import Dict, List, Union
+
+import ujson as json
+
+MARKER = '#akaribot-import-profile:'
+load_dir_path = os.path.abspath('./modules/')
+report_path = os.path.abspath('./assets/.cache_import_profile.json')
+startup_report_path = os.path.abspath('./assets/.cache_import_startup_{}.json')
+
+
+class ImportProfiler:
+    history_size = 20
+    heavy_limit = 5  # 每个包列出的依赖数
+    # 本进程中load_modules与首次使用时导入各个包的耗时（秒）
+    import_times: Dict[str, float] = {}
+
+    @staticmethod
+    def record(package: str, seconds: float):
+        ImportProfiler.import_times[package] = seconds
+
+    @staticmethod
+    def save_startup(seconds: float):
+        """
+        保存本进程启动时的导入记录，各平台的进程分别写入以平台命名的文件
+        :param seconds: load_modules的总耗时
+        """
+        import psutil
+
+        from core.logger import bot_name
+        report = {'time': time.time(),
+                  'total': seconds,
+                  'rss': psutil.Process().memory_info().rss,
+                  'modules': len(sys.modules),
+                  'packages': dict(sorted(ImportProfiler.import_times.items(), key=lambda x: x[1], reverse=True))}
+        path = startup_report_path.format(bot_name or 'Default')
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False)
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def parse_importtime(stderr: str) -> Dict[str, List[List[Union[str, int]]]]:
+        """
+        按分隔标记拆分-X importtime的输出
+        :return: 包名 -> [[依赖的顶层包名, 累计耗时（微秒）], ...]，按耗时从高到低排列
+        """
+        heavy = {}
+        package = None
+        for line in stderr.splitlines():
+            if line.startswith(MARKER):
+                package = line[len(MARKER):].strip()
+                heavy[package] = {}
+                continue
+            if package is None or not line.startswith('import time:'):
+                continue
+            fields = line[len('import time:'):].split('|')
+            if len(fields) != 3 or not fields[1].strip().isdigit():
+                continue  # 表头
+            name = fields[2].strip()
+            if '.' in name or name in ('modules', 'core', 'config', 'database'):
+                continue  # 只统计顶层包，子模块的耗时已计入其中
+            heavy[package][name] = max(heavy[package].get(name, 0), int(fields[1]))
+        return {k: sorted(([n, t] for n, t in v.items()), key=lambda x: x[1], reverse=True)[:ImportProfiler.heavy_limit]
+                for k, v in heavy.items()}
+
+    @staticmethod
+    async def run(version: str = None) -> dict:
+        """
+        在子进程中分析所有包的导入，保存并返回报告
+        """
+        env = os.environ.copy()
+        env['PYTHONPATH'] = os.path.abspath('.')
+        proc = await asyncio.create_subprocess_exec(sys.executable, '-X', 'importtime', '-m', 'core.profiler',
+                                                    cwd=os.path.abspath('.'), env=env,
+                                                    stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        stdout, stderr = await proc.communicate()
+        stdout = stdout.decode('utf-8', 'replace').strip().splitlines()
+        stderr = stderr.decode('utf-8', 'replace')
+        if proc.returncode != 0 or not stdout:
+            output = [line for line in stderr.splitlines()
+                      if not line.startswith('import time:') and not line.startswith(MARKER)]
+            raise RuntimeError(f'The profiling process exited with code {proc.returncode}:\n' + '\n'.join(output[-20:]))
+        packages = json.loads(stdout[-1])
+        heavy = ImportProfiler.parse_importtime(stderr)
+        for p in packages:
+            p['heavy'] = heavy.get(p['name'], [])
+        report = {'version': version, 'time': time.time(), 'packages': packages}
+        history = ImportProfiler.history()
+        history.append(report)
+        tmp_path = report_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(history[-ImportProfiler.history_size:], f, ensure_ascii=False)
+        os.replace(tmp_path, report_path)
+        return report
+
+    @staticmethod
+    def history() -> List[dict]:
+        if not os.path.exists(report_path):
+            return []
+        try:
+            with open(report_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception:
+            return []
+
+
+def main():
+    import tempfile
+    import tracemalloc
+
+    import psutil
+
+    from core.elements import PrivateAssets
+    from core.logger import Logger
+    Logger.log.remove()  # 日志也会输出到标准错误
+    PrivateAssets.set(tempfile.mkdtemp(prefix='akaribot-profile-'))
+    import core.utils  # 先导入核心部分，使其不计入任何一个包
+
+    process = psutil.Process()
+    tracemalloc.start()
+    results = []
+    for name in sorted(os.listdir(load_dir_path)):
+        if not os.path.isdir(os.path.join(load_dir_path, name)) or name[0] == '_':
+            continue
+        print(f'{MARKER}{name}', file=sys.stderr, flush=True)
+        modules = len(sys.modules)
+        rss = process.memory_info().rss
+        memory = tracemalloc.get_traced_memory()[0]
+        error = None
+        start = time.perf_counter()
+        try:
+            importlib.import_module('modules.' + name)
+        except Exception:
+            error = traceback.format_exc().strip().splitlines()[-1]
+        results.append({'name': name,
+                        'time': time.perf_counter() - start,
+                        'memory': tracemalloc.get_traced_memory()[0] - memory,
+                        'rss': process.memory_info().rss - rss,
+                        'modules': len(sys.modules) - modules,
+                        'error': error})
+    sys.stderr.flush()
+    print(json.dumps(results), flush=True)
+
+
+if __name__ == '__main__':
+    main()
+
+__all__ = ['ImportProfiler']
@@ -1,8 +1,14 @@
 from .bot import *
 from .cache import *
+from .circuitbreaker import *
 from .http import *
+from .http_cache import *
 from .image_table import *
 from .message import *
 from .message import *
+from .ratelimit import *
+from .renderer import *
+from .shared_schedule import *
+from .singleflight import *
 from .storedata import *
 from .tasks import *
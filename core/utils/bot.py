@@ -4,13 +4,21 @@ import os
 import traceback
 
 import ujson as json
+from apscheduler.triggers.interval import IntervalTrigger
 
+from config import Config
 from core.elements import PrivateAssets, StartUp, Schedule, Secret
 from core.loader import load_modules, ModulesManager
 from core.scheduler import Scheduler
 from core.exceptions import ConfigFileNotFound
 from core.logger import Logger
+from core.metrics import start_metrics_server
+from core.utils.cache import CacheManager
 from core.utils.http import get_url
+from core.utils.shared_schedule import SharedSchedule
+from database import BotDBUtil
+from database.update import update_database
+from database.async_db import AsyncBotDBUtil
 
 from configparser import ConfigParser
 from os.path import abspath
@@ -21,6 +29,7 @@ bot_version = 'v4.0.0'
 
 def init() -> None:
     """初始化机器人。仅用于bot.py与console.py。"""
+    update_database()  # 直接启动单个平台或console.py时也需要迁移数据库，版本已是最新时不做任何操作
     load_modules()
     version = os.path.abspath(PrivateAssets.path + '/version')
     write_version = open(version, 'w')
@@ -41,13 +50,28 @@ def init() -> None:
 async def init_async(ft) -> None:
     gather_list = []
     Modules = ModulesManager.return_modules_list_as_dict()
+    if SharedSchedule.enabled:
+        SharedSchedule.start(ft)
+        Scheduler.add_job(func=SharedSchedule.relay, trigger=IntervalTrigger(seconds=SharedSchedule.relay_interval),
+                          args=[ft], misfire_grace_time=30, max_instances=1)
     for x in Modules:
         if isinstance(Modules[x], StartUp):
             gather_list.append(asyncio.ensure_future(Modules[x].function(ft)))
         elif isinstance(Modules[x], Schedule):
-            Scheduler.add_job(func=Modules[x].function, trigger=Modules[x].trigger, args=[ft], misfire_grace_time=30, max_instance=1)
+            if SharedSchedule.enabled:
+                Scheduler.add_job(func=SharedSchedule.wrap(Modules[x], ft), trigger=Modules[x].trigger,
+                                  misfire_grace_time=30, max_instances=1)
+            else:
+                Scheduler.add_job(func=Modules[x].function, trigger=Modules[x].trigger, args=[ft], misfire_grace_time=30, max_instances=1)
     await asyncio.gather(*gather_list)
+    if Config('enable_analytics'):
+        Scheduler.add_job(func=AsyncBotDBUtil.Analytics.flush,
+                          trigger=IntervalTrigger(seconds=BotDBUtil.Analytics.flush_interval),
+                          misfire_grace_time=30, max_instances=1)
+    Scheduler.add_job(func=CacheManager.sweep_async, trigger=IntervalTrigger(seconds=CacheManager.sweep_interval),
+                      misfire_grace_time=30, max_instances=1)
     Scheduler.start()
+    await start_metrics_server()
     logging.getLogger('apscheduler.executors.default').setLevel(logging.WARNING)
     await load_secret()
 
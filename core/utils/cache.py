@@ -1,11 +1,143 @@
+import asyncio
+import os
+import re
+import shutil
+import time
 import uuid
 from os.path import abspath
+from typing import Dict, List, Tuple
 
 from config import Config
+from core.logger import Logger
 
 
 def random_cache_path():
     return abspath(f'{Config("cache_path")}/{str(uuid.uuid4())}')
 
 
-__all__ = ['random_cache_path']
+def content_cache_path(digest: str, extension: str):
+    return abspath(f'{Config("cache_path")}/{digest}.{extension}')
+
+
+class CacheManager:
+    """
+    管理缓存目录中的文件：按类别删除超过有效期的文件，总大小超过cache_quota时按最近访问的时间淘汰。
+    清理由init_async中注册的定时任务每隔cache_sweep_interval秒执行一次，也可通过~cache sweep手动执行。
+    """
+    path = abspath(Config('cache_path') or './cache/')
+    quota = int(Config('cache_quota') or 1024 * 1024 * 1024)
+    sweep_interval = int(Config('cache_sweep_interval') or 600)
+    min_age = 60  # 按容量淘汰时跳过刚生成的文件，避免删除正要发送的图片
+    ttls = {category: int(Config(f'cache_ttl_{category}') or default)
+            for category, default in {'render': 3600,  # 生成的图片等
+                                      'download': 86400,  # download_to_cache按内容命名的文件
+                                      'html': 3600,  # 网页截图的源文件
+                                      'workdir': 3600,  # 生成b30等图片时使用的目录
+                                      'tmp': 3600}.items()}
+    last_sweep = None
+
+    @staticmethod
+    def category(name: str, is_dir: bool) -> str:
+        if is_dir:
+            return 'workdir'
+        if name.endswith('.tmp'):
+            return 'tmp'
+        if name.endswith('.html'):
+            return 'html'
+        if re.match(r'^[0-9a-f]{64}\.', name):
+            return 'download'
+        return 'render'
+
+    @staticmethod
+    def _size(path: str) -> int:
+        total = 0
+        for root, _, files in os.walk(path):
+            for f in files:
+                try:
+                    total += os.stat(os.path.join(root, f)).st_size
+                except FileNotFoundError:
+                    pass
+        return total
+
+    @staticmethod
+    def scan() -> List[Tuple[str, str, int, float]]:
+        """
+        :return: 缓存目录中每一项的(路径, 类别, 大小, 最近访问时间)
+        """
+        entries = []
+        try:
+            it = os.scandir(CacheManager.path)
+        except FileNotFoundError:
+            return entries
+        with it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                if is_dir:  # 统计大小时会更新目录的访问时间，只使用修改时间
+                    size, accessed = CacheManager._size(entry.path), stat.st_mtime
+                else:  # 文件系统可能以noatime挂载，同时参考修改时间
+                    size, accessed = stat.st_size, max(stat.st_atime, stat.st_mtime)
+                entries.append((entry.path, CacheManager.category(entry.name, is_dir), size, accessed))
+        return entries
+
+    @staticmethod
+    def _remove(path: str):
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def report() -> Dict[str, dict]:
+        categories = {category: {'count': 0, 'size': 0} for category in CacheManager.ttls}
+        for _, category, size, _ in CacheManager.scan():
+            categories[category]['count'] += 1
+            categories[category]['size'] += size
+        return categories
+
+    @staticmethod
+    def sweep(now: float = None) -> dict:
+        """
+        删除过期的文件，之后若总大小仍超过配额，按最近访问时间从旧到新删除至配额的90%以下
+        """
+        now = now or time.time()
+        expired = evicted = freed = 0
+        remaining = []
+        for path, category, size, accessed in CacheManager.scan():
+            if now - accessed > CacheManager.ttls[category]:
+                CacheManager._remove(path)
+                expired += 1
+                freed += size
+            else:
+                remaining.append((accessed, size, path))
+        total = sum(x[1] for x in remaining)
+        if total > CacheManager.quota:
+            remaining.sort()
+            for accessed, size, path in remaining:
+                if total <= CacheManager.quota * 0.9:
+                    break
+                if now - accessed < CacheManager.min_age:
+                    break
+                CacheManager._remove(path)
+                evicted += 1
+                freed += size
+                total -= size
+        CacheManager.last_sweep = {'time': now, 'expired': expired, 'evicted': evicted, 'freed': freed,
+                                   'size': total}
+        if expired or evicted:
+            Logger.info(f'Cache sweep removed {expired} expired and {evicted} evicted entries '
+                        f'({freed / 1024 / 1024:.1f}MB), {total / 1024 / 1024:.1f}MB left.')
+        return CacheManager.last_sweep
+
+    @staticmethod
+    async def sweep_async() -> dict:
+        return await asyncio.get_running_loop().run_in_executor(None, CacheManager.sweep)
+
+
+__all__ = ['random_cache_path', 'content_cache_path', 'CacheManager']
@@ -0,0 +1,144 @@
+'''外部请求的熔断与重试策略。
+
+每个主机对应一个熔断器：连续失败http_breaker_threshold次后断开，断开期间对该主机的请求立即失败；
+冷却结束后放行一个探测请求（半开），成功则恢复，失败则以指数增长（带随机抖动）的冷却时间再次断开。
+请求的成功与失败由HttpClient的TraceConfig统一记录，连接错误、超时与5xx响应视为失败。'''
+import random
+import time
+from typing import Dict, List
+
+from config import Config, cfg
+from core.exceptions import CircuitOpenError
+from core.logger import Logger
+from core.metrics import Metrics
+from .ratelimit import RateLimiter
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class RetryPolicy:
+    """
+    get_url等函数的重试策略，模块可按需传入
+    :param attempts: 最多尝试的次数（包含第一次）
+    :param wait: 第一次重试前等待时间的上限（秒），之后每次翻倍，实际等待时间在0与上限之间随机选取
+    :param max_wait: 等待时间上限的最大值（秒）
+    :param breaker: 是否在熔断器断开时立即失败
+    """
+
+    def __init__(self, attempts: int = 3, wait: float = 1, max_wait: float = 10, breaker: bool = True):
+        self.attempts = attempts
+        self.wait = wait
+        self.max_wait = max_wait
+        self.breaker = breaker
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_wait, self.wait * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    threshold = int(Config('http_breaker_threshold') or 5)
+    cooldown = float(Config('http_breaker_cooldown') or 30)
+    max_cooldown = float(Config('http_breaker_max_cooldown') or 600)
+    probe_timeout = 60  # 探测请求超过此秒数仍未结束时，允许发起新的探测
+    _breakers: Dict[str, 'CircuitBreaker'] = {}
+
+    def __init__(self, host: str):
+        self.host = host
+        self.state = CLOSED
+        self.failures = 0  # 连续失败次数
+        self.trips = 0  # 连续断开的次数，决定冷却时间
+        self.opened_until = 0.0
+        self.probe_started = None
+        self.rejected = 0
+        self.opened = 0
+
+    @staticmethod
+    def get(host: str) -> 'CircuitBreaker':
+        breaker = CircuitBreaker._breakers.get(host)
+        if breaker is None:
+            breaker = CircuitBreaker._breakers[host] = CircuitBreaker(host)
+        return breaker
+
+    @staticmethod
+    def all() -> Dict[str, 'CircuitBreaker']:
+        return CircuitBreaker._breakers
+
+    def check(self, now: float = None):
+        """
+        请求前调用，熔断器断开时抛出CircuitOpenError
+        """
+        if self.state == CLOSED:
+            return
+        now = now or time.monotonic()
+        if self.state == OPEN and now >= self.opened_until:
+            self.state = HALF_OPEN
+            self.probe_started = None
+        if self.state == HALF_OPEN and (self.probe_started is None or now - self.probe_started > self.probe_timeout):
+            self.probe_started = now
+            return
+        self.rejected += 1
+        raise CircuitOpenError(f'请求{self.host}连续失败，已暂停访问，'
+                               f'请在{max(1, int(self.opened_until - now))}秒后重试。')
+
+    def record_success(self):
+        if self.state != CLOSED:
+            Logger.info(f'Circuit for {self.host} closed.')
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.probe_started = None
+
+    def record_failure(self, now: float = None):
+        now = now or time.monotonic()
+        self.failures += 1
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.threshold):
+            cooldown = min(self.max_cooldown, self.cooldown * 2 ** self.trips) * random.uniform(0.8, 1.2)
+            self.trips += 1
+            self.opened += 1
+            self.state = OPEN
+            self.opened_until = now + cooldown
+            self.probe_started = None
+            Logger.warn(f'Circuit for {self.host} opened for {cooldown:.0f}s after {self.failures} failures.')
+
+    @staticmethod
+    def render_prometheus() -> List[str]:
+        breakers = sorted(CircuitBreaker._breakers.items())
+        lines = ['# HELP akaribot_http_circuit_state State of each host circuit breaker (0 closed, 1 half-open, 2 open).',
+                 '# TYPE akaribot_http_circuit_state gauge']
+        states = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+        for host, b in breakers:
+            lines.append(f'akaribot_http_circuit_state{{host="{host}"}} {states[b.state]}')
+        lines += ['# HELP akaribot_http_circuit_opened_total Times each host circuit breaker opened.',
+                  '# TYPE akaribot_http_circuit_opened_total counter']
+        for host, b in breakers:
+            lines.append(f'akaribot_http_circuit_opened_total{{host="{host}"}} {b.opened}')
+        lines += ['# HELP akaribot_http_circuit_rejected_total Requests failed fast while a circuit was open.',
+                  '# TYPE akaribot_http_circuit_rejected_total counter']
+        for host, b in breakers:
+            lines.append(f'akaribot_http_circuit_rejected_total{{host="{host}"}} {b.rejected}')
+        return lines
+
+    @staticmethod
+    def reset_stats():
+        for b in CircuitBreaker._breakers.values():
+            b.rejected = b.opened = 0
+
+
+@cfg.subscribe
+def _on_config_change(changed: dict):
+    if 'http_breaker_threshold' in changed:
+        CircuitBreaker.threshold = int(changed['http_breaker_threshold'] or 5)
+    if 'http_breaker_cooldown' in changed:
+        CircuitBreaker.cooldown = float(changed['http_breaker_cooldown'] or 30)
+    if 'http_breaker_max_cooldown' in changed:
+        CircuitBreaker.max_cooldown = float(changed['http_breaker_max_cooldown'] or 600)
+
+
+# 每个主机每分钟最多重试的次数，防止大量用户同时重试一个已无响应的主机
+retry_budget = RateLimiter.from_config('http_retry_budget') or RateLimiter(10, 60)
+
+Metrics.register_collector(CircuitBreaker.render_prometheus, CircuitBreaker.reset_stats)
+
+__all__ = ['CircuitBreaker', 'RetryPolicy', 'retry_budget']
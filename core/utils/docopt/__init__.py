@@ -654,6 +654,94 @@ class ParsedOptions(dict):
                                   name in [k.lstrip("-"), k.lstrip("<").rstrip(">")]}.get(name)
 
 
+class DocoptGrammar:
+    """Usage pattern parsed once from `docstring` and reusable across argument vectors.
+
+    Matching an argument vector against a `DocoptGrammar` gives the same result as
+    calling `docopt(docstring, argvs, default_help=False)`, without re-parsing the
+    usage section every time.
+    """
+
+    def __init__(self, docstring: str) -> None:
+        usage_sections = parse_section("usage:", docstring)
+        if len(usage_sections) == 0:
+            raise DocoptLanguageError('"usage:" section (case-insensitive) not found. Perhaps missing indentation?')
+        if len(usage_sections) > 1:
+            raise DocoptLanguageError('More than one "usage:" (case-insensitive).')
+        options_pattern = re.compile(r"\n\s*?options:", re.IGNORECASE)
+        if options_pattern.search(usage_sections[0]):
+            raise DocoptExit(
+                "Warning: options (case-insensitive) was found in usage." "Use a blank line between each section..")
+        self.usage = usage_sections[0]
+        self.options = parse_defaults(docstring)
+        self.pattern = parse_pattern(formal_usage(self.usage), self.options)
+        pattern_options = set(self.pattern.flat(Option))
+        for options_shortcut in self.pattern.flat(OptionsShortcut):
+            doc_options = parse_defaults(docstring)
+            options_shortcut.children = [opt for opt in doc_options if opt not in pattern_options]
+        self.pattern.fix()
+
+    def parse_argv(self, argvs: List[str], options_first: bool = False) -> List[Pattern]:
+        return parse_argv(Tokens(argvs), list(self.options), options_first)
+
+    def first_argument(self, argvs: List[str]) -> Optional[str]:
+        """Return the first positional token of `argvs` as docopt sees it."""
+        try:
+            for p in self.parse_argv(argvs):
+                if type(p) is Argument:
+                    return p.value
+        except DocoptExit:
+            pass
+        return None
+
+    def leading_commands(self) -> Optional[set]:
+        """Return every literal command a matching argument vector can start with.
+
+        `None` means the first positional token is not restricted to literals.
+        """
+        return _leading_commands(self.pattern)
+
+    def match(self, argvs: List[str], options_first: bool = False) -> ParsedOptions:
+        DocoptExit.usage = self.usage
+        parsed_arg_vector = self.parse_argv(argvs, options_first)
+        matched, left, collected = self.pattern.match(parsed_arg_vector)
+        if matched and left == []:
+            return ParsedOptions((a.name, list(a.value) if isinstance(a.value, list) else a.value)
+                                 for a in (self.pattern.flat() + collected))
+        if left:
+            argv_length = len(argvs) - 1
+            if argv_length > 0:
+                argvs1 = argvs[0: argv_length - 1]
+                argvs1.append(' '.join(argvs[-2:]))
+                return self.match(argvs1, options_first)
+            raise DocoptExit(f"Warning: found unmatched (duplicate?) arguments {left}")
+        raise DocoptExit(collected=collected, left=left)
+
+
+def _leading_commands(pattern: Pattern) -> Optional[set]:
+    if type(pattern) is Command:
+        return {pattern.name}
+    if isinstance(pattern, LeafPattern):
+        return None if type(pattern) is Argument else set()
+    if type(pattern) is Either:
+        commands = set()
+        for child in pattern.children:
+            child_commands = _leading_commands(child)
+            if child_commands is None or not child_commands:
+                return None
+            commands |= child_commands
+        return commands
+    if type(pattern) in (Required, OneOrMore):
+        for child in pattern.children:
+            if not child.flat(Argument, Command):
+                continue
+            return _leading_commands(child)
+        return set()
+    if not pattern.flat(Argument, Command):
+        return set()
+    return None
+
+
 def docopt(
     docstring: Optional[str] = None,
     argvs: Optional[Union[List[str], str]] = None,
@@ -1,17 +1,208 @@
+import asyncio
+import hashlib
+import os
+import time
 import traceback
-from typing import Union
+from contextlib import AsyncExitStack
+from typing import Dict, List, Union
 
 import aiohttp
 from aiofile import async_open
 import filetype as ft
-from tenacity import retry, wait_fixed, stop_after_attempt
+from yarl import URL
 
+from config import Config
+from core.exceptions import CircuitOpenError, HttpStatusError
 from core.logger import Logger
-from .cache import random_cache_path
+from core.metrics import Histogram, Metrics, BUCKETS
+from .cache import random_cache_path, content_cache_path
+from .circuitbreaker import CircuitBreaker, RetryPolicy, retry_budget
+from .http_cache import HttpCache
+from .singleflight import single_flight
 
+pool_size = int(Config('http_pool_size') or 100)
+pool_size_per_host = int(Config('http_pool_size_per_host') or 10)
+dns_cache_ttl = int(Config('http_dns_cache_ttl') or 300)
+keepalive_timeout = float(Config('http_keepalive_timeout') or 30)
+download_max_size = int(Config('download_max_size') or 32 * 1024 * 1024)
+download_spool_size = int(Config('download_spool_size') or 1024 * 1024)
 
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(3), reraise=True)
-async def get_url(url: str, status_code: int = False, headers: dict = None, fmt=None, log=False, timeout=20):
+
+class HostStats:
+    __slots__ = ('latency', 'errors', 'new_connections', 'reused_connections', 'retries', 'budget_exhausted')
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+        self.new_connections = 0
+        self.reused_connections = 0
+        self.retries = 0
+        self.budget_exhausted = 0  # 因超出重试预算而放弃的重试
+
+
+class HttpClient:
+    """
+    进程内共享的aiohttp会话。连接池按主机限制并发连接数并保持长连接，DNS解析结果会被缓存，
+    各主机的请求耗时与连接复用情况可通过~stats http或/metrics查看。
+    会话不保存Cookie，与每次请求新建会话时的行为一致。
+    """
+    _session: Union[aiohttp.ClientSession, None] = None
+    _hosts: Dict[str, HostStats] = {}
+
+    @staticmethod
+    def session() -> aiohttp.ClientSession:
+        """
+        获取共享的会话，需在事件循环中调用。会话在首次使用或所在的事件循环已更换时创建
+        """
+        loop = asyncio.get_running_loop()
+        session = HttpClient._session
+        if session is None or session.closed or session._loop is not loop:
+            trace = aiohttp.TraceConfig()
+            trace.on_request_start.append(HttpClient._on_request_start)
+            trace.on_request_end.append(HttpClient._on_request_end)
+            trace.on_request_exception.append(HttpClient._on_request_exception)
+            trace.on_connection_create_end.append(HttpClient._on_connection_create_end)
+            trace.on_connection_reuseconn.append(HttpClient._on_connection_reuseconn)
+            connector = aiohttp.TCPConnector(limit=pool_size, limit_per_host=pool_size_per_host,
+                                             ttl_dns_cache=dns_cache_ttl, keepalive_timeout=keepalive_timeout)
+            session = HttpClient._session = aiohttp.ClientSession(connector=connector, trace_configs=[trace],
+                                                                  cookie_jar=aiohttp.DummyCookieJar())
+        return session
+
+    @staticmethod
+    async def close():
+        if HttpClient._session is not None and not HttpClient._session.closed:
+            await HttpClient._session.close()
+        HttpClient._session = None
+
+    @staticmethod
+    def _host(host: str) -> HostStats:
+        stats = HttpClient._hosts.get(host)
+        if stats is None:
+            stats = HttpClient._hosts[host] = HostStats()
+        return stats
+
+    @staticmethod
+    async def _on_request_start(session, ctx, params):
+        ctx.start = time.perf_counter()
+        ctx.host = params.url.host or ''
+
+    @staticmethod
+    async def _on_request_end(session, ctx, params):
+        HttpClient._host(ctx.host).latency.observe(time.perf_counter() - ctx.start)
+        if params.response.status >= 500:
+            CircuitBreaker.get(ctx.host).record_failure()
+        else:
+            CircuitBreaker.get(ctx.host).record_success()
+
+    @staticmethod
+    async def _on_request_exception(session, ctx, params):
+        stats = HttpClient._host(ctx.host)
+        stats.latency.observe(time.perf_counter() - ctx.start)
+        if isinstance(params.exception, asyncio.CancelledError):
+            return
+        stats.errors += 1
+        CircuitBreaker.get(ctx.host).record_failure()
+
+    @staticmethod
+    async def _on_connection_create_end(session, ctx, params):
+        HttpClient._host(ctx.host).new_connections += 1
+
+    @staticmethod
+    async def _on_connection_reuseconn(session, ctx, params):
+        HttpClient._host(ctx.host).reused_connections += 1
+
+    @staticmethod
+    def stats() -> Dict[str, HostStats]:
+        return HttpClient._hosts
+
+    @staticmethod
+    def reset():
+        HttpClient._hosts.clear()
+
+    @staticmethod
+    def render_prometheus() -> List[str]:
+        lines = ['# HELP akaribot_http_request_seconds Latency of outbound HTTP requests by host.',
+                 '# TYPE akaribot_http_request_seconds histogram']
+        for host, stats in sorted(HttpClient._hosts.items()):
+            h = stats.latency
+            cumulative = 0
+            for bound, count in zip(BUCKETS, h.counts):
+                cumulative += count
+                lines.append(f'akaribot_http_request_seconds_bucket{{host="{host}",le="{bound}"}} {cumulative}')
+            lines.append(f'akaribot_http_request_seconds_bucket{{host="{host}",le="+Inf"}} {h.count}')
+            lines.append(f'akaribot_http_request_seconds_sum{{host="{host}"}} {h.sum}')
+            lines.append(f'akaribot_http_request_seconds_count{{host="{host}"}} {h.count}')
+        lines += ['# HELP akaribot_http_connections_total Connections used by outbound HTTP requests.',
+                  '# TYPE akaribot_http_connections_total counter']
+        for host, stats in sorted(HttpClient._hosts.items()):
+            lines.append(f'akaribot_http_connections_total{{host="{host}",reused="false"}} {stats.new_connections}')
+            lines.append(f'akaribot_http_connections_total{{host="{host}",reused="true"}} {stats.reused_connections}')
+        lines += ['# HELP akaribot_http_errors_total Outbound HTTP requests that failed without a response.',
+                  '# TYPE akaribot_http_errors_total counter']
+        for host, stats in sorted(HttpClient._hosts.items()):
+            lines.append(f'akaribot_http_errors_total{{host="{host}"}} {stats.errors}')
+        lines += ['# HELP akaribot_http_retries_total Retries of outbound HTTP requests.',
+                  '# TYPE akaribot_http_retries_total counter']
+        for host, stats in sorted(HttpClient._hosts.items()):
+            lines.append(f'akaribot_http_retries_total{{host="{host}",budget_exhausted="false"}} {stats.retries}')
+            lines.append(f'akaribot_http_retries_total{{host="{host}",budget_exhausted="true"}} '
+                         f'{stats.budget_exhausted}')
+        return lines
+
+
+Metrics.register_collector(HttpClient.render_prometheus, HttpClient.reset)
+
+
+def _retryable(e: Exception) -> bool:
+    if isinstance(e, HttpStatusError):
+        return e.status >= 500 or e.status == 429
+    if isinstance(e, aiohttp.ContentTypeError):
+        return False
+    return isinstance(e, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+async def request_with_retry(url: str, policy: Union[RetryPolicy, None], fn, *args, **kwargs):
+    """
+    按重试策略执行一次请求。熔断器断开时立即抛出CircuitOpenError；只重试连接错误、超时、5xx与429，
+    每次重试还需消耗该主机的重试预算，预算用尽时不再重试
+    :param url: 请求的url，用于确定主机
+    :param policy: 重试策略，为None时使用默认策略
+    :param fn: 执行请求的协程函数
+    """
+    policy = policy or default_policy
+    host = URL(url).host or ''
+    breaker = CircuitBreaker.get(host)
+    attempt = 0
+    while True:
+        if policy.breaker:
+            breaker.check()
+        attempt += 1
+        try:
+            return await fn(*args, **kwargs)
+        except Exception as e:
+            if attempt >= policy.attempts or not _retryable(e):
+                raise
+            if retry_budget.hit(host):
+                HttpClient._host(host).budget_exhausted += 1
+                raise
+            HttpClient._host(host).retries += 1
+            wait = policy.backoff(attempt)
+            Logger.warn(f'Request to {host} failed ({e.__class__.__name__}), retrying in {wait:.1f}s...')
+            await asyncio.sleep(wait)
+
+
+default_policy = RetryPolicy(attempts=int(Config('http_retry_attempts') or 3))
+
+
+def _get_url_key(url: str, status_code: int = False, headers: dict = None, fmt=None, log=False, timeout=20,
+                 cache_ttl: float = None, revalidate: bool = True, policy: RetryPolicy = None):
+    return url, status_code, tuple(sorted(headers.items())) if headers else None, fmt, cache_ttl, revalidate
+
+
+@single_flight('get_url', key=_get_url_key)
+async def get_url(url: str, status_code: int = False, headers: dict = None, fmt=None, log=False, timeout=20,
+                  cache_ttl: float = None, revalidate: bool = True, policy: RetryPolicy = None):
     """利用AioHttp获取指定url的内容。
 
     :param url: 需要获取的url。
@@ -20,54 +211,153 @@ async def get_url(url: str, status_code: int = False, headers: dict = None, fmt=
     :param fmt: 指定返回的格式。
     :param log: 是否输出日志。
     :param timeout: 超时时间。
+    :param cache_ttl: 不为None时缓存响应，在此秒数内重复请求直接使用缓存。仅支持fmt为text、json、read或None。
+    :param revalidate: 缓存过期后是否携带ETag/Last-Modified发送条件请求，服务器返回304时继续使用缓存。
+    :param policy: 重试策略，默认最多尝试3次。
     :returns: 指定url的内容（字符串）。
     """
-    async with aiohttp.ClientSession(headers=headers) as session:
-        async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout), headers=headers) as req:
+    cache_key = cache_entry = None
+    request_headers = headers
+    if cache_ttl is not None and fmt in HttpCache.formats:
+        cache_key = HttpCache.key(url, headers)
+        cache_entry = HttpCache.lookup(cache_key)
+        if cache_entry is not None and HttpCache.is_fresh(cache_entry, cache_ttl):
+            try:
+                return await HttpCache.load(cache_key, cache_entry, fmt)
+            except FileNotFoundError:
+                cache_entry = None
+        if cache_entry is not None and revalidate:
+            request_headers = {**(headers or {}), **HttpCache.conditional_headers(cache_entry)}
+
+    async def request():
+        nonlocal cache_entry, request_headers
+        async with HttpClient.session().get(url, timeout=aiohttp.ClientTimeout(total=timeout),
+                                            headers=request_headers) as req:
             if log:
                 Logger.info(await req.read())
-            if status_code and req.status != status_code:
-                raise ValueError(f'{str(req.status)}[Ke:Image,path=https://http.cat/{str(req.status)}.jpg]')
-            if fmt is not None:
-                if hasattr(req, fmt):
-                    return await getattr(req, fmt)()
-                else:
-                    raise ValueError(f"NoSuchMethod: {fmt}")
+            if cache_entry is not None and req.status == 304:
+                try:
+                    return await HttpCache.load(cache_key, cache_entry, fmt, revalidated=True)
+                except FileNotFoundError:
+                    pass
             else:
-                text = await req.text()
-                return text
+                if status_code and req.status != status_code:
+                    raise HttpStatusError(req.status,
+                                          f'{str(req.status)}[Ke:Image,path=https://http.cat/{str(req.status)}.jpg]')
+                if cache_key is not None and req.status == 200:
+                    body = await req.read()
+                    await HttpCache.store(cache_key, url, body, req)
+                    return HttpCache.decode(body, req.get_encoding(), fmt)
+                if fmt is not None:
+                    if hasattr(req, fmt):
+                        return await getattr(req, fmt)()
+                    else:
+                        raise ValueError(f"NoSuchMethod: {fmt}")
+                else:
+                    text = await req.text()
+                    return text
+        # 收到304时缓存的正文已被删除（如其他进程或CacheManager清理了缓存），不带条件请求头重新请求
+        cache_entry, request_headers = None, headers
+        return await request()
+
+    return await request_with_retry(url, policy, request)
 
 
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(3), reraise=True)
-async def post_url(url: str, data: any, headers: dict = None):
+async def post_url(url: str, data: any, headers: dict = None, policy: RetryPolicy = None):
     '''发送POST请求。
     :param url: 需要发送的url。
     :param data: 需要发送的数据。
     :param headers: 请求时使用的http头。
+    :param policy: 重试策略，默认最多尝试3次。
     :returns: 发送请求后的响应。'''
-    async with aiohttp.ClientSession(headers=headers) as session:
-        async with session.post(url, data=data, headers=headers) as req:
+
+    async def request():
+        async with HttpClient.session().post(url, data=data, headers=headers) as req:
             return await req.text()
 
+    return await request_with_retry(url, policy, request)
 
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(3), reraise=True)
-async def download_to_cache(link: str) -> Union[str, bool]:
+
+@single_flight('download_to_cache')
+async def download_to_cache(link: str, status_code: int = False, max_size: int = None,
+                            policy: RetryPolicy = None, logging_err_resp: bool = True) -> Union[str, bool]:
     '''利用AioHttp下载指定url的内容，并保存到缓存（./cache目录）。
 
+    内容以流的方式读取，不超过download_spool_size时保存在内存中，否则写入临时文件。文件以内容的sha256命名，
+    重复下载相同的内容时直接返回已有的文件，不再写入。
+
     :param link: 需要获取的link。
+    :param status_code: 指定请求到的状态码，若不符则视为获取失败。
+    :param max_size: 允许下载的最大字节数，默认使用download_max_size。
+    :param policy: 重试策略，默认最多尝试3次。
+    :param logging_err_resp: 状态码不符时是否输出错误日志，资源可能不存在（如玩家没有披风）时可关闭。
     :returns: 文件的相对路径，若获取失败则返回False。'''
+    max_size = max_size or download_max_size
+    tmp_path = None
+
+    def remove_tmp():
+        nonlocal tmp_path
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        tmp_path = None
+
+    async def fetch():
+        nonlocal tmp_path
+        remove_tmp()  # 上一次尝试留下的临时文件
+        async with HttpClient.session().get(link) as resp, AsyncExitStack() as stack:
+            if status_code and resp.status != status_code:
+                raise HttpStatusError(resp.status, f'Unexpected status {resp.status} for {link}')
+            if resp.content_length and resp.content_length > max_size:
+                raise ValueError(f'{link} is larger than {max_size} bytes')
+            digest = hashlib.sha256()
+            head = b''
+            chunks = []
+            size = 0
+            file = None
+            async for chunk in resp.content.iter_chunked(65536):
+                size += len(chunk)
+                if size > max_size:
+                    raise ValueError(f'{link} is larger than {max_size} bytes')
+                digest.update(chunk)
+                if len(head) < 262:  # filetype最多需要文件的前262个字节
+                    head += chunk[:262 - len(head)]
+                if file is None:
+                    chunks.append(chunk)
+                    if size > download_spool_size:
+                        tmp_path = f'{random_cache_path()}.tmp'
+                        file = await stack.enter_async_context(async_open(tmp_path, 'wb+'))
+                        await file.write(b''.join(chunks))
+                        chunks.clear()
+                else:
+                    await file.write(chunk)
+        kind = ft.match(head)
+        if kind is None:
+            raise ValueError(f'Unknown file type for {link}')
+        path = content_cache_path(digest.hexdigest(), kind.extension)
+        if os.path.exists(path):
+            os.utime(path)  # 更新访问时间
+        elif tmp_path is not None:
+            os.replace(tmp_path, path)
+            tmp_path = None
+        else:
+            async with async_open(path, 'wb+') as f:
+                await f.write(b''.join(chunks))
+        return path
+
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(link) as resp:
-                res = await resp.read()
-                ftt = ft.match(res).extension
-                path = f'{random_cache_path()}.{ftt}'
-                async with async_open(path, 'wb+') as file:
-                    await file.write(res)
-                    return path
-    except:
+        return await request_with_retry(link, policy, fetch)
+    except CircuitOpenError as e:
+        Logger.warn(str(e))
+        return False
+    except HttpStatusError:
+        if logging_err_resp:
+            Logger.error(traceback.format_exc())
+        return False
+    except Exception:
         Logger.error(traceback.format_exc())
         return False
+    finally:
+        remove_tmp()
 
 
-__all__ = ['get_url', 'post_url', 'download_to_cache']
+__all__ = ['HttpClient', 'get_url', 'post_url', 'download_to_cache']
@@ -0,0 +1,186 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import List, Union
+
+import ujson as json
+from aiofile import async_open
+
+from config import Config
+from core.logger import Logger, bot_name
+from core.metrics import Metrics
+
+
+class HttpCache:
+    """
+    get_url的条件请求缓存。响应正文保存在磁盘上，索引（URL、ETag、Last-Modified、保存时间等）保存在同目录的index.json中，
+    重启后仍然有效。缓存的总大小超过http_cache_size时按最近访问的顺序淘汰。
+    各平台的进程分别使用http_cache_path下以平台命名的目录（与日志文件相同），索引与大小限制互不影响。
+    """
+    path = os.path.join(os.path.abspath(Config('http_cache_path') or './assets/.cache_http/'), bot_name or 'Default')
+    max_size = int(Config('http_cache_size') or 64 * 1024 * 1024)
+    formats = (None, 'text', 'json', 'read')
+    _index: Union[OrderedDict, None] = None
+    _size = 0
+    hits = 0  # 在有效期内直接使用缓存
+    revalidated = 0  # 服务器返回304后使用缓存
+    misses = 0  # 重新下载
+
+    @staticmethod
+    def key(url: str, headers: dict = None) -> str:
+        signature = url if not headers else url + json.dumps(sorted(headers.items()))
+        return hashlib.sha256(signature.encode()).hexdigest()
+
+    @staticmethod
+    def _load_index() -> OrderedDict:
+        if HttpCache._index is not None:
+            return HttpCache._index
+        index = OrderedDict()
+        index_path = os.path.join(HttpCache.path, 'index.json')
+        if os.path.exists(index_path):
+            try:
+                with open(index_path, 'r', encoding='utf-8') as f:
+                    for key, entry in json.load(f):
+                        if os.path.exists(os.path.join(HttpCache.path, key)):
+                            index[key] = entry
+            except Exception:
+                Logger.warn('Failed to load the HTTP cache index, starting with an empty cache.')
+                index.clear()
+        else:
+            os.makedirs(HttpCache.path, exist_ok=True)
+        HttpCache._index = index
+        HttpCache._size = sum(entry['size'] for entry in index.values())
+        return index
+
+    @staticmethod
+    def _save_index():
+        index_path = os.path.join(HttpCache.path, 'index.json')
+        with open(index_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(list(HttpCache._index.items()), f)
+        os.replace(index_path + '.tmp', index_path)
+
+    @staticmethod
+    def lookup(key: str) -> Union[dict, None]:
+        index = HttpCache._load_index()
+        entry = index.get(key)
+        if entry is None:
+            return None
+        if not os.path.exists(os.path.join(HttpCache.path, key)):
+            HttpCache._drop(key)
+            return None
+        index.move_to_end(key)
+        return entry
+
+    @staticmethod
+    def _drop(key: str):
+        entry = HttpCache._load_index().pop(key, None)
+        if entry is not None:
+            HttpCache._size -= entry['size']
+
+    @staticmethod
+    def is_fresh(entry: dict, ttl: float) -> bool:
+        return time.time() - entry['stored_at'] < ttl
+
+    @staticmethod
+    def conditional_headers(entry: dict) -> dict:
+        headers = {}
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    @staticmethod
+    async def load(key: str, entry: dict, fmt: str = None, revalidated: bool = False):
+        """
+        读取缓存的正文并按fmt返回。正文已被删除时移除该条目并抛出FileNotFoundError
+        :param revalidated: 是否为服务器返回304后读取，会刷新缓存的保存时间
+        """
+        try:
+            async with async_open(os.path.join(HttpCache.path, key), 'rb') as f:
+                body = await f.read()
+        except FileNotFoundError:
+            HttpCache._drop(key)
+            HttpCache._save_index()
+            raise
+        if revalidated:
+            HttpCache.revalidated += 1
+            entry['stored_at'] = time.time()
+            HttpCache._save_index()
+        else:
+            HttpCache.hits += 1
+        return HttpCache.decode(body, entry['encoding'], fmt)
+
+    @staticmethod
+    async def store(key: str, url: str, body: bytes, resp):
+        """
+        保存响应，必要时淘汰最久未访问的条目
+        :param resp: aiohttp的响应，从中读取ETag、Last-Modified与编码
+        """
+        HttpCache.misses += 1
+        index = HttpCache._load_index()
+        if len(body) > HttpCache.max_size:
+            return
+        tmp_path = os.path.join(HttpCache.path, key + '.tmp')
+        async with async_open(tmp_path, 'wb') as f:
+            await f.write(body)
+        os.replace(tmp_path, os.path.join(HttpCache.path, key))
+        previous = index.pop(key, None)
+        if previous is not None:
+            HttpCache._size -= previous['size']
+        index[key] = {'url': url,
+                      'etag': resp.headers.get('ETag'),
+                      'last_modified': resp.headers.get('Last-Modified'),
+                      'encoding': resp.get_encoding(),
+                      'size': len(body),
+                      'stored_at': time.time()}
+        HttpCache._size += len(body)
+        while HttpCache._size > HttpCache.max_size and len(index) > 1:
+            old_key, old_entry = index.popitem(last=False)
+            HttpCache._size -= old_entry['size']
+            try:
+                os.remove(os.path.join(HttpCache.path, old_key))
+            except FileNotFoundError:
+                pass
+        HttpCache._save_index()
+
+    @staticmethod
+    def decode(body: bytes, encoding: str, fmt: str = None):
+        if fmt == 'read':
+            return body
+        text = body.decode(encoding or 'utf-8')
+        if fmt == 'json':
+            return json.loads(text)
+        return text
+
+    @staticmethod
+    def stats() -> dict:
+        total = HttpCache.hits + HttpCache.revalidated + HttpCache.misses
+        return {'entries': len(HttpCache._index or ()),
+                'size': HttpCache._size,
+                'max_size': HttpCache.max_size,
+                'hits': HttpCache.hits,
+                'revalidated': HttpCache.revalidated,
+                'misses': HttpCache.misses,
+                'hit_ratio': (HttpCache.hits + HttpCache.revalidated) / total if total else 0}
+
+    @staticmethod
+    def reset_stats():
+        HttpCache.hits = HttpCache.revalidated = HttpCache.misses = 0
+
+    @staticmethod
+    def render_prometheus() -> List[str]:
+        return ['# HELP akaribot_http_cache_requests_total Requests made through the get_url response cache.',
+                '# TYPE akaribot_http_cache_requests_total counter',
+                f'akaribot_http_cache_requests_total{{result="hit"}} {HttpCache.hits}',
+                f'akaribot_http_cache_requests_total{{result="revalidated"}} {HttpCache.revalidated}',
+                f'akaribot_http_cache_requests_total{{result="miss"}} {HttpCache.misses}',
+                '# HELP akaribot_http_cache_bytes Size of the get_url response cache on disk.',
+                '# TYPE akaribot_http_cache_bytes gauge',
+                f'akaribot_http_cache_bytes {HttpCache._size}']
+
+
+Metrics.register_collector(HttpCache.render_prometheus, HttpCache.reset_stats)
+
+__all__ = ['HttpCache']
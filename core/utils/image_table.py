@@ -4,13 +4,13 @@ import traceback
 from html import escape
 from typing import List, Union
 
-import aiohttp
 import ujson as json
 from tabulate import tabulate
 
 from config import Config
 from core.logger import Logger
 from .cache import random_cache_path
+from .http import HttpClient
 
 web_render = Config('web_render')
 
@@ -62,12 +62,11 @@ async def image_table_render(table: Union[ImageTable, List[ImageTable]], save_so
         picname = random_cache_path() + '.jpg'
         if os.path.exists(picname):
             os.remove(picname)
-        async with aiohttp.ClientSession() as session:
-            async with session.post(web_render, headers={
-                'Content-Type': 'application/json',
-            }, data=json.dumps(html)) as resp:
-                with open(picname, 'wb+') as jpg:
-                    jpg.write(await resp.read())
+        async with HttpClient.session().post(web_render, headers={
+            'Content-Type': 'application/json',
+        }, data=json.dumps(html)) as resp:
+            with open(picname, 'wb+') as jpg:
+                jpg.write(await resp.read())
         return picname
     except Exception:
         Logger.error(traceback.format_exc())
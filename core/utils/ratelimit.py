@@ -0,0 +1,83 @@
+import time
+from collections import OrderedDict
+from typing import Hashable, Union
+
+from config import Config
+
+
+class RateLimiter:
+    """
+    令牌桶频率限制器，每个键在period秒内最多可连续使用capacity次，令牌随时间匀速恢复。
+    已完全恢复的键会在清理时移除，键的数量超过maxsize时淘汰最久未使用的键。
+    :param capacity: 令牌桶的容量
+    :param period: 令牌从空到满所需的秒数
+    :param maxsize: 最多记录的键数
+    """
+
+    def __init__(self, capacity: int, period: float, maxsize: int = 100000):
+        self.capacity = capacity
+        self.period = period
+        self.rate = capacity / period
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()  # 键 -> [剩余令牌, 上次更新时间]，按最近使用的顺序排列
+        self._last_sweep = time.monotonic()
+
+    @staticmethod
+    def from_config(name: str, maxsize: int = 100000) -> Union['RateLimiter', None]:
+        """
+        根据“次数/秒数”格式的配置项创建限制器，未配置时返回None
+        """
+        value = Config(name)
+        if not value:
+            return None
+        capacity, period = str(value).split('/')
+        return RateLimiter(int(capacity), float(period), maxsize)
+
+    def _tokens(self, key: Hashable, now: float) -> float:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return self.capacity
+        return min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate)
+
+    def wait_time(self, key: Hashable, now: float = None) -> float:
+        """
+        返回该键还需等待多少秒才能再次使用，不消耗令牌
+        """
+        tokens = self._tokens(key, now or time.monotonic())
+        return 0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def hit(self, key: Hashable, now: float = None) -> float:
+        """
+        尝试消耗一个令牌
+        :return: 成功时返回0，否则返回需要等待的秒数
+        """
+        now = now or time.monotonic()
+        tokens = self._tokens(key, now)
+        if tokens < 1:
+            return (1 - tokens) / self.rate
+        self._buckets[key] = [tokens - 1, now]
+        self._buckets.move_to_end(key)
+        if len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        if now - self._last_sweep > self.period:
+            self.sweep(now)
+        return 0
+
+    def reset(self, key: Hashable):
+        self._buckets.pop(key, None)
+
+    def sweep(self, now: float = None):
+        """
+        移除令牌已完全恢复的键。各键的令牌数量不随使用顺序单调变化，需要检查全部的键
+        """
+        now = now or time.monotonic()
+        self._last_sweep = now
+        for key in [key for key, (tokens, last) in self._buckets.items()
+                    if tokens + (now - last) * self.rate >= self.capacity]:
+            del self._buckets[key]
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+__all__ = ['RateLimiter']
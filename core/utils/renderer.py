@@ -0,0 +1,123 @@
+'''CPU密集型图片生成的进程池。
+
+绘制b30/b40等图片时PIL会长时间占用CPU，直接在协程中调用会阻塞整个事件循环。
+render()将绘制函数交给子进程执行，同时提交的任务数受render_queue_size限制，执行中的任务数不超过进程数。
+任务排队超过render_queue_timeout秒或执行超过render_timeout秒后放弃等待。
+子进程以spawn方式启动，不继承机器人进程中的线程、数据库连接与事件循环。
+绘制函数须为模块顶层的同步函数，参数与返回值须可被pickle；返回PIL图片时会在子进程中编码并保存至缓存目录。'''
+import asyncio
+import multiprocessing
+import os
+import sys
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable
+
+from PIL import Image
+
+from config import Config
+from core.exceptions import RenderTimeoutError
+from core.logger import Logger
+from .cache import random_cache_path
+
+render_workers = int(Config('render_workers') or min(4, os.cpu_count() or 1))
+render_queue_size = int(Config('render_queue_size') or render_workers * 4)
+render_timeout = float(Config('render_timeout') or 60)
+render_queue_timeout = float(Config('render_queue_timeout') or render_timeout * render_queue_size / render_workers)
+
+_executor = None
+_slots = None  # 已提交（排队或执行中）的任务
+_workers = None  # 执行中的任务，取得名额后子进程可立即开始执行
+
+
+def _submit(fn: Callable, fmt: str, args: tuple, kwargs: dict) -> Future:
+    """
+    向进程池提交任务。进程池在提交时按需启动子进程，spawn会让子进程重新执行__main__所在的脚本，
+    而各平台的启动脚本在顶层直接运行机器人，因此启动期间暂时隐藏__main__的路径
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=render_workers, mp_context=multiprocessing.get_context('spawn'))
+    main = sys.modules['__main__']
+    spec, path = getattr(main, '__spec__', None), getattr(main, '__file__', None)
+    main.__spec__ = None
+    if path is not None:
+        del main.__file__
+    try:
+        return _executor.submit(_run, fn, fmt, args, kwargs)
+    finally:
+        main.__spec__ = spec
+        if path is not None:
+            main.__file__ = path
+
+
+async def _acquire():
+    await _slots.acquire()
+    try:
+        await _workers.acquire()
+    except BaseException:
+        _slots.release()
+        raise
+
+
+def _release():
+    _workers.release()
+    _slots.release()
+
+
+def _run(fn: Callable, fmt: str, args: tuple, kwargs: dict):
+    result = fn(*args, **kwargs)
+    if isinstance(result, Image.Image):
+        if fmt.upper() in ['JPG', 'JPEG']:
+            path = f'{random_cache_path()}.jpg'
+            result.convert('RGB').save(path, 'JPEG')
+        else:
+            path = f'{random_cache_path()}.{fmt.lower()}'
+            result.save(path, fmt.upper())
+        return path
+    return result
+
+
+async def render(fn: Callable, *args, fmt: str = 'JPEG', timeout: float = None, **kwargs):
+    """
+    在进程池中执行绘制函数
+    :param fn: 模块顶层的同步绘制函数
+    :param fmt: 绘制函数返回PIL图片时的保存格式，需要透明背景时使用PNG
+    :param timeout: 执行的超时秒数（不包含排队的时间），默认使用render_timeout
+    :return: 返回PIL图片时为缓存文件的路径，否则为绘制函数的原返回值（如bytes或路径）
+    """
+    global _executor, _slots, _workers
+    timeout = timeout or render_timeout
+    if _slots is None:
+        _slots = asyncio.Semaphore(render_queue_size)
+        _workers = asyncio.Semaphore(render_workers)
+    loop = asyncio.get_running_loop()
+    try:
+        await asyncio.wait_for(_acquire(), render_queue_timeout)
+    except asyncio.TimeoutError:
+        raise RenderTimeoutError(f'渲染队列已满，等待超过{render_queue_timeout:g}秒。')
+    try:
+        future = _submit(fn, fmt, args, kwargs)
+    except BrokenProcessPool:
+        Logger.warn('The render process pool is broken, recreating...')
+        _executor = None
+        try:
+            future = _submit(fn, fmt, args, kwargs)
+        except BaseException:
+            _release()
+            raise
+    except BaseException:
+        _release()
+        raise
+    # 超时后子进程中的任务无法中止，待其实际结束后才归还名额，使排队数与进程池的负载保持一致
+    future.add_done_callback(lambda _: loop.call_soon_threadsafe(_release))
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+    except asyncio.TimeoutError:
+        raise RenderTimeoutError(f'渲染{getattr(fn, "__name__", fn)}超过{timeout:g}秒未完成。')
+    except BrokenProcessPool:
+        _executor = None
+        raise
+
+
+__all__ = ['render']
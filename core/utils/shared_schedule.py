@@ -0,0 +1,132 @@
+'''在各平台的进程间共享计划任务。
+
+bot.py为每个平台启动一个进程，各进程都会注册所有计划任务。开启shared_schedules后，任务每次触发时各进程通过数据库中的租约竞争执行权，
+只有持有租约的进程执行任务，因此每个上游地址在每个周期内只被请求一次。任务中不指定user_list的post_message会写入ScheduleOutbox，
+由每个进程（包括执行者）读取后发送给本平台开启了对应模块的对象。on_startup注册的任务与各平台相关，不参与共享。'''
+import os
+import traceback
+from typing import List, Union
+
+import ujson as json
+from apscheduler.triggers.interval import IntervalTrigger
+
+from config import Config
+from core.elements import FetchTarget, Image, Plain, Schedule, Url, Voice
+from core.logger import Logger
+from database import BotDBUtil
+
+
+def dump_message(message: Union[str, list, tuple]) -> str:
+    """
+    序列化推送的消息，只支持字符串与由Plain、Url、Image、Voice组成的列表
+    """
+    if isinstance(message, str):
+        return json.dumps(message, ensure_ascii=False)
+    elements = []
+    for x in message:
+        if isinstance(x, str):
+            elements.append(['plain', x])
+        elif isinstance(x, (Plain, Url)):
+            elements.append(['plain', str(x)])
+        elif isinstance(x, Image):
+            elements.append(['image', x.path, x.headers])
+        elif isinstance(x, Voice):
+            elements.append(['voice', x.path])
+        else:
+            raise TypeError(f'Cannot share a message containing {x.__class__.__name__}')
+    return json.dumps(elements, ensure_ascii=False)
+
+
+def load_message(message: str) -> Union[str, List[Union[Plain, Image, Voice]]]:
+    message = json.loads(message)
+    if isinstance(message, str):
+        return message
+    elements = []
+    for x in message:
+        if x[0] == 'plain':
+            elements.append(Plain(x[1]))
+        elif x[0] == 'image':
+            elements.append(Image(x[1], headers=x[2]))
+        elif x[0] == 'voice':
+            elements.append(Voice(x[1]))
+    return elements
+
+
+class SharedTarget:
+    """
+    交给共享的计划任务的FetchTarget。向所有对象推送的消息写入ScheduleOutbox，其余属性与方法转交给本进程的FetchTarget
+    """
+    name = 'Shared'  # get_stored_list等按此名称保存数据，执行者换成其他进程后仍能读到之前的记录
+
+    def __init__(self, target: FetchTarget):
+        self.target = target
+
+    def __getattr__(self, item):
+        return getattr(self.target, item)
+
+    async def post_message(self, module_name, message, user_list=None):
+        if user_list is not None:
+            return await self.target.post_message(module_name, message, user_list)
+        try:
+            message = dump_message(message)
+        except TypeError:
+            Logger.warn(f'{module_name}: {traceback.format_exc().strip().splitlines()[-1]}, '
+                        f'sending it to {self.target.name} only.')
+            return await self.target.post_message(module_name, message)
+        BotDBUtil.Outbox.add(module_name, message)
+        return []
+
+
+class SharedSchedule:
+    enabled = bool(Config('shared_schedules'))
+    lease_ttl = float(Config('schedule_lease_ttl') or 300)
+    relay_interval = float(Config('schedule_relay_interval') or 5)
+    holder = None
+
+    @staticmethod
+    def start(ft: FetchTarget):
+        """
+        记录本进程的标识，并确定ScheduleOutbox的读取位置
+        """
+        SharedSchedule.holder = f'{ft.name}|{os.getpid()}'
+        BotDBUtil.Outbox.fetch()
+
+    @staticmethod
+    def wrap(module: Schedule, ft: FetchTarget):
+        """
+        返回只在本进程持有租约时执行的任务。间隔执行的任务的租约至少为间隔的1.5倍，执行者正常运行时不会被其他进程取代
+        """
+        ttl = SharedSchedule.lease_ttl
+        if isinstance(module.trigger, IntervalTrigger):
+            ttl = max(ttl, module.trigger.interval.total_seconds() * 1.5)
+        target = SharedTarget(ft)
+
+        async def job():
+            try:
+                acquired = BotDBUtil.Lease.acquire(module.bind_prefix, SharedSchedule.holder, ttl)
+            except Exception:
+                Logger.error(traceback.format_exc())
+                return
+            if acquired:
+                await module.function(target)
+
+        return job
+
+    @staticmethod
+    async def relay(ft: FetchTarget):
+        """
+        发送其他进程（或本进程）执行的任务推送的消息
+        """
+        for module_name, message in BotDBUtil.Outbox.fetch():
+            try:
+                await ft.post_message(module_name, load_message(message))
+            except Exception:
+                Logger.error(traceback.format_exc())
+
+    @staticmethod
+    def stop():
+        if SharedSchedule.holder is not None:
+            BotDBUtil.Lease.release(SharedSchedule.holder)
+
+
+__all__ = ['SharedSchedule', 'SharedTarget']
@@ -0,0 +1,101 @@
+import asyncio
+import copy
+from functools import wraps
+from typing import Callable, Dict, Hashable, List, Tuple
+
+from core.metrics import Metrics
+
+
+class SingleFlight:
+    """
+    合并相同的并发请求：某个键的调用尚未完成时，之后以相同的键发起的调用直接等待它的结果，不再重复访问上游。
+    调用完成后立即移除，不会缓存结果。后来者得到的dict或list结果为调用完成时留存的副本的深拷贝，避免调用方之间互相修改。
+    :param name: 名称，用于统计
+    """
+    instances: Dict[str, 'SingleFlight'] = {}
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.shared = 0  # 被合并、未实际发起的调用数
+        self._flights: Dict[Hashable, Tuple[asyncio.Future, list]] = {}  # 键 -> (调用, 后来者计数)
+        SingleFlight.instances[name] = self
+
+    async def do(self, key: Hashable, fn: Callable, *args, **kwargs):
+        self.calls += 1
+        entry = self._flights.get(key)
+        if entry is None:
+            joined = [0]
+            flight = asyncio.ensure_future(self._call(joined, fn, *args, **kwargs))
+            self._flights[key] = (flight, joined)
+            flight.add_done_callback(lambda _: self._forget(key, flight))
+            result, _ = await asyncio.shield(flight)  # 发起者被取消时不影响其他等待者
+            return result
+        flight, joined = entry
+        joined[0] += 1
+        self.shared += 1
+        _, snapshot = await asyncio.shield(flight)
+        return copy.deepcopy(snapshot) if isinstance(snapshot, (dict, list)) else snapshot
+
+    @staticmethod
+    async def _call(joined: list, fn: Callable, *args, **kwargs):
+        """
+        :return: (结果, 留给后来者的副本)，副本在结果交给发起者之前取得，发起者之后对结果的修改不会影响后来者
+        """
+        result = await fn(*args, **kwargs)
+        if joined[0] and isinstance(result, (dict, list)):
+            return result, copy.deepcopy(result)
+        return result, result
+
+    def _forget(self, key: Hashable, flight: asyncio.Future):
+        entry = self._flights.get(key)
+        if entry is not None and entry[0] is flight:
+            del self._flights[key]
+        if not flight.cancelled():
+            flight.exception()  # 所有等待者都已取消时，避免出现“exception was never retrieved”
+
+    @staticmethod
+    def stats() -> Dict[str, dict]:
+        return {name: {'calls': x.calls, 'shared': x.shared, 'in_flight': len(x._flights)}
+                for name, x in SingleFlight.instances.items()}
+
+    @staticmethod
+    def reset():
+        for x in SingleFlight.instances.values():
+            x.calls = x.shared = 0
+
+    @staticmethod
+    def render_prometheus() -> List[str]:
+        lines = ['# HELP akaribot_singleflight_calls_total Calls made through each single-flight group.',
+                 '# TYPE akaribot_singleflight_calls_total counter']
+        for name, x in sorted(SingleFlight.instances.items()):
+            lines.append(f'akaribot_singleflight_calls_total{{name="{name}"}} {x.calls}')
+        lines += ['# HELP akaribot_singleflight_shared_total Calls that awaited an identical in-flight call instead.',
+                  '# TYPE akaribot_singleflight_shared_total counter']
+        for name, x in sorted(SingleFlight.instances.items()):
+            lines.append(f'akaribot_singleflight_shared_total{{name="{name}"}} {x.shared}')
+        return lines
+
+
+def single_flight(name: str, key: Callable = None):
+    """
+    以SingleFlight合并被装饰协程函数的并发调用
+    :param name: 名称，用于统计
+    :param key: 根据调用参数生成键的函数，默认使用位置参数与关键字参数本身（需可哈希）
+    """
+    flight = SingleFlight(name)
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            k = key(*args, **kwargs) if key is not None else (args, tuple(sorted(kwargs.items())))
+            return await flight.do(k, func, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+Metrics.register_collector(SingleFlight.render_prometheus, SingleFlight.reset)
+
+__all__ = ['SingleFlight', 'single_flight']
@@ -1,12 +1,18 @@
+from typing import Union
+
 import ujson as json
 
+from config import Config
 from core.elements import FetchTarget
 
 from database import BotDBUtil
+from .shared_schedule import SharedTarget
 
 
 def get_stored_list(bot: FetchTarget, name):
     get = BotDBUtil.Data(bot).get(name=name)
+    if get is None and isinstance(bot, SharedTarget):
+        get = BotDBUtil.Data(bot.target).get(name=name)  # 开启共享计划任务前由各平台分别保存的记录
     if get is None:
         return []
     else:
@@ -18,4 +24,40 @@ def update_stored_list(bot: FetchTarget, name, value):
     return edit
 
 
-__all__ = ['get_stored_list', 'update_stored_list']
+class FeedState:
+    """
+    订阅源已推送过的条目，代替以get_stored_list保存的列表。条目逐条保存在数据库中，判断与写入的开销不随历史记录增长，
+    可直接使用in判断条目是否已推送过。
+    :param bot: 执行计划任务的FetchTarget
+    :param name: 订阅源的名称，与原先get_stored_list使用的名称相同，迁移后的记录可直接使用
+    :param retention_days: 条目的保留天数，默认使用配置中的feed_retention_<name>，未配置或为0时永久保留。
+    只适用于不会再次出现旧条目的订阅源，上游返回全部历史记录时（如Jira的版本列表）必须永久保留
+    """
+    _checked_shared = set()  # 已确认从各平台的记录中复制过的共享订阅源
+
+    def __init__(self, bot: FetchTarget, name: str, retention_days: Union[float, None] = None):
+        self.feed = BotDBUtil.Feed(bot, name)
+        if isinstance(bot, SharedTarget) and self.feed.feed not in FeedState._checked_shared:
+            if self.feed.empty():  # 开启共享计划任务前由各平台分别保存的记录
+                self.feed.copy_from(BotDBUtil.Feed(bot.target, name))
+            FeedState._checked_shared.add(self.feed.feed)
+        if retention_days is None:
+            retention_days = float(Config(f'feed_retention_{name}') or 0)
+        self.retention_days = retention_days
+
+    def __contains__(self, item: str) -> bool:
+        return not self.feed.new_items([item])
+
+    def new_items(self, items: list) -> list:
+        """
+        返回尚未推送过的条目，保持原有顺序并去除重复
+        """
+        return self.feed.new_items(items)
+
+    def add(self, *items: str):
+        self.feed.add(list(items))
+        if self.retention_days:
+            self.feed.prune(self.retention_days)
+
+
+__all__ = ['get_stored_list', 'update_stored_list', 'FeedState']
@@ -1,70 +1,126 @@
+import heapq
+import itertools
+import time
+from typing import Dict, List, Tuple, Union
+
 from core.elements import MessageSession
-from datetime import datetime
+
+
+class MessageTask:
+    """
+    一个等待中的waitConfirm/waitNextMessage/waitReply/waitAnyone
+    :param target_id: 对象ID
+    :param sender: 发送者ID，waitAnyone时为'all'
+    :param flag: 收到结果或被取消时设置的asyncio.Event
+    :param reply: 需要被回复的消息ID，不为None时只接受回复这些消息的消息
+    """
+    __slots__ = ('target_id', 'sender', 'flag', 'type', 'reply', 'ts', 'active', 'result')
+
+    def __init__(self, target_id: str, sender: str, flag, reply: Union[list, int, str, None] = None):
+        self.target_id = target_id
+        self.sender = sender
+        self.flag = flag
+        self.type = 'reply' if reply is not None else 'wait'
+        if reply is not None and not isinstance(reply, (list, tuple)):
+            reply = [reply]
+        self.reply = reply
+        self.ts = time.monotonic()
+        self.active = True
+        self.result = None
 
 
 class MessageTaskManager:
-    _list = {}
+    """
+    按(对象ID, 发送者ID)记录等待中的任务，另以(对象ID, 回复的消息ID)建立索引，每条消息只需常数次字典查找即可完成分发。
+    超时的任务记录在最小堆中，每次分发前只弹出已到期的部分。同一对象中不同发送者的任务互不影响。
+    """
+    timeout = 3600
+    _tasks: Dict[Tuple[str, str], MessageTask] = {}
+    _replies: Dict[Tuple[str, Union[int, str]], MessageTask] = {}
+    _expiry: List[Tuple[float, int, MessageTask]] = []
+    _counter = itertools.count()
 
     @staticmethod
-    def add_task(session: MessageSession, flag, all_=False, reply=None):
-        sender = session.target.senderId
-        task_type = 'reply' if reply is not None else 'wait'
-        if all_:
-            sender = 'all'
-        if session.target.targetId in MessageTaskManager._list:
-            if sender in MessageTaskManager._list[session.target.targetId]:
-                if MessageTaskManager._list[session.target.targetId][sender]['active']:
-                    MessageTaskManager._list[session.target.targetId][sender]['active'] = False
-                    MessageTaskManager._list[session.target.targetId][sender]['flag'].set()
-
-        MessageTaskManager._list.update(
-            {session.target.targetId: {sender: {'flag': flag, 'active': True,
-                                                'type': task_type, 'reply': reply, 'ts': datetime.now().timestamp()}}})
+    def add_task(session: MessageSession, flag, all_=False, reply=None) -> MessageTask:
+        """
+        :param session: 发起等待的消息会话
+        :param flag: 收到结果或被取消时设置的asyncio.Event
+        :param all_: 是否接受对象中任何人的消息
+        :param reply: 需要被回复的消息ID
+        :return: 任务，结果可从其result属性获取，被取消时为None
+        """
+        sender = 'all' if all_ else session.target.senderId
+        key = (session.target.targetId, sender)
+        previous = MessageTaskManager._tasks.get(key)
+        if previous is not None:
+            MessageTaskManager._finish(previous)  # 同一发送者的新等待会取消旧的等待
+        task = MessageTask(session.target.targetId, sender, flag, reply)
+        MessageTaskManager._tasks[key] = task
+        if task.reply is not None:
+            for reply_id in task.reply:
+                MessageTaskManager._replies[(task.target_id, reply_id)] = task
+        heapq.heappush(MessageTaskManager._expiry,
+                       (task.ts + MessageTaskManager.timeout, next(MessageTaskManager._counter), task))
+        if len(MessageTaskManager._expiry) > 2 * len(MessageTaskManager._tasks) + 64:
+            MessageTaskManager._compact()
+        return task
 
     @staticmethod
-    def get_result(session: MessageSession):
-        if 'result' in MessageTaskManager._list[session.target.targetId][session.target.senderId]:
-            return MessageTaskManager._list[session.target.targetId][session.target.senderId]['result']
-        else:
-            return False
+    def get_task(target_id: str, sender: str) -> Union[MessageTask, None]:
+        return MessageTaskManager._tasks.get((target_id, sender))
 
     @staticmethod
     def get():
-        return MessageTaskManager._list
+        return MessageTaskManager._tasks
+
+    @staticmethod
+    def _finish(task: MessageTask, result: MessageSession = None):
+        task.active = False
+        task.result = result
+        key = (task.target_id, task.sender)
+        if MessageTaskManager._tasks.get(key) is task:
+            del MessageTaskManager._tasks[key]
+        if task.reply is not None:
+            for reply_id in task.reply:
+                if MessageTaskManager._replies.get((task.target_id, reply_id)) is task:
+                    del MessageTaskManager._replies[(task.target_id, reply_id)]
+        task.flag.set()  # 没有结果即为取消
+
+    @staticmethod
+    def _compact():
+        """
+        被替换或已完成的任务仍留在堆中直至到期，堆过大时只保留仍在等待的任务
+        """
+        MessageTaskManager._expiry = [x for x in MessageTaskManager._expiry if x[2].active]
+        heapq.heapify(MessageTaskManager._expiry)
+
+    @staticmethod
+    def expire(now: float = None):
+        now = now or time.monotonic()
+        expiry = MessageTaskManager._expiry
+        while expiry and expiry[0][0] <= now:
+            _, _, task = heapq.heappop(expiry)
+            if task.active:
+                MessageTaskManager._finish(task)
 
     @staticmethod
     def check(session: MessageSession):
-        for target in MessageTaskManager._list:
-            for sender in MessageTaskManager._list[target]:
-                if MessageTaskManager._list[target][sender]['active']:
-                    if datetime.now().timestamp() - MessageTaskManager._list[target][sender]['ts'] > 3600:
-                        MessageTaskManager._list[target][sender]['active'] = False
-                        MessageTaskManager._list[target][sender]['flag'].set()  # no result = cancel
-        if session.target.targetId in MessageTaskManager._list:
-            sender = None
-            if session.target.senderId in MessageTaskManager._list[session.target.targetId]:
-                sender = session.target.senderId
-            if 'all' in MessageTaskManager._list[session.target.targetId]:
-                sender = 'all'
-            if sender is not None:
-                get_ = MessageTaskManager._list[session.target.targetId][sender]
-                if get_['type'] == 'wait':
-                    get_['result'] = session
-                    get_['active'] = False
-                    get_['flag'].set()
-                elif get_['type'] == 'reply':
-                    if isinstance(get_['reply'], list):
-                        for reply in get_['reply']:
-                            if reply == session.target.replyId:
-                                get_['result'] = session
-                                get_['active'] = False
-                                get_['flag'].set()
-                                break
-                    else:
-                        if get_['reply'] == session.target.replyId:
-                            get_['result'] = session
-                            get_['active'] = False
-                            get_['flag'].set()
+        MessageTaskManager.expire()
+        target_id = session.target.targetId
+        task = MessageTaskManager._tasks.get((target_id, 'all'))
+        if task is not None and task.type == 'reply':
+            task = None  # 需要回复的任务只能通过回复的消息ID匹配
+        if task is None:
+            task = MessageTaskManager._tasks.get((target_id, session.target.senderId))
+            if task is not None and task.type == 'reply':
+                task = None
+            reply_id = session.target.replyId
+            if task is None and reply_id is not None:
+                task = MessageTaskManager._replies.get((target_id, reply_id))
+                if task is not None and task.sender not in ('all', session.target.senderId):
+                    task = None
+        if task is not None:
+            MessageTaskManager._finish(task, session)
 
 
-__all__ = ['MessageTaskManager']
+__all__ = ['MessageTaskManager', 'MessageTask']
@@ -1,15 +1,21 @@
+import atexit
 import datetime
+import hashlib
+import time
 import ujson as json
 from typing import Union
 
+from sqlalchemy import select, exists, func, or_
+from sqlalchemy.exc import IntegrityError
 from tenacity import retry, stop_after_attempt
 
 from config import Config
 from core.elements.message import MessageSession, FetchTarget, FetchedSession
 from core.elements.temp import EnabledModulesCache, SenderInfoCache
+from core.logger import Logger
 from database.orm import Session
 from database.tables import *
-from database.tables import AnalyticsData
+from database.tables import AnalyticsData, AnalyticsRollup, CacheInvalidation, ScheduleLease, ScheduleOutbox
 
 cache = Config('db_cache')
 
@@ -37,7 +43,7 @@ def auto_rollback_error(func):
 
 
 class BotDBUtil:
-    database_version = 1
+    database_version = 3
 
     class Module:
         @retry(stop=stop_after_attempt(3))
@@ -47,6 +53,7 @@ class BotDBUtil:
             else:
                 self.targetId = msg
             self.need_insert = False
+            BotDBUtil.CacheSync.sync()
             self.enable_modules_list = EnabledModulesCache.get_cache(self.targetId) if cache else False
             if not self.enable_modules_list:
                 query = self.query_EnabledModules
@@ -85,8 +92,11 @@ class BotDBUtil:
                 table = EnabledModules(targetId=self.targetId,
                                        enabledModules=value)
                 session.add_all([table])
+                self.need_insert = False
             else:
                 self.query_EnabledModules.enabledModules = value
+            self.update_index()
+            BotDBUtil.CacheSync.invalidate('EnabledModules', self.targetId)
             session.commit()
             session.expire_all()
             if cache:
@@ -105,30 +115,37 @@ class BotDBUtil:
                         self.enable_modules_list.remove(x)
             if not self.need_insert:
                 self.query_EnabledModules.enabledModules = json.dumps(self.enable_modules_list)
+                self.update_index()
+                BotDBUtil.CacheSync.invalidate('EnabledModules', self.targetId)
                 session.commit()
                 session.expire_all()
                 if cache:
                     EnabledModulesCache.add_cache(self.targetId, self.enable_modules_list)
             return True
 
+        def update_index(self):
+            """
+            将TargetEnabledModule索引与当前的模块列表同步，需在同一事务中提交
+            """
+            session.query(TargetEnabledModule).filter_by(targetId=self.targetId).delete()
+            session.add_all([TargetEnabledModule(targetId=self.targetId, moduleName=x)
+                             for x in dict.fromkeys(self.enable_modules_list)])
+
         @staticmethod
         @retry(stop=stop_after_attempt(3))
         @auto_rollback_error
         def get_enabled_this(module_name):
-            query = session.query(EnabledModules).filter(EnabledModules.enabledModules.like(f'%{module_name}%'))
-            targetIds = []
-            for x in query:
-                enabled_list = json.loads(x.enabledModules)
-                if module_name in enabled_list:
-                    targetIds.append(x.targetId)
-            return targetIds
+            return [x for x, in session.query(TargetEnabledModule.targetId).filter_by(moduleName=module_name)]
 
     class SenderInfo:
         @retry(stop=stop_after_attempt(3))
         @auto_rollback_error
-        def __init__(self, senderId):
+        def __init__(self, senderId, query: dict = None):
             self.senderId = senderId
-            query_cache = SenderInfoCache.get_cache(self.senderId) if cache else False
+            self.target_admin_cache = {}
+            if query is None:
+                BotDBUtil.CacheSync.sync()
+            query_cache = SenderInfoCache.get_cache(self.senderId) if cache and query is None else query
             if query_cache:
                 self.query = Dict2Object(query_cache)
             else:
@@ -138,7 +155,11 @@ class BotDBUtil:
                     session.commit()
                     self.query = session.query(SenderInfo).filter_by(id=senderId).first()
                 if cache:
-                    SenderInfoCache.add_cache(self.senderId, self.query.__dict__)
+                    SenderInfoCache.add_cache(self.senderId, self.to_cache(self.query))
+
+        @staticmethod
+        def to_cache(query) -> dict:
+            return {column: getattr(query, column) for column in BotDBUtil.RequestContext.sender_columns}
 
         @property
         @retry(stop=stop_after_attempt(3))
@@ -151,37 +172,220 @@ class BotDBUtil:
         def edit(self, column: str, value):
             query = self.query_SenderInfo
             setattr(query, column, value)
+            BotDBUtil.CacheSync.invalidate('SenderInfo', self.senderId)
             session.commit()
-            session.expire_all()
             if cache:
-                SenderInfoCache.add_cache(self.senderId, query.__dict__)
+                SenderInfoCache.add_cache(self.senderId, self.to_cache(query))
+            session.expire_all()
             return True
 
         @retry(stop=stop_after_attempt(3))
         @auto_rollback_error
         def check_TargetAdmin(self, targetId):
-            query = session.query(TargetAdmin).filter_by(senderId=self.senderId, targetId=targetId).first()
+            if targetId in self.target_admin_cache:
+                return self.target_admin_cache[targetId]
+            query = self.query_TargetAdmin(targetId)
             if query is not None:
                 return query
             return False
 
+        @auto_rollback_error
+        def query_TargetAdmin(self, targetId):
+            return session.query(TargetAdmin).filter_by(senderId=self.senderId, targetId=targetId).first()
+
         @retry(stop=stop_after_attempt(3))
         @auto_rollback_error
         def add_TargetAdmin(self, targetId):
             if not self.check_TargetAdmin(targetId):
                 session.add_all([TargetAdmin(senderId=self.senderId, targetId=targetId)])
                 session.commit()
+            self.target_admin_cache.pop(targetId, None)
             return True
 
         @retry(stop=stop_after_attempt(3))
         @auto_rollback_error
         def remove_TargetAdmin(self, targetId):
-            query = self.check_TargetAdmin(targetId)
-            if query:
+            query = self.query_TargetAdmin(targetId)
+            if query is not None:
                 session.delete(query)
                 session.commit()
+            self.target_admin_cache.pop(targetId, None)
+            return True
+
+    class RequestContext:
+        """
+        处理一条消息所需的数据库信息，在一次查询中取得，并在该消息的生命周期内复用
+        """
+        sender_columns = ['id', 'isInBlockList', 'isInAllowList', 'isSuperUser', 'warns', 'disable_typing']
+
+        @retry(stop=stop_after_attempt(3))
+        @auto_rollback_error
+        def __init__(self, msg: MessageSession):
+            self.targetId = str(msg.target.targetId)
+            self.senderId = msg.target.senderId
+            BotDBUtil.CacheSync.sync()
+            sender_cache = SenderInfoCache.get_cache(self.senderId) if cache else False
+            modules_cache = EnabledModulesCache.get_cache(self.targetId) if cache else False
+            columns = [exists().where(MuteList.targetId == self.targetId),
+                       exists().where(TargetAdmin.senderId == self.senderId, TargetAdmin.targetId == self.targetId),
+                       select(TargetOptions.options).where(TargetOptions.targetId == self.targetId)
+                       .scalar_subquery()]
+            if not modules_cache:
+                columns.append(select(EnabledModules.enabledModules).where(EnabledModules.targetId == self.targetId)
+                               .scalar_subquery())
+            if not sender_cache:
+                for column in self.sender_columns:
+                    columns.append(select(getattr(SenderInfo, column)).where(SenderInfo.id == self.senderId)
+                                   .scalar_subquery())
+            row = list(session.query(*columns).one())
+            self.is_muted: bool = bool(row[0])
+            self.is_target_admin: bool = bool(row[1])
+            self.options: dict = json.loads(row[2]) if row[2] is not None else {}
+            if not modules_cache:
+                modules_cache = json.loads(row[3]) if row[3] is not None else []
+                if cache:
+                    EnabledModulesCache.add_cache(self.targetId, modules_cache)
+            self.enabled_modules: frozenset = frozenset(modules_cache)
+            if not sender_cache:
+                sender_cache = dict(zip(self.sender_columns, row[-len(self.sender_columns):]))
+                if sender_cache['id'] is None:
+                    self.sender_info = BotDBUtil.SenderInfo(self.senderId)
+                    sender_cache = None
+                elif cache:
+                    SenderInfoCache.add_cache(self.senderId, sender_cache)
+            if sender_cache is not None:
+                self.sender_info = BotDBUtil.SenderInfo(self.senderId, query=sender_cache)
+            self.sender_info.target_admin_cache[self.targetId] = self.is_target_admin
+
+    class CacheSync:
+        """
+        通过CacheInvalidation表在各进程间同步EnabledModulesCache与SenderInfoCache。
+        修改被缓存的数据时在同一事务中写入失效记录，各进程至多每隔db_cache_sync_interval秒读取一次新的记录并清除对应条目
+        """
+        caches = {'EnabledModules': EnabledModulesCache, 'SenderInfo': SenderInfoCache}
+        interval = float(Config('db_cache_sync_interval') or 2)
+        retention = datetime.timedelta(days=1)
+        last_id = None
+        last_check = 0
+
+        @staticmethod
+        def invalidate(cache_name: str, key: str):
+            """
+            记录一条失效信息，由调用方提交
+            """
+            if not cache:
+                return
+            now = datetime.datetime.now()
+            session.query(CacheInvalidation).filter(
+                CacheInvalidation.timestamp < now - BotDBUtil.CacheSync.retention).delete()
+            session.add(CacheInvalidation(cacheName=cache_name, key=key, timestamp=now))
+
+        @staticmethod
+        def apply(rows) -> None:
+            for id_, cache_name, key in rows:
+                cache_ = BotDBUtil.CacheSync.caches.get(cache_name)
+                if cache_ is not None:
+                    cache_.del_cache(key)
+                BotDBUtil.CacheSync.last_id = max(BotDBUtil.CacheSync.last_id, id_)
+
+        @staticmethod
+        def due() -> bool:
+            now = time.time()
+            if not cache or now - BotDBUtil.CacheSync.last_check < BotDBUtil.CacheSync.interval:
+                return False
+            BotDBUtil.CacheSync.last_check = now
+            return True
+
+        @staticmethod
+        @auto_rollback_error
+        def sync():
+            if not BotDBUtil.CacheSync.due():
+                return
+            if BotDBUtil.CacheSync.last_id is None:  # 启动时本地缓存为空，只需记录当前位置
+                BotDBUtil.CacheSync.last_id = session.query(func.max(CacheInvalidation.id)).scalar() or 0
+                session.commit()
+                return
+            rows = session.query(CacheInvalidation.id, CacheInvalidation.cacheName, CacheInvalidation.key).filter(
+                CacheInvalidation.id > BotDBUtil.CacheSync.last_id).all()
+            session.commit()  # 结束读事务，下次读取时才能看到其他进程新写入的记录
+            BotDBUtil.CacheSync.apply(rows)
+
+        @staticmethod
+        def stats() -> dict:
+            return {name: cache_.get_stats() for name, cache_ in BotDBUtil.CacheSync.caches.items()}
+
+    class Lease:
+        """
+        通过ScheduleLease表在各进程间选出计划任务的执行者。租约到期前只有持有者可以续期，到期后任何进程都可以取得
+        """
+
+        @staticmethod
+        @auto_rollback_error
+        def acquire(name: str, holder: str, ttl: float) -> bool:
+            """
+            取得或续期租约
+            :param name: 计划任务的名称
+            :param holder: 进程的标识
+            :param ttl: 租约的有效秒数
+            :return: 是否持有租约
+            """
+            now = datetime.datetime.now()
+            expires = now + datetime.timedelta(seconds=ttl)
+            updated = session.query(ScheduleLease).filter(
+                ScheduleLease.name == name,
+                or_(ScheduleLease.holder == holder, ScheduleLease.expires < now)).update(
+                {'holder': holder, 'expires': expires}, synchronize_session=False)
+            if not updated:
+                if session.query(ScheduleLease).filter_by(name=name).first() is not None:
+                    session.rollback()
+                    return False
+                session.add(ScheduleLease(name=name, holder=holder, expires=expires))
+            try:
+                session.commit()
+            except IntegrityError:  # 其他进程同时创建了租约
+                session.rollback()
+                return False
             return True
 
+        @staticmethod
+        @auto_rollback_error
+        def release(holder: str):
+            session.query(ScheduleLease).filter_by(holder=holder).delete()
+            session.commit()
+
+    class Outbox:
+        """
+        计划任务向所有对象推送的消息。执行任务的进程写入ScheduleOutbox，各进程读取其后新增的记录
+        """
+        retention = datetime.timedelta(days=1)
+        last_id = None
+
+        @staticmethod
+        @auto_rollback_error
+        def add(module_name: str, message: str):
+            now = datetime.datetime.now()
+            session.query(ScheduleOutbox).filter(
+                ScheduleOutbox.timestamp < now - BotDBUtil.Outbox.retention).delete()
+            session.add(ScheduleOutbox(moduleName=module_name, message=message, timestamp=now))
+            session.commit()
+
+        @staticmethod
+        @auto_rollback_error
+        def fetch() -> list:
+            """
+            返回上次读取后新增的(模块名, 消息)。首次调用时只记录当前位置，不会返回启动前的消息
+            """
+            if BotDBUtil.Outbox.last_id is None:
+                BotDBUtil.Outbox.last_id = session.query(func.max(ScheduleOutbox.id)).scalar() or 0
+                session.commit()
+                return []
+            rows = session.query(ScheduleOutbox.id, ScheduleOutbox.moduleName, ScheduleOutbox.message).filter(
+                ScheduleOutbox.id > BotDBUtil.Outbox.last_id).order_by(ScheduleOutbox.id).all()
+            session.commit()  # 结束读事务，下次读取时才能看到其他进程新写入的记录
+            if rows:
+                BotDBUtil.Outbox.last_id = rows[-1][0]
+            return [(module_name, message) for _, module_name, message in rows]
+
     class CoolDown:
         @retry(stop=stop_after_attempt(3))
         @auto_rollback_error
@@ -273,6 +477,71 @@ class BotDBUtil:
                 session.commit()
             return True
 
+    class Feed:
+        """
+        订阅源已推送过的条目。每个条目单独一行，判断与写入只涉及相关的行，开销不随历史记录的增长而增加
+        """
+        chunk_size = 500
+
+        def __init__(self, msg: Union[MessageSession, FetchTarget], name: str):
+            targetName = msg.target.clientName if isinstance(msg, MessageSession) else msg.name
+            self.feed = f'{targetName}|{name}'
+
+        @staticmethod
+        def hash(item: str) -> str:
+            return hashlib.sha1(item.encode('utf-8')).hexdigest()
+
+        @retry(stop=stop_after_attempt(3))
+        @auto_rollback_error
+        def new_items(self, items: list) -> list:
+            """
+            返回尚未记录的条目，保持原有顺序并去除重复
+            """
+            hashes = {}
+            for item in items:
+                hashes.setdefault(BotDBUtil.Feed.hash(item), item)
+            known = set()
+            keys = list(hashes)
+            for i in range(0, len(keys), BotDBUtil.Feed.chunk_size):
+                known.update(x for x, in session.query(FeedItem.itemHash).filter(
+                    FeedItem.feed == self.feed, FeedItem.itemHash.in_(keys[i:i + BotDBUtil.Feed.chunk_size])))
+            session.commit()
+            return [item for h, item in hashes.items() if h not in known]
+
+        @retry(stop=stop_after_attempt(3))
+        @auto_rollback_error
+        def add(self, items: list):
+            new = self.new_items(items)
+            if new:
+                now = datetime.datetime.now()
+                session.add_all([FeedItem(feed=self.feed, itemHash=BotDBUtil.Feed.hash(x), item=x, timestamp=now)
+                                 for x in new])
+                session.commit()
+
+        @auto_rollback_error
+        def empty(self) -> bool:
+            result = session.query(exists().where(FeedItem.feed == self.feed)).scalar()
+            session.commit()
+            return not result
+
+        @auto_rollback_error
+        def copy_from(self, other: 'BotDBUtil.Feed'):
+            now = datetime.datetime.now()
+            session.add_all([FeedItem(feed=self.feed, itemHash=h, item=x, timestamp=now) for h, x in
+                             session.query(FeedItem.itemHash, FeedItem.item).filter(FeedItem.feed == other.feed)])
+            session.commit()
+
+        @auto_rollback_error
+        def prune(self, days: float) -> int:
+            """
+            删除记录超过days天的条目
+            """
+            deleted = session.query(FeedItem).filter(
+                FeedItem.feed == self.feed,
+                FeedItem.timestamp < datetime.datetime.now() - datetime.timedelta(days=days)).delete()
+            session.commit()
+            return deleted
+
     class Options:
         def __init__(self, msg: Union[MessageSession, FetchTarget, str]):
             self.targetId = msg.target.targetId if isinstance(msg, (MessageSession, FetchTarget)) else msg
@@ -300,25 +569,131 @@ class BotDBUtil:
                 return value.get(k)
 
     class Analytics:
+        """
+        命令统计。记录先写入内存缓冲区，达到数量或时间阈值时批量写入，同时更新每小时的汇总表
+        """
+        buffer = []
+        last_flush = time.time()
+        buffer_size = int(Config('analytics_buffer_size') or 100)
+        buffer_limit = buffer_size * 10  # 数据库持续不可用时缓冲区的上限，超出后丢弃最早的记录
+        flush_interval = int(Config('analytics_flush_interval') or 60)
+
         def __init__(self, target: Union[MessageSession, FetchedSession]):
             self.target = target
 
-        @retry(stop=stop_after_attempt(3))
-        @auto_rollback_error
         def add(self, command, module_name, module_type):
-            session.add(AnalyticsData(targetId=self.target.target.targetId,
-                                      senderId=self.target.target.senderId,
-                                      command=command,
-                                      moduleName=module_name, moduleType=module_type))
+            BotDBUtil.Analytics.buffer.append(dict(targetId=self.target.target.targetId,
+                                                   senderId=self.target.target.senderId,
+                                                   command=command,
+                                                   moduleName=module_name, moduleType=module_type,
+                                                   timestamp=datetime.datetime.now()))
+            if len(BotDBUtil.Analytics.buffer) >= BotDBUtil.Analytics.buffer_size \
+                    or time.time() - BotDBUtil.Analytics.last_flush >= BotDBUtil.Analytics.flush_interval:
+                BotDBUtil.Analytics.flush()
+
+        @staticmethod
+        def flush() -> int:
+            """
+            将缓冲区中的记录写入数据库，返回写入的条数
+            """
+            BotDBUtil.Analytics.last_flush = time.time()
+            records = BotDBUtil.Analytics.buffer
+            if not records:
+                return 0
+            BotDBUtil.Analytics.buffer = []
+            try:
+                BotDBUtil.Analytics._write(records)
+            except Exception:
+                Logger.error(f'Failed to flush {len(records)} analytics records, will retry later.')
+                records += BotDBUtil.Analytics.buffer
+                dropped = len(records) - BotDBUtil.Analytics.buffer_limit
+                if dropped > 0:
+                    Logger.warn(f'The analytics buffer is full, dropping the {dropped} oldest records.')
+                    records = records[dropped:]
+                BotDBUtil.Analytics.buffer = records
+                return 0
+            return len(records)
+
+        @staticmethod
+        @retry(stop=stop_after_attempt(3), reraise=True)
+        @auto_rollback_error
+        def _write(records: list):
+            session.bulk_insert_mappings(AnalyticsData, records)
+            BotDBUtil.Analytics._merge_rollups(BotDBUtil.Analytics.rollup(records))
+            session.commit()
+
+        @staticmethod
+        def rollup(records) -> dict:
+            """
+            按小时与模块聚合统计记录
+            :param records: (时间, 模块名, 模块类型)或含有对应键的字典的列表
+            :return: {(整点时间, 模块名, 模块类型): 次数}
+            """
+            rollups = {}
+            for record in records:
+                if isinstance(record, dict):
+                    record = (record['timestamp'], record['moduleName'], record['moduleType'])
+                timestamp, module_name, module_type = record
+                key = (timestamp.replace(minute=0, second=0, microsecond=0), module_name, module_type)
+                rollups[key] = rollups.get(key, 0) + 1
+            return rollups
+
+        @staticmethod
+        def _merge_rollups(rollups: dict):
+            for (hour, module_name, module_type), count in rollups.items():
+                row = session.query(AnalyticsRollup).filter_by(hour=hour, moduleName=module_name,
+                                                               moduleType=module_type).first()
+                if row is None:
+                    session.add(AnalyticsRollup(hour=hour, moduleName=module_name, moduleType=module_type,
+                                                count=count))
+                else:
+                    row.count += count
+
+        @staticmethod
+        @retry(stop=stop_after_attempt(3), reraise=True)
+        @auto_rollback_error
+        def rebuild_rollup():
+            """
+            根据原始统计记录重建汇总表，用于启用汇总表前已存在的数据
+            """
+            BotDBUtil.Analytics.flush()
+            session.query(AnalyticsRollup).delete()
+            BotDBUtil.Analytics._merge_rollups(BotDBUtil.Analytics.rollup(session.query(
+                AnalyticsData.timestamp, AnalyticsData.moduleName, AnalyticsData.moduleType).yield_per(1000)))
             session.commit()
 
         @staticmethod
+        @auto_rollback_error
+        def get_rollup(since: datetime.datetime = None, module_name: str = None) -> dict:
+            """
+            返回各模块的命令次数汇总，结构为{(模块名, 模块类型): 次数}
+            """
+            BotDBUtil.Analytics.flush()
+            query = session.query(AnalyticsRollup.moduleName, AnalyticsRollup.moduleType,
+                                  func.sum(AnalyticsRollup.count))
+            if since is not None:
+                query = query.filter(AnalyticsRollup.hour >= since.replace(minute=0, second=0, microsecond=0))
+            if module_name is not None:
+                query = query.filter_by(moduleName=module_name)
+            return {(m, t): int(c) for m, t, c in query.group_by(AnalyticsRollup.moduleName,
+                                                                  AnalyticsRollup.moduleType)}
+
+        @staticmethod
+        @auto_rollback_error
         def get_count():
-            return session.query(AnalyticsData).count()
+            BotDBUtil.Analytics.flush()
+            count = session.query(func.sum(AnalyticsRollup.count)).scalar()
+            if count is None and session.query(AnalyticsData.id).first() is not None:
+                BotDBUtil.Analytics.rebuild_rollup()
+                count = session.query(func.sum(AnalyticsRollup.count)).scalar()
+            return int(count or 0)
 
         @staticmethod
         def get_first():
             return session.query(AnalyticsData).filter_by(id=1).first()
 
 
+atexit.register(BotDBUtil.Analytics.flush)  # 各平台的关闭流程中也会调用，进程被终止时不会执行atexit
+
+
 __all__ = ["BotDBUtil", "auto_rollback_error", "session"]
@@ -0,0 +1,452 @@
+'''BotDBUtil的异步版本。
+
+方法与BotDBUtil一致，但所有数据库操作均为协程，通过AsyncDB的连接池执行，不会阻塞事件循环。
+需要查询数据库才能完成初始化的对象须先await，如：
+    module = await AsyncBotDBUtil.Module(msg)
+    enabled = module.check_target_enabled_module_list()
+模块的数据库工具（WikiTargetInfo等）可使用async_session()逐步迁移到此后端。'''
+import datetime
+import time
+from typing import Union
+
+import ujson as json
+from sqlalchemy import select, exists, delete, func
+from tenacity import retry, stop_after_attempt
+
+from core.elements.message import MessageSession, FetchTarget, FetchedSession
+from core.elements.temp import EnabledModulesCache, SenderInfoCache
+from core.logger import Logger
+from database import BotDBUtil, Dict2Object, cache
+from database.orm import AsyncDB
+from database.tables import *
+from database.tables import AnalyticsData, AnalyticsRollup, CacheInvalidation
+
+
+def async_session():
+    """
+    返回一个新的异步会话，用法：
+        async with async_session() as session:
+            async with session.begin():
+                ...
+    在begin()块内发生异常时会自动回滚
+    """
+    return AsyncDB.session
+
+
+async def sync_cache():
+    """
+    BotDBUtil.CacheSync.sync的异步版本
+    """
+    if not BotDBUtil.CacheSync.due():
+        return
+    async with async_session() as session:
+        if BotDBUtil.CacheSync.last_id is None:
+            BotDBUtil.CacheSync.last_id = (await session.execute(select(func.max(CacheInvalidation.id)))).scalar() or 0
+            return
+        BotDBUtil.CacheSync.apply((await session.execute(
+            select(CacheInvalidation.id, CacheInvalidation.cacheName, CacheInvalidation.key)
+            .filter(CacheInvalidation.id > BotDBUtil.CacheSync.last_id))).all())
+
+
+async def invalidate_cache(session, cache_name: str, key: str):
+    """
+    在异步会话中记录一条缓存失效信息，随该会话的事务一同提交
+    """
+    if not cache:
+        return
+    now = datetime.datetime.now()
+    await session.execute(delete(CacheInvalidation).filter(
+        CacheInvalidation.timestamp < now - BotDBUtil.CacheSync.retention))
+    session.add(CacheInvalidation(cacheName=cache_name, key=key, timestamp=now))
+
+
+class _Awaitable:
+    """
+    需要先查询数据库的对象，await后返回自身
+    """
+
+    async def load(self):
+        ...
+
+    def __await__(self):
+        return self._load_and_return().__await__()
+
+    async def _load_and_return(self):
+        await self.load()
+        return self
+
+
+class AsyncBotDBUtil:
+    database_version = BotDBUtil.database_version
+
+    class Module(_Awaitable):
+        def __init__(self, msg: [MessageSession, str]):
+            if isinstance(msg, MessageSession):
+                self.targetId = str(msg.target.targetId)
+            else:
+                self.targetId = msg
+            self.need_insert = False
+            self.enable_modules_list = []
+
+        @retry(stop=stop_after_attempt(3), reraise=True)
+        async def load(self):
+            await sync_cache()
+            cached = EnabledModulesCache.get_cache(self.targetId) if cache else False
+            if cached:
+                self.enable_modules_list = cached
+                return
+            query = await self.query_EnabledModules()
+            if query is None:
+                self.need_insert = True
+                self.enable_modules_list = []
+            else:
+                self.enable_modules_list = json.loads(query.enabledModules)
+            if cache:
+                EnabledModulesCache.add_cache(self.targetId, self.enable_modules_list)
+
+        async def query_EnabledModules(self):
+            async with async_session() as session:
+                return (await session.execute(select(EnabledModules)
+                                              .filter_by(targetId=self.targetId))).scalars().first()
+
+        def check_target_enabled_module_list(self) -> list:
+            return self.enable_modules_list
+
+        def check_target_enabled_module(self, module_name) -> bool:
+            return True if module_name in self.enable_modules_list else False
+
+        async def _save(self):
+            value = json.dumps(self.enable_modules_list)
+            async with async_session() as session:
+                async with session.begin():
+                    query = (await session.execute(select(EnabledModules)
+                                                   .filter_by(targetId=self.targetId))).scalars().first()
+                    if query is None:
+                        session.add(EnabledModules(targetId=self.targetId, enabledModules=value))
+                    else:
+                        query.enabledModules = value
+                    await session.execute(delete(TargetEnabledModule).filter_by(targetId=self.targetId))
+                    session.add_all([TargetEnabledModule(targetId=self.targetId, moduleName=x)
+                                     for x in dict.fromkeys(self.enable_modules_list)])
+                    await invalidate_cache(session, 'EnabledModules', self.targetId)
+            self.need_insert = False
+            if cache:
+                EnabledModulesCache.add_cache(self.targetId, self.enable_modules_list)
+
+        @retry(stop=stop_after_attempt(3), reraise=True)
+        async def enable(self, module_name) -> bool:
+            if isinstance(module_name, str):
+                module_name = [module_name]
+            for x in module_name:
+                if x not in self.enable_modules_list:
+                    self.enable_modules_list.append(x)
+            await self._save()
+            return True
+
+        @retry(stop=stop_after_attempt(3), reraise=True)
+        async def disable(self, module_name) -> bool:
+            if isinstance(module_name, str):
+                module_name = [module_name]
+            for x in module_name:
+                if x in self.enable_modules_list:
+                    self.enable_modules_list.remove(x)
+            if not self.need_insert:
+                await self._save()
+            return True
+
+        @staticmethod
+        @retry(stop=stop_after_attempt(3), reraise=True)
+        async def get_enabled_this(module_name):
+            async with async_session() as session:
+                return list((await session.execute(select(TargetEnabledModule.targetId)
+                                                   .filter_by(moduleName=module_name))).scalars())
+
+    class SenderInfo(_Awaitable):
+        def __init__(self, senderId, query: dict = None):
+            self.senderId = senderId
+            self.target_admin_cache = {}
+            self.query = Dict2Object(query) if query is not None else None
+
+        @retry(stop=stop_after_attempt(3), reraise=True)
+        async def load(self):
+            if self.query is not None:
+                return
+            await sync_cache()
+            query_cache = SenderInfoCache.get_cache(self.senderId) if cache else False
+            if query_cache:
+                self.query = Dict2Object(query_cache)
+                return
+            query = await self.query_SenderInfo()
+            if query is None:
+                async with async_session() as session:
+                    async with session.begin():
+                        session.add(SenderInfo(id=self.senderId))
+                query = await self.query_SenderInfo()
+            self.query = query
+            if cache:
+                SenderInfoCache.add_cache(self.senderId, BotDBUtil.SenderInfo.to_cache(query))
+
+        async def query_SenderInfo(self):
+            async with async_session() as session:
+                return (await session.execute(select(SenderInfo).filter_by(id=self.senderId))).scalars().first()
+
+        @retry(stop=stop_after_attempt(3), reraise=True)
+        async def edit(self, column: str, value):
+            async with async_session() as session:
+                async with session.begin():
+                    query = (await session.execute(select(SenderInfo)
+                                                   .filter_by(id=self.senderId))).scalars().first()
+                    setattr(query, column, value)
+                    await invalidate_cache(session, 'SenderInfo', self.senderId)
+            self.query = query
+            if cache:
+                SenderInfoCache.add_cache(self.senderId, BotDBUtil.SenderInfo.to_cache(query))
+            return True
+
+        @retry(stop=stop_after_attempt(3), reraise=True)
+        async def check_TargetAdmin(self, targetId):
+            if targetId in self.target_admin_cache:
+                return self.target_admin_cache[targetId]
+            query = await self.query_TargetAdmin(targetId)
+            if query is not None:
+                return query
+            return False
+
+        async def query_TargetAdmin(self, targetId):
+            async with async_session() as session:
+                return (await session.execute(select(TargetAdmin).filter_by(senderId=self.senderId,
+                                                                            targetId=targetId))).scalars().first()
+
+        @retry(stop=stop_after_attempt(3), reraise=True)
+        async def add_TargetAdmin(self, targetId):
+            if not await self.check_TargetAdmin(targetId):
+                async with async_session() as session:
+                    async with session.begin():
+                        session.add(TargetAdmin(senderId=self.senderId, targetId=targetId))
+            self.target_admin_cache.pop(targetId, None)
+            return True
+
+        @retry(stop=stop_after_attempt(3), reraise=True)
+        async def remove_TargetAdmin(self, targetId):
+            async with async_session() as session:
+                async with session.begin():
+                    await session.execute(delete(TargetAdmin).filter_by(senderId=self.senderId, targetId=targetId))
+            self.target_admin_cache.pop(targetId, None)
+            return True
+
+    class RequestContext(_Awaitable):
+        """
+        BotDBUtil.RequestContext的异步版本
+        """
+        sender_columns = ['id', 'isInBlockList', 'isInAllowList', 'isSuperUser', 'warns', 'disable_typing']
+
+        def __init__(self, msg: MessageSession):
+            self.targetId = str(msg.target.targetId)
+            self.senderId = msg.target.senderId
+            self.is_muted = False
+            self.is_target_admin = False
+            self.options = {}
+            self.enabled_modules = frozenset()
+            self.sender_info = None
+
+        @retry(stop=stop_after_attempt(3), reraise=True)
+        async def load(self):
+            await sync_cache()
+            sender_cache = SenderInfoCache.get_cache(self.senderId) if cache else False
+            modules_cache = EnabledModulesCache.get_cache(self.targetId) if cache else False
+            columns = [exists().where(MuteList.targetId == self.targetId),
+                       exists().where(TargetAdmin.senderId == self.senderId, TargetAdmin.targetId == self.targetId),
+                       select(TargetOptions.options).where(TargetOptions.targetId == self.targetId)
+                       .scalar_subquery()]
+            if not modules_cache:
+                columns.append(select(EnabledModules.enabledModules).where(EnabledModules.targetId == self.targetId)
+                               .scalar_subquery())
+            if not sender_cache:
+                for column in self.sender_columns:
+                    columns.append(select(getattr(SenderInfo, column)).where(SenderInfo.id == self.senderId)
+                                   .scalar_subquery())
+            async with async_session() as session:
+                row = list((await session.execute(select(*columns))).one())
+            self.is_muted = bool(row[0])
+            self.is_target_admin = bool(row[1])
+            self.options = json.loads(row[2]) if row[2] is not None else {}
+            if not modules_cache:
+                modules_cache = json.loads(row[3]) if row[3] is not None else []
+                if cache:
+                    EnabledModulesCache.add_cache(self.targetId, modules_cache)
+            self.enabled_modules = frozenset(modules_cache)
+            if not sender_cache:
+                sender_cache = dict(zip(self.sender_columns, row[-len(self.sender_columns):]))
+                if sender_cache['id'] is None:
+                    self.sender_info = await AsyncBotDBUtil.SenderInfo(self.senderId)
+                    sender_cache = None
+                elif cache:
+                    SenderInfoCache.add_cache(self.senderId, sender_cache)
+            if sender_cache is not None:
+                self.sender_info = AsyncBotDBUtil.SenderInfo(self.senderId, query=sender_cache)
+            self.sender_info.target_admin_cache[self.targetId] = self.is_target_admin
+
+    class CoolDown(_Awaitable):
+        def __init__(self, msg: MessageSession, name):
+            self.msg = msg
+            self.name = name
+            self.query = None
+            self.need_insert = True
+
+        @retry(stop=stop_after_attempt(3), reraise=True)
+        async def load(self):
+            async with async_session() as session:
+                self.query = (await session.execute(select(CommandTriggerTime).filter_by(
+                    targetId=str(self.msg.target.senderId), commandName=self.name))).scalars().first()
+            self.need_insert = True if self.query is None else False
+
+        def check(self, delay):
+            if not self.need_insert:
+                now = datetime.datetime.now().timestamp() - self.query.timestamp.timestamp()
+                if now > delay:
+                    return 0
+                return now
+            return 0
+
+        @retry(stop=stop_after_attempt(3), reraise=True)
+        async def reset(self):
+            async with async_session() as session:
+                async with session.begin():
+                    if not self.need_insert:
+                        await session.execute(delete(CommandTriggerTime).filter_by(
+                            targetId=str(self.msg.target.senderId), commandName=self.name))
+                    session.add(CommandTriggerTime(targetId=self.msg.target.senderId, commandName=self.name))
+
+    @staticmethod
+    @retry(stop=stop_after_attempt(3), reraise=True)
+    async def isGroupInAllowList(targetId):
+        async with async_session() as session:
+            query = (await session.execute(select(GroupAllowList).filter_by(targetId=targetId))).scalars().first()
+            return True if query is not None else False
+
+    class Muting(_Awaitable):
+        def __init__(self, msg: MessageSession):
+            self.msg = msg
+            self.targetId = msg.target.targetId
+            self.query = None
+
+        @retry(stop=stop_after_attempt(3), reraise=True)
+        async def load(self):
+            async with async_session() as session:
+                self.query = (await session.execute(select(MuteList)
+                                                    .filter_by(targetId=self.targetId))).scalars().first()
+
+        def check(self):
+            return True if self.query is not None else False
+
+        @retry(stop=stop_after_attempt(3), reraise=True)
+        async def add(self):
+            async with async_session() as session:
+                async with session.begin():
+                    session.add(MuteList(targetId=self.targetId))
+
+        @retry(stop=stop_after_attempt(3), reraise=True)
+        async def remove(self):
+            if self.query is not None:
+                async with async_session() as session:
+                    async with session.begin():
+                        await session.execute(delete(MuteList).filter_by(targetId=self.targetId))
+
+    class Data:
+        def __init__(self, msg: Union[MessageSession, FetchTarget]):
+            self.targetName = msg.target.clientName if isinstance(msg, MessageSession) else msg.name
+
+        @retry(stop=stop_after_attempt(3), reraise=True)
+        async def add(self, name, value: str):
+            async with async_session() as session:
+                async with session.begin():
+                    session.add(StoredData(name=f'{self.targetName}|{name}', value=value))
+
+        @retry(stop=stop_after_attempt(3), reraise=True)
+        async def get(self, name):
+            async with async_session() as session:
+                return (await session.execute(select(StoredData)
+                                              .filter_by(name=f'{self.targetName}|{name}'))).scalars().first()
+
+        @retry(stop=stop_after_attempt(3), reraise=True)
+        async def update(self, name, value: str):
+            async with async_session() as session:
+                async with session.begin():
+                    exists_ = (await session.execute(select(StoredData)
+                                                     .filter_by(name=f'{self.targetName}|{name}'))).scalars().first()
+                    if exists_ is None:
+                        session.add(StoredData(name=f'{self.targetName}|{name}', value=value))
+                    else:
+                        exists_.value = value
+            return True
+
+    class Options:
+        def __init__(self, msg: Union[MessageSession, FetchTarget, str]):
+            self.targetId = msg.target.targetId if isinstance(msg, (MessageSession, FetchTarget)) else msg
+
+        @retry(stop=stop_after_attempt(3), reraise=True)
+        async def edit(self, k, v):
+            async with async_session() as session:
+                async with session.begin():
+                    get_ = (await session.execute(select(TargetOptions)
+                                                  .filter_by(targetId=self.targetId))).scalars().first()
+                    if get_ is None:
+                        session.add(TargetOptions(targetId=self.targetId, options=json.dumps({k: v})))
+                    else:
+                        get_.options = json.dumps({**json.loads(get_.options), k: v})
+
+        @retry(stop=stop_after_attempt(3), reraise=True)
+        async def get(self, k=None):
+            async with async_session() as session:
+                query = (await session.execute(select(TargetOptions)
+                                               .filter_by(targetId=self.targetId))).scalars().first()
+            if query is None:
+                return {}
+            value: dict = json.loads(query.options)
+            if k is None:
+                return value
+            else:
+                return value.get(k)
+
+    class Analytics:
+        """
+        与BotDBUtil.Analytics共用同一个内存缓冲区，由达到阈值的一方负责写入
+        """
+
+        def __init__(self, target: Union[MessageSession, FetchedSession]):
+            self.target = target
+
+        async def add(self, command, module_name, module_type):
+            BotDBUtil.Analytics.buffer.append(dict(targetId=self.target.target.targetId,
+                                                   senderId=self.target.target.senderId,
+                                                   command=command,
+                                                   moduleName=module_name, moduleType=module_type,
+                                                   timestamp=datetime.datetime.now()))
+            if len(BotDBUtil.Analytics.buffer) >= BotDBUtil.Analytics.buffer_size \
+                    or time.time() - BotDBUtil.Analytics.last_flush >= BotDBUtil.Analytics.flush_interval:
+                await AsyncBotDBUtil.Analytics.flush()
+
+        @staticmethod
+        async def flush() -> int:
+            """
+            与BotDBUtil.Analytics.flush使用同一写入路径。两个会话同时更新同一行汇总记录会丢失计数，
+            因此缓冲区只由同步版本在事件循环的线程中写入
+            """
+            return BotDBUtil.Analytics.flush()
+
+        @staticmethod
+        async def get_count():
+            await AsyncBotDBUtil.Analytics.flush()
+            async with async_session() as session:
+                count = (await session.execute(select(func.sum(AnalyticsRollup.count)))).scalar()
+            if count is None:
+                return BotDBUtil.Analytics.get_count()  # 汇总表为空时由同步版本负责重建
+            return int(count)
+
+        @staticmethod
+        async def get_first():
+            async with async_session() as session:
+                return (await session.execute(select(AnalyticsData).filter_by(id=1))).scalars().first()
+
+
+__all__ = ["AsyncBotDBUtil", "async_session", "sync_cache"]
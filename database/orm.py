@@ -1,4 +1,5 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
 
 from config import Config
@@ -22,4 +23,50 @@ class DBSession:
         Base.metadata.create_all(bind=self.engine, checkfirst=True)
 
 
+class AsyncDBSession:
+    """
+    与DBSession指向同一数据库的异步引擎，首次使用时才创建，因此未安装异步驱动时不影响同步接口
+    """
+    async_drivers = {'sqlite': 'sqlite+aiosqlite', 'mysql': 'mysql+aiomysql'}
+
+    def __init__(self):
+        self._engine = None
+        self._Session = None
+
+    @property
+    def async_link(self) -> str:
+        url = make_url(DB_LINK)
+        backend = url.get_backend_name()
+        if backend not in self.async_drivers:
+            raise ValueError(f'No async driver configured for database backend "{backend}"')
+        return url.set(drivername=self.async_drivers[backend]).render_as_string(hide_password=False)
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from sqlalchemy.ext.asyncio import create_async_engine
+            link = self.async_link
+            if link.startswith('sqlite'):
+                self._engine = create_async_engine(link)
+            else:
+                self._engine = create_async_engine(link, pool_size=10, max_overflow=20, pool_recycle=3600,
+                                                   pool_pre_ping=True)
+        return self._engine
+
+    @property
+    def session(self):
+        """
+        返回一个新的AsyncSession，应使用async with语句并在单个操作后关闭，不要在并发任务间共用
+        """
+        if self._Session is None:
+            from sqlalchemy.ext.asyncio import AsyncSession
+            self._Session = sessionmaker(bind=self.engine, class_=AsyncSession, expire_on_commit=False)
+        return self._Session()
+
+    async def dispose(self):
+        if self._engine is not None:
+            await self._engine.dispose()
+
+
 Session = DBSession()
+AsyncDB = AsyncDBSession()
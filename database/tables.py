@@ -15,6 +15,13 @@ class EnabledModules(Base):
     enabledModules = Column(Text)
 
 
+class TargetEnabledModule(Base):
+    """已打开的模块的索引，每行对应一个对象的一个模块"""
+    __tablename__ = "TargetEnabledModule"
+    targetId = Column(String(512), primary_key=True)
+    moduleName = Column(String(255), primary_key=True, index=True)
+
+
 class SenderInfo(Base):
     """发送者信息"""
     __tablename__ = "SenderInfo"
@@ -79,11 +86,55 @@ class AnalyticsData(Base):
     timestamp = Column(TIMESTAMP, default=text('CURRENT_TIMESTAMP'))
 
 
+class AnalyticsRollup(Base):
+    """命令统计的每小时汇总"""
+    __tablename__ = "AnalyticsRollup"
+    hour = Column(TIMESTAMP, primary_key=True)
+    moduleName = Column(String(255), primary_key=True)  # 主键总长度需在InnoDB的3072字节限制内（utf8mb4下每字符4字节）
+    moduleType = Column(String(32), primary_key=True)
+    count = Column(Integer, default=0)
+
+
+class FeedItem(Base):
+    """订阅源已推送过的条目，以条目的sha1作为主键的一部分，避免条目过长时无法建立索引"""
+    __tablename__ = "FeedItem"
+    feed = Column(String(512), primary_key=True)
+    itemHash = Column(String(40), primary_key=True)
+    item = Column(Text)
+    timestamp = Column(TIMESTAMP, default=text('CURRENT_TIMESTAMP'), index=True)
+
+
+class CacheInvalidation(Base):
+    """缓存失效记录，各进程据此清除本地缓存中的对应条目"""
+    __tablename__ = "CacheInvalidation"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    cacheName = Column(String(512))
+    key = Column(String(512))
+    timestamp = Column(TIMESTAMP, default=text('CURRENT_TIMESTAMP'))
+
+
+class ScheduleLease(Base):
+    """计划任务的租约，由持有者所在的进程执行该任务"""
+    __tablename__ = "ScheduleLease"
+    name = Column(String(512), primary_key=True)
+    holder = Column(String(512))
+    expires = Column(TIMESTAMP)
+
+
+class ScheduleOutbox(Base):
+    """计划任务推送的消息，各平台的进程读取后发送给本平台的对象"""
+    __tablename__ = "ScheduleOutbox"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    moduleName = Column(String(512))
+    message = Column(LONGTEXT if Config('db_path').startswith('mysql') else Text)
+    timestamp = Column(TIMESTAMP, default=text('CURRENT_TIMESTAMP'))
+
+
 class DBVersion(Base):
     __tablename__ = "DBVersion"
     value = Column(String(512), primary_key=True)
 
 
 Session.create()
-__all__ = ["EnabledModules", "TargetAdmin", "SenderInfo", "TargetOptions", "CommandTriggerTime", "GroupAllowList",
-           "StoredData", "DBVersion", "MuteList"]
+__all__ = ["EnabledModules", "TargetEnabledModule", "TargetAdmin", "SenderInfo", "TargetOptions", "CommandTriggerTime", "GroupAllowList",
+           "StoredData", "DBVersion", "MuteList", "CacheInvalidation", "ScheduleLease", "ScheduleOutbox", "FeedItem"]
@@ -1,12 +1,80 @@
-from database.orm import Session
-from database.tables import EnabledModules
 import ujson as json
 
+from core.logger import Logger
+from database import BotDBUtil
+from database.orm import Session
+from database.tables import EnabledModules, TargetEnabledModule, DBVersion, StoredData, FeedItem
 
 session = Session.session
 
-q = session.query(EnabledModules).all()
-for x in q:
-    x.enabledModules = json.dumps(x.enabledModules.split('|'))
+
+def convert_legacy_enabled_modules():
+    """
+    将以“|”分隔的旧版已打开模块列表转换为JSON，仅用于手动迁移非常早期的数据库
+    """
+    q = session.query(EnabledModules).all()
+    for x in q:
+        x.enabledModules = json.dumps(x.enabledModules.split('|'))
+        session.commit()
+
+
+def build_enabled_modules_index():
+    """
+    根据EnabledModules中的JSON列表生成TargetEnabledModule索引
+    """
+    session.query(TargetEnabledModule).delete()
+    for x in session.query(EnabledModules).yield_per(1000):
+        try:
+            modules = json.loads(x.enabledModules)
+        except ValueError:
+            Logger.warn(f'Skipping malformed enabled modules list of {x.targetId}.')
+            continue
+        session.add_all([TargetEnabledModule(targetId=x.targetId, moduleName=m) for m in dict.fromkeys(modules)])
     session.commit()
 
+
+feed_names = ['mcv_rss', 'mcbv_rss', 'mcv_jira_rss', 'mcbv_jira_rss', 'mcdv_jira_rss', 'mcnews', 'mcfeedbacknews']
+
+
+def migrate_stored_lists():
+    """
+    将StoredData中以JSON列表保存的订阅源记录逐条写入FeedItem。只迁移已改用FeedState的订阅源，原记录保留，以便回退到旧版本
+    """
+    session.query(FeedItem).delete()
+    for x in session.query(StoredData).all():
+        if x.name.rsplit('|', 1)[-1] not in feed_names:
+            continue
+        try:
+            items = json.loads(x.value)
+        except ValueError:
+            continue
+        if not isinstance(items, list) or not all(isinstance(i, str) for i in items):
+            continue
+        hashes = {BotDBUtil.Feed.hash(i): i for i in items}
+        session.add_all([FeedItem(feed=x.name, itemHash=h, item=i) for h, i in hashes.items()])
+    session.commit()
+
+
+migrations = {2: build_enabled_modules_index, 3: migrate_stored_lists}
+
+
+def update_database():
+    """
+    按DBVersion记录的版本依次执行尚未执行的迁移
+    """
+    query_dbver = session.query(DBVersion).first()
+    if query_dbver is None:
+        query_dbver = DBVersion(value='1')
+        session.add(query_dbver)
+        session.commit()
+    version = int(query_dbver.value)
+    for target_version in range(version + 1, BotDBUtil.database_version + 1):
+        Logger.info(f'Updating database to version {target_version}...')
+        migrations[target_version]()
+        session.query(DBVersion).delete()
+        session.add(DBVersion(value=str(target_version)))
+        session.commit()
+
+
+if __name__ == '__main__':
+    update_database()
@@ -0,0 +1,207 @@
+'''parser()的吞吐量基准测试。
+
+使用core.console.template.Template构造大量来自不同对象与发送者的消息并发送入parser()，消息混合了命令、会触发正则模块的聊天内容与“&&”并行命令。
+测试使用仅在本进程中注册的bench模块，不会访问任何外部API；发送消息被替换为空操作（可用--send-latency模拟平台的发送延迟）。
+结束后输出每秒处理的消息数、延迟分位数与事件循环的延迟，相同参数与随机种子下消息序列保持一致，可作为性能基线。
+测试会读写配置中的数据库，并在结束后清除bench对象的数据。
+用法：python example/parser_benchmark.py [--messages 5000] [--targets 200] [--senders 500] [--concurrency 100] [--seed 0]'''
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.chdir(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.elements import MsgInfo, AutoSession, PrivateAssets, FinishedSession
+from core.console.template import Template
+
+PrivateAssets.set(tempfile.mkdtemp(prefix='akaribot-bench-'))  # init()会向其中写入版本信息，避免污染assets
+
+from core.component import on_command, on_regex
+from core.logger import Logger
+from core.metrics import Metrics, timed
+from core.parser import message as message_parser
+from core.utils import init
+from database import BotDBUtil, session
+from database.tables import CacheInvalidation, EnabledModules, SenderInfo, TargetEnabledModule
+
+TARGET_FROM = 'BENCH|Group'
+SENDER_FROM = 'BENCH'
+
+chat_messages = ['今天天气不错，大家晚上一起打游戏吗',
+                 '有没有人知道这个东西怎么合成啊？',
+                 'hhhhhhhhhhhhh',
+                 '刚刚下班，累死了，明天还要早起',
+                 '这张图好好看，求原图',
+                 '[[海晶石]]是什么',
+                 '{{Template}}怎么用']
+
+
+class BenchSession(Template):
+    send_latency = 0
+
+    @timed('send')
+    async def sendMessage(self, msgchain, quote=True, disable_secret_check=False):
+        self.sent.append(msgchain)
+        if BenchSession.send_latency:
+            await asyncio.sleep(BenchSession.send_latency)
+        return FinishedSession([0], [])
+
+    def checkSuperUser(self):
+        return bool(self.target.senderInfo.query.isSuperUser)
+
+    class Typing:
+        def __init__(self, msg):
+            self.msg = msg
+
+        async def __aenter__(self):
+            pass
+
+        async def __aexit__(self, exc_type, exc_val, exc_tb):
+            pass
+
+
+def register_bench_modules():
+    bench = on_command('bench', desc='基准测试用的模块。')
+
+    @bench.handle('echo <text> {返回输入的内容}')
+    async def _(msg):
+        await msg.finish(msg.parsed_msg['<text>'])
+
+    @bench.handle('sum <a> <b> {计算两数之和}')
+    async def _(msg):
+        await msg.finish(str(int(msg.parsed_msg['<a>']) + int(msg.parsed_msg['<b>'])))
+
+    @bench.handle('sleep <ms> {等待一段时间后返回，用于模拟访问外部API}')
+    async def _(msg):
+        await asyncio.sleep(int(msg.parsed_msg['<ms>']) / 1000)
+        await msg.finish('done')
+
+    bench_regex = on_regex('bench_regex', desc='基准测试用的正则模块。')
+
+    @bench_regex.handle(r'#bench(\d+)')
+    async def _(msg):
+        await msg.finish(msg.matched_msg.group(1))
+
+
+def generate_messages(rng: random.Random, count: int, targets: int, senders: int):
+    messages = []
+    for _ in range(count):
+        target = f'{TARGET_FROM}|{rng.randrange(targets)}'
+        sender = f'{SENDER_FROM}|{rng.randrange(senders)}'
+        roll = rng.random()
+        if roll < 0.45:
+            text = rng.choice(chat_messages)
+        elif roll < 0.55:
+            text = f'{rng.choice(chat_messages)} #bench{rng.randrange(1000)}'
+        elif roll < 0.75:
+            text = f'~bench echo {rng.randrange(1000)}'
+        elif roll < 0.85:
+            text = f'~bench sum {rng.randrange(1000)} {rng.randrange(1000)}'
+        elif roll < 0.9:
+            text = f'~bench sleep {rng.randrange(5, 50)}'
+        else:
+            text = f'~bench echo {rng.randrange(1000)} && ~bench sum 1 2 && ~bench sleep {rng.randrange(5, 50)}'
+        messages.append((target, sender, text))
+    return messages
+
+
+def build_session(target: str, sender: str, text: str) -> BenchSession:
+    return BenchSession(target=MsgInfo(targetId=target, senderId=sender, senderName='', targetFrom=TARGET_FROM,
+                                       senderFrom=SENDER_FROM, clientName='BENCH', messageId=0, replyId=None),
+                        session=AutoSession(message=text, target=target, sender=sender, auto_interactions=[]))
+
+
+async def measure_loop_lag(lags: list, stop: asyncio.Event, interval: float = 0.01):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    messages = generate_messages(rng, args.messages, args.targets, args.senders)
+    for i in range(args.targets):
+        BotDBUtil.Module(f'{TARGET_FROM}|{i}').enable(['bench', 'bench_regex'])
+    for target, sender, text in messages[:args.warmup]:
+        await message_parser.parser(build_session(target, sender, text))
+    Metrics.reset()
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    lags = []
+    stop = asyncio.Event()
+
+    async def handle(target, sender, text):
+        async with semaphore:
+            start = time.perf_counter()
+            await message_parser.parser(build_session(target, sender, text))
+            latencies.append(time.perf_counter() - start)
+
+    lag_task = asyncio.ensure_future(measure_loop_lag(lags, stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(handle(*m) for m in messages))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await lag_task
+
+    print(f'messages: {len(messages)}  targets: {args.targets}  senders: {args.senders}  '
+          f'concurrency: {args.concurrency}  seed: {args.seed}')
+    print(f'throughput: {len(messages) / elapsed:.1f} msg/s ({elapsed:.2f}s)')
+    print(f'latency: p50 {percentile(latencies, 0.5) * 1000:.2f}ms  p95 {percentile(latencies, 0.95) * 1000:.2f}ms  '
+          f'p99 {percentile(latencies, 0.99) * 1000:.2f}ms  max {max(latencies) * 1000:.2f}ms')
+    print(f'event loop lag: p50 {percentile(lags, 0.5) * 1000:.2f}ms  p99 {percentile(lags, 0.99) * 1000:.2f}ms  '
+          f'max {max(lags, default=0) * 1000:.2f}ms')
+    print('stages (p99):')
+    for stage, module, platform, count, mean, p50, p99 in Metrics.summary():
+        print(f'  {"/".join(x for x in (stage, module) if x):<24} {count:>7} mean {mean * 1000:.2f}ms '
+              f'p50 {p50 * 1000:.2f}ms p99 {p99 * 1000:.2f}ms')
+
+
+def cleanup():
+    BotDBUtil.Analytics.buffer.clear()
+    session.query(EnabledModules).filter(EnabledModules.targetId.like(f'{TARGET_FROM}|%')).delete(
+        synchronize_session=False)
+    session.query(TargetEnabledModule).filter(TargetEnabledModule.targetId.like(f'{TARGET_FROM}|%')).delete(
+        synchronize_session=False)
+    session.query(SenderInfo).filter(SenderInfo.id.like(f'{SENDER_FROM}|%')).delete(synchronize_session=False)
+    # 失效记录的键为对象或发送者的ID，两者均以SENDER_FROM开头
+    session.query(CacheInvalidation).filter(CacheInvalidation.key.like(f'{SENDER_FROM}|%')).delete(
+        synchronize_session=False)
+    session.commit()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='parser()的吞吐量基准测试')
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--targets', type=int, default=200)
+    parser.add_argument('--senders', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=100, help='同时处理的消息数')
+    parser.add_argument('--warmup', type=int, default=200, help='正式计时前预先处理的消息数')
+    parser.add_argument('--send-latency', type=float, default=0, help='模拟的发送延迟（毫秒）')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    Logger.log.remove()  # 逐条消息的日志会显著影响结果
+    # 滥用检测与命令统计会因大量的测试消息而触发或写入数据库，测试时关闭
+    message_parser.enable_tos = False
+    message_parser.enable_analytics = False
+    BenchSession.send_latency = args.send_latency / 1000
+    init()
+    register_bench_modules()
+    try:
+        asyncio.run(run(args))
+    finally:
+        cleanup()
@@ -0,0 +1,76 @@
+'''正则模块分发的微基准测试。
+
+对比逐一使用未编译的表达式匹配（旧实现）与RegexDispatcher的单条消息耗时，观察其随正则模块数量增长的变化。
+用法：python example/regex_benchmark.py [消息条数]'''
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.chdir(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.elements import RegexCommand
+from core.elements.module.component_meta import RegexMeta
+from core.parser.regex import RegexDispatcher, extract_prefilter
+
+patterns = [(r'\[\[(.*?)]]', 'A', re.I),
+            (r'\{\{(.*?)}}', 'A', re.I),
+            (r'≺(.*?)≻|⧼(.*?)⧽', 'A', re.I),
+            (r'随个((?:dx|sd|标准))?([绿黄红紫白]?)([0-9]+\+?)', 'M', 0),
+            (r'.*maimai.*什么', 'M', 0),
+            (r'查歌(.+)', 'M', 0),
+            (r'([绿黄红紫白]?)id([0-9]+)', 'M', 0),
+            (r'^\!(?:bug |)(.*)-(.*)', 'M', 0)]
+
+messages = ['今天天气不错，大家晚上一起打游戏吗',
+            '有没有人知道这个东西怎么合成啊？',
+            'hhhhhhhhhhhhh',
+            '刚刚下班，累死了，明天还要早起',
+            '[[海晶石]]是什么',
+            '随个紫13+',
+            '这张图好好看，求原图',
+            '!MC-4']
+
+
+def build_modules(count: int):
+    modules = {}
+    for i in range(count):
+        pattern, mode, flags = patterns[i % len(patterns)]
+        module = RegexCommand(bind_prefix=f'regex_{i}')
+        module.match_list.add(RegexMeta(pattern=pattern, mode=mode, flags=flags,
+                                        prefilter=extract_prefilter(pattern, flags)))
+        modules[module.bind_prefix] = module
+    return modules
+
+
+def legacy_dispatch(modules, text):
+    for regex in modules:
+        for rfunc in modules[regex].match_list.set:
+            if rfunc.mode.upper() in ['M', 'MATCH']:
+                re.match(rfunc.pattern, text, flags=rfunc.flags)
+            elif rfunc.mode.upper() in ['A', 'FINDALL']:
+                re.findall(rfunc.pattern, text, flags=rfunc.flags)
+
+
+def engine_dispatch(dispatcher: RegexDispatcher, text):
+    for _, _, rfuncs in dispatcher.candidates(text):
+        for rfunc in rfuncs:
+            dispatcher.match(rfunc, text)
+
+
+def measure(func, arg, rounds):
+    start = time.perf_counter()
+    for i in range(rounds):
+        func(arg, messages[i % len(messages)])
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+if __name__ == '__main__':
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f'{"modules":>8} {"legacy (us/msg)":>16} {"engine (us/msg)":>16} {"speedup":>8}')
+    for count in (8, 32, 128, 512):
+        modules_ = build_modules(count)
+        legacy = measure(legacy_dispatch, modules_, rounds)
+        engine = measure(engine_dispatch, RegexDispatcher(modules_), rounds)
+        print(f'{count:>8} {legacy:>16.2f} {engine:>16.2f} {legacy / engine:>7.1f}x')
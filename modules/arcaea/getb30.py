@@ -6,6 +6,7 @@ import aiohttp
 import ujson as json
 
 from config import Config
+from core.utils import render
 from .drawb30img import drawb30
 from .drawsongimg import dsimg
 from .errcode import errcode
@@ -64,8 +65,8 @@ async def getb30(usercode, official=False):
                         scores[x['song_id'] + difficulty] = score
                         if not os.path.exists(imgpath):
                             imgpath = f'{assets_path}/b30background_img{"_official" if official else ""}/random.jpg'
-                        dsimg(os.path.abspath(imgpath), d, trackname, x['difficulty'], score, ptt, realptt,
-                              x['perfect_count'], x['near_count'], x['miss_count'], x['time_played'], newdir)
+                        await render(dsimg, os.path.abspath(imgpath), d, trackname, x['difficulty'], score, ptt,
+                                     realptt, x['perfect_count'], x['near_count'], x['miss_count'], x['time_played'], newdir)
 
                     run_lst.append(draw_jacket(x, d))
                 await asyncio.gather(*run_lst)
@@ -89,7 +90,7 @@ async def getb30(usercode, official=False):
                 username = loadjson["content"]['account_info']['name']
                 ptt = int(loadjson["content"]['account_info']['rating']) / 100
                 character = loadjson["content"]['account_info']['character']
-                filename = drawb30(username, b30, r10, ptt, character, newdir, official=official)
+                filename = await render(drawb30, username, b30, r10, ptt, character, newdir, official=official)
                 filelist = os.listdir(newdir)
                 for x in filelist:
                     os.remove(f'{newdir}/{x}')
@@ -7,7 +7,7 @@ import traceback
 import uuid
 
 from config import Config
-from core.utils import get_url
+from core.utils import get_url, render
 from .drawb30img import drawb30
 from .drawsongimg import dsimg
 
@@ -98,8 +98,8 @@ async def getb30_official(usercode):
             scores[x['song_id'] + difficulty] = score
             if not os.path.exists(imgpath):
                 imgpath = f'{assets_path}/b30background_img_official/random.jpg'
-            dsimg(os.path.abspath(imgpath), d, trackname, x['difficulty'], score, ptt, realptt,
-                  x['pure_count'], x['far_count'], x['lost_count'], x['time_played'], newdir)
+            await render(dsimg, os.path.abspath(imgpath), d, trackname, x['difficulty'], score, ptt, realptt,
+                         x['pure_count'], x['far_count'], x['lost_count'], x['time_played'], newdir)
 
         run_lst.append(draw_jacket(x, d))
     await asyncio.gather(*run_lst)
@@ -123,7 +123,7 @@ async def getb30_official(usercode):
         last5list += f'[{last5rank}] {trackname}\n' \
                      f'[{last5rank}] {score} / {realptt / 10} -> {round(ptt, 4)}\n'
     print(last5list)
-    filename = drawb30(username, b30_avg, r10_avg, potential, 0, newdir, official=True)
+    filename = await render(drawb30, username, b30_avg, r10_avg, potential, 0, newdir, official=True)
     filelist = os.listdir(newdir)
     for x in filelist:
         os.remove(f'{newdir}/{x}')
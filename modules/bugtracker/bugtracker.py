@@ -18,7 +18,7 @@ async def bugtracker_get(MojiraID):
     ID = str.upper(MojiraID)
     json_url = 'https://bugs.mojang.com/rest/api/2/issue/' + ID
     get_json = await get_url(json_url)
-    get_spx = await get_url('https://bugs.guangyaostore.com/translations')
+    get_spx = await get_url('https://bugs.guangyaostore.com/translations', cache_ttl=300)
     if get_spx:
         spx = json.loads(get_spx)
         if ID in spx:
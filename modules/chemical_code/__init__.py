@@ -13,7 +13,7 @@ from datetime import datetime
 from core.component import on_command
 from core.elements import Image, Plain
 from core.builtins.message import MessageSession
-from core.utils import get_url, download_to_cache, random_cache_path
+from core.utils import get_url, download_to_cache, render
 from core.logger import Logger
 
 from PIL import Image as PILImage
@@ -25,6 +25,14 @@ special_id = ["22398", "140526", "4509317", "4509318", "4510681", "4510778", "45
               "4575371", "4885606", "4885717", "4886482", "4886484", "20473555", "21865276", "21865280"]
 
 
+def fill_background(path):  # 将透明背景的图片合并到白色背景上
+    with PILImage.open(path) as im:  # 打开下载的图片
+        im = im.convert("RGBA")  # 转换为 RGBA 格式
+        image = PILImage.new("RGBA", im.size, 'white')  # 创建新图片
+        image.alpha_composite(im, (0, 0))  # 将图片合并到新图片中
+    return image
+
+
 @retry(stop=stop_after_attempt(3), reraise=True)
 async def search_csr(id=None):  # 根据 ChemSpider 的 ID 查询 ChemSpider 的链接，留空（将会使用缺省值 None）则随机查询
     if id is not None:  # 如果传入了 ID，则使用 ID 查询
@@ -114,12 +122,7 @@ async def chemical_code(msg: MessageSession, id=None, captcha_mode=False):  # 
     if not download:
         download = await download_to_cache(csr['image'])  # 从结果中获取链接并下载图片
 
-    with PILImage.open(download) as im:  # 打开下载的图片
-        im = im.convert("RGBA")  # 转换为 RGBA 格式
-        image = PILImage.new("RGBA", im.size, 'white')  # 创建新图片
-        image.alpha_composite(im, (0, 0))  # 将图片合并到新图片中
-        newpath = random_cache_path() + '.png'  # 创建新文件名
-        image.save(newpath)  # 保存新图片
+    newpath = await render(fill_background, download, fmt='PNG')  # 在进程池中为图片填充白色背景并保存
 
     set_timeout = csr['length'] // 30
     if set_timeout < 2:
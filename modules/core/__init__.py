@@ -4,7 +4,7 @@ import platform
 import sys
 import time
 import traceback
-from datetime import datetime
+from datetime import datetime, timedelta
 
 import psutil
 import ujson as json
@@ -15,10 +15,17 @@ from core.component import on_command
 from core.builtins.message import MessageSession
 from core.elements import Command, PrivateAssets, Image, Plain, ExecutionLockList
 from core.loader import ModulesManager
+from core.metrics import Metrics, STAGES
 from core.parser.command import CommandParser, InvalidHelpDocTypeError
 from core.parser.message import remove_temp_ban
+from core.profiler import ImportProfiler
 from core.tos import pardon_user, warn_user
+from core.utils.cache import CacheManager
+from core.utils.circuitbreaker import CircuitBreaker
+from core.utils.http import HttpClient
+from core.utils.http_cache import HttpCache
 from core.utils.image_table import ImageTable, image_table_render, web_render
+from core.utils.singleflight import SingleFlight
 from database import BotDBUtil
 
 module = on_command('module',
@@ -482,6 +489,174 @@ async def _(msg: MessageSession):
     else:
         await msg.finish('机器人未开启命令统计功能。')
 
+
+@ana.handle('modules [<days>] {查看各模块的命令执行次数}')
+async def _(msg: MessageSession):
+    if Config('enable_analytics'):
+        days = msg.parsed_msg['<days>']
+        since = None
+        if days is not None:
+            if not days.isdigit():
+                await msg.finish('天数必须为正整数。')
+            since = datetime.now() - timedelta(days=int(days))
+        rollup = BotDBUtil.Analytics.get_rollup(since=since)
+        counts = {}
+        for (module_name, _), count in rollup.items():
+            counts[module_name] = counts.get(module_name, 0) + count
+        if not counts:
+            await msg.finish('暂无统计数据。')
+        ranking = sorted(counts.items(), key=lambda x: x[1], reverse=True)
+        title = f'最近{days}天' if since is not None else '自开始统计以来'
+        await msg.finish(f'{title}各模块的命令执行次数：\n' + '\n'.join(f'{m}：{c}' for m, c in ranking))
+    else:
+        await msg.finish('机器人未开启命令统计功能。')
+
+
+sts = on_command('stats', required_superuser=True)
+
+
+def format_stats(rows, limit=15):
+    lines = []
+    for stage, module, platform_, count, mean, p50, p99 in rows[:limit]:
+        name = '/'.join(x for x in (stage, module, platform_) if x)
+        lines.append(f'{name}：{count}次 平均{mean * 1000:.1f}ms p50 {p50 * 1000:.1f}ms p99 {p99 * 1000:.1f}ms')
+    return lines
+
+
+@sts.handle()
+async def _(msg: MessageSession):
+    rows = Metrics.summary()
+    if not rows:
+        await msg.finish('暂无耗时统计。')
+    lines = [f'自{datetime.fromtimestamp(Metrics.started_at).strftime("%Y-%m-%d %H:%M:%S")}起按p99排列的耗时统计：']
+    lines += format_stats(rows)
+    for name, stats in BotDBUtil.CacheSync.stats().items():
+        lines.append(f'{name}缓存：{stats["size"]}/{stats["maxsize"]}条 命中率{stats["hit_ratio"] * 100:.1f}%')
+    http_cache = HttpCache.stats()
+    if http_cache['hits'] + http_cache['revalidated'] + http_cache['misses']:
+        lines.append(f'HTTP响应缓存：{http_cache["entries"]}条 {http_cache["size"] / 1024 / 1024:.1f}MB '
+                     f'命中率{http_cache["hit_ratio"] * 100:.1f}%（其中304 {http_cache["revalidated"]}次）')
+    for name, stats in SingleFlight.stats().items():
+        if stats['shared']:
+            lines.append(f'{name}合并了{stats["shared"]}/{stats["calls"]}次重复请求')
+    await msg.finish('\n'.join(lines))
+
+
+@sts.handle('reset {清空耗时统计}')
+async def _(msg: MessageSession):
+    Metrics.reset()
+    await msg.finish('已清空耗时统计。')
+
+
+@sts.handle('http {查看各主机的请求耗时与连接复用率}')
+async def _(msg: MessageSession):
+    hosts = sorted(HttpClient.stats().items(), key=lambda x: x[1].latency.count, reverse=True)
+    if not hosts:
+        await msg.finish('暂无请求统计。')
+    lines = ['各主机的请求统计：']
+    for host, stats in hosts[:30]:
+        h = stats.latency
+        connections = stats.new_connections + stats.reused_connections
+        reuse = stats.reused_connections / connections * 100 if connections else 0
+        line = (f'{host}：{h.count}次 失败{stats.errors}次 重试{stats.retries}次 '
+                f'平均{(h.sum / h.count if h.count else 0) * 1000:.1f}ms '
+                f'p99 {h.quantile(0.99) * 1000:.1f}ms 连接复用率{reuse:.1f}%')
+        breaker = CircuitBreaker.all().get(host)
+        if breaker is not None and breaker.state != 'closed':
+            line += f' 熔断中（{breaker.state}，已拒绝{breaker.rejected}次）'
+        lines.append(line)
+    await msg.finish('\n'.join(lines))
+
+
+@sts.handle('<stage> {查看某一阶段按模块与平台区分的耗时}')
+async def _(msg: MessageSession):
+    stage = msg.parsed_msg['<stage>']
+    if stage not in STAGES:
+        await msg.finish('可用的阶段：\n' + '\n'.join(f'{k}：{v}' for k, v in STAGES.items()))
+    rows = Metrics.summary(stage)
+    if not rows:
+        await msg.finish('暂无耗时统计。')
+    await msg.finish('\n'.join([f'{STAGES[stage]}的耗时统计：'] + format_stats(rows, limit=30)))
+
+
+cache = on_command('cache', required_superuser=True)
+cache_categories = {'render': '生成的图片', 'download': '下载的文件', 'html': '网页源文件', 'workdir': '临时目录', 'tmp': '未完成的文件'}
+
+
+@cache.handle()
+async def _(msg: MessageSession):
+    report = CacheManager.report()
+    total = sum(x['size'] for x in report.values())
+    lines = [f'缓存目录占用{total / 1024 / 1024:.1f}MB，配额{CacheManager.quota / 1024 / 1024:.0f}MB：']
+    for category, stats in report.items():
+        lines.append(f'{cache_categories[category]}：{stats["count"]}项 {stats["size"] / 1024 / 1024:.1f}MB '
+                     f'有效期{CacheManager.ttls[category] // 60}分钟')
+    last = CacheManager.last_sweep
+    if last is not None:
+        lines.append(f'上次清理于{datetime.fromtimestamp(last["time"]).strftime("%Y-%m-%d %H:%M:%S")}，'
+                     f'删除过期{last["expired"]}项、超出配额{last["evicted"]}项，释放{last["freed"] / 1024 / 1024:.1f}MB')
+    await msg.finish('\n'.join(lines))
+
+
+@cache.handle('sweep {立即清理缓存目录}')
+async def _(msg: MessageSession):
+    result = await CacheManager.sweep_async()
+    await msg.finish(f'已删除过期{result["expired"]}项、超出配额{result["evicted"]}项，'
+                     f'释放{result["freed"] / 1024 / 1024:.1f}MB，剩余{result["size"] / 1024 / 1024:.1f}MB。')
+
+
+prof = on_command('profile', required_superuser=True)
+profile_keys = {'time': '耗时', 'memory': '内存', 'rss': 'RSS', 'modules': '模块数'}
+
+
+def format_profile(sort: str = 'time'):
+    history = ImportProfiler.history()
+    if not history:
+        return '暂无分析报告，请使用~profile run进行分析。'
+    report = history[-1]
+    previous = {p['name']: p for p in history[-2]['packages']} if len(history) > 1 else {}
+    packages = sorted(report['packages'], key=lambda x: x[sort], reverse=True)
+    lines = [f'{datetime.fromtimestamp(report["time"]).strftime("%Y-%m-%d %H:%M:%S")}（{report["version"]}）'
+             f'的导入分析，按{profile_keys[sort]}排列：']
+    for p in packages[:30]:
+        line = (f'{p["name"]}：{p["time"] * 1000:.0f}ms 内存+{p["memory"] / 1024 / 1024:.1f}MB '
+                f'RSS+{p["rss"] / 1024 / 1024:.1f}MB 模块{p["modules"]}个')
+        if p['name'] in previous:
+            line += f'（耗时{(p["time"] - previous[p["name"]]["time"]) * 1000:+.0f}ms）'
+        if p['heavy']:
+            line += ' 依赖：' + '、'.join(f'{name} {t / 1000:.0f}ms' for name, t in p['heavy'])
+        if p['error']:
+            line += f' 导入失败：{p["error"]}'
+        lines.append(line)
+    if ImportProfiler.import_times:
+        lines.append('本进程中导入的包：' + '、'.join(f'{k} {v * 1000:.0f}ms' for k, v in
+                                             sorted(ImportProfiler.import_times.items(), key=lambda x: x[1],
+                                                    reverse=True)))
+    return '\n'.join(lines)
+
+
+@prof.handle()
+async def _(msg: MessageSession):
+    await msg.finish(format_profile())
+
+
+@prof.handle('run {在子进程中重新分析各模块的导入耗时与内存}')
+async def _(msg: MessageSession):
+    await msg.sendMessage('正在分析，请稍候……')
+    ver = os.path.abspath(PrivateAssets.path + '/version')
+    version = open(ver, 'r').read() if os.path.exists(ver) else None
+    await ImportProfiler.run(version)
+    await msg.finish(format_profile())
+
+
+@prof.handle('<sort> {按time、memory、rss或modules排序查看分析报告}')
+async def _(msg: MessageSession):
+    sort = msg.parsed_msg['<sort>']
+    if sort not in profile_keys:
+        await msg.finish('可用的排序方式：' + '、'.join(profile_keys))
+    await msg.finish(format_profile(sort))
+
+
 ae = on_command('abuse', alias=['ae'], developers=['Dianliang233'], required_superuser=True)
 
 
@@ -650,12 +825,15 @@ mute = on_command('mute', developers=['Dianliang233'], base=True, required_admin
 
 @mute.handle()
 async def _(msg: MessageSession):
-    if BotDBUtil.Muting(msg).check():
-        BotDBUtil.Muting(msg).remove()
-        await msg.finish('成功取消禁言。')
+    muting = BotDBUtil.Muting(msg)
+    muted = not muting.check()
+    if muted:
+        muting.add()
     else:
-        BotDBUtil.Muting(msg).add()
-        await msg.finish('成功禁言。')
+        muting.remove()
+    if msg.context is not None:  # 同一条消息中后续的并行命令据此判断是否已禁言
+        msg.context.is_muted = muted
+    await msg.finish('成功禁言。' if muted else '成功取消禁言。')
 
 
 leave = on_command('leave', developers=['OasisAkari'], base=True, required_admin=True, available_for='QQ|Group',
@@ -16,7 +16,7 @@ from gql import Client, gql
 from gql.transport.aiohttp import AIOHTTPTransport
 
 from core.logger import Logger
-from core.utils import get_url
+from core.utils import get_url, render, single_flight
 
 
 async def get_rating(uid, query_type):
@@ -111,8 +111,8 @@ async def get_rating(uid, query_type):
                 havecover = True
             else:
                 havecover = False
-            songcards.append(make_songcard(workdir, thumbpath, chart_type, difficulty, chart_name, score, acc, rt, playtime, rank,
-                          havecover))
+            songcards.append(render(make_songcard, workdir, thumbpath, chart_type, difficulty, chart_name, score, acc, rt,
+                                   playtime, rank, havecover))
 
         for x in bestRecords:
             rank += 1
@@ -122,88 +122,16 @@ async def get_rating(uid, query_type):
         await asyncio.gather(*songcards)
 
         # b30card
-        b30img = Image.new("RGBA", (1975, 1610), '#1e2129')
         avatar_path = await download_avatar_thumb(Avatar_img, ProfileId)
-        if avatar_path:
-            im = Image.open(avatar_path)
-            im = im.resize((110, 110))
-            try:
-                bigsize = (im.size[0] * 3, im.size[1] * 3)
-                mask = Image.new('L', bigsize, 0)
-                draw = ImageDraw.Draw(mask)
-                draw.ellipse((0, 0) + bigsize, fill=255)
-                mask = mask.resize(im.size, Image.ANTIALIAS)
-                im.putalpha(mask)
-                output = ImageOps.fit(im, mask.size, centering=(0.5, 0.5))
-                output.putalpha(mask)
-                output.convert('RGBA')
-                b30img.alpha_composite(output, (1825, 25))
-            except:
-                traceback.print_exc()
-
-        font4 = ImageFont.truetype(os.path.abspath('./assets/Nunito-Regular.ttf'), 35)
-        drawtext = ImageDraw.Draw(b30img)
-        get_name_width = font4.getsize(nick)[0]
-        get_img_width = b30img.width
-        drawtext.text((get_img_width - get_name_width - 160, 30), nick, '#ffffff', font=font4)
-
-        font5 = ImageFont.truetype(os.path.abspath('./assets/Noto Sans CJK DemiLight.otf'), 20)
-        level_text = f'等级 {ProfileLevel}'
-        level_text_width = font5.getsize(level_text)[0]
-        level_text_height = font5.getsize(level_text)[1]
-        img_level = Image.new("RGBA", (level_text_width + 20, 40), '#050a1a')
-        drawtext_level = ImageDraw.Draw(img_level)
-        drawtext_level.text(((img_level.width - level_text_width) / 2, (img_level.height - level_text_height) / 2),
-                            level_text, '#ffffff', font=font5)
-        b30img.alpha_composite(img_level, (1825 - img_level.width - 20, 85))
-        font6 = ImageFont.truetype(os.path.abspath('./assets/Nunito-Light.ttf'), 20)
-        rating_text = f'Rating {str(round(float(ProfileRating), 2))}'
-        rating_text_width = font6.getsize(rating_text)[0]
-        rating_text_height = font6.getsize(rating_text)[1]
-        img_rating = Image.new("RGBA", (rating_text_width + 20, 40), '#050a1a')
-        drawtext_level = ImageDraw.Draw(img_rating)
-        drawtext_level.text(((img_rating.width - rating_text_width) / 2, (img_rating.height - rating_text_height) / 2),
-                            rating_text, '#ffffff', font=font6)
-        b30img.alpha_composite(img_rating, (1825 - img_level.width - img_rating.width - 30, 85))
-        textdraw = ImageDraw.Draw(b30img)
-        textdraw.text((5, 5), f'Based on CytoidAPI | Generated by Teahouse Studios "Akaribot"',
-                      'white', font=font6)
-        i = 0
-        fname = 1
-        t = 0
-        s = 0
-        while True:
-            try:
-                cardimg = Image.open(f'{workdir}/{str(fname)}.png')
-                w = 15 + 384 * i
-                h = 135
-                if s == 5:
-                    s = 0
-                    t += 1
-                h = h + 240 * t
-                w = w - 384 * 5 * t
-                i += 1
-                # cardimg = await makeShadow(cardimg, 4, 9, [0, 3], 'rgba(0,0,0,0)', '#000000')
-                b30img.alpha_composite(cardimg, (w, h))
-                fname += 1
-                s += 1
-            except FileNotFoundError:
-                break
-            except Exception:
-                traceback.print_exc()
-                break
-        if __name__ == '__main__':
-            b30img.show()
-        else:
-            savefilename = os.path.abspath(f'{Config("cache_path")}{str(uuid.uuid4())}.jpg')
-            b30img.convert("RGB").save(savefilename)
-            # shutil.rmtree(workdir)
-            return {'status': True, 'path': savefilename}
+        savefilename = await render(make_b30card, workdir, avatar_path, nick, ProfileLevel, ProfileRating)
+        # shutil.rmtree(workdir)
+        return {'status': True, 'path': savefilename}
     except Exception as e:
         traceback.print_exc()
         return {'status': False, 'text': '发生错误：' + str(e)}
 
 
+@single_flight('cytoid_cover')
 async def download_cover_thumb(uid):
     try:
         d = abspath('./assets/cytoid-cover/' + uid + '/')
@@ -228,6 +156,7 @@ async def download_cover_thumb(uid):
         return False
 
 
+@single_flight('cytoid_avatar')
 async def download_avatar_thumb(link, id):
     Logger.info(f'Downloading avatar for {str(id)}')
     try:
@@ -249,8 +178,81 @@ async def download_avatar_thumb(link, id):
         return False
 
 
-async def make_songcard(workdir, coverpath, chart_type, difficulty, chart_name, score, acc, rt, playtime, rank,
-                        havecover=True):
+def make_b30card(workdir, avatar_path, nick, level, rating):
+    b30img = Image.new("RGBA", (1975, 1610), '#1e2129')
+    if avatar_path:
+        im = Image.open(avatar_path)
+        im = im.resize((110, 110))
+        try:
+            bigsize = (im.size[0] * 3, im.size[1] * 3)
+            mask = Image.new('L', bigsize, 0)
+            draw = ImageDraw.Draw(mask)
+            draw.ellipse((0, 0) + bigsize, fill=255)
+            mask = mask.resize(im.size, Image.ANTIALIAS)
+            im.putalpha(mask)
+            output = ImageOps.fit(im, mask.size, centering=(0.5, 0.5))
+            output.putalpha(mask)
+            output.convert('RGBA')
+            b30img.alpha_composite(output, (1825, 25))
+        except:
+            traceback.print_exc()
+
+    font4 = ImageFont.truetype(os.path.abspath('./assets/Nunito-Regular.ttf'), 35)
+    drawtext = ImageDraw.Draw(b30img)
+    get_name_width = font4.getsize(nick)[0]
+    get_img_width = b30img.width
+    drawtext.text((get_img_width - get_name_width - 160, 30), nick, '#ffffff', font=font4)
+
+    font5 = ImageFont.truetype(os.path.abspath('./assets/Noto Sans CJK DemiLight.otf'), 20)
+    level_text = f'等级 {level}'
+    level_text_width = font5.getsize(level_text)[0]
+    level_text_height = font5.getsize(level_text)[1]
+    img_level = Image.new("RGBA", (level_text_width + 20, 40), '#050a1a')
+    drawtext_level = ImageDraw.Draw(img_level)
+    drawtext_level.text(((img_level.width - level_text_width) / 2, (img_level.height - level_text_height) / 2),
+                        level_text, '#ffffff', font=font5)
+    b30img.alpha_composite(img_level, (1825 - img_level.width - 20, 85))
+    font6 = ImageFont.truetype(os.path.abspath('./assets/Nunito-Light.ttf'), 20)
+    rating_text = f'Rating {str(round(float(rating), 2))}'
+    rating_text_width = font6.getsize(rating_text)[0]
+    rating_text_height = font6.getsize(rating_text)[1]
+    img_rating = Image.new("RGBA", (rating_text_width + 20, 40), '#050a1a')
+    drawtext_level = ImageDraw.Draw(img_rating)
+    drawtext_level.text(((img_rating.width - rating_text_width) / 2, (img_rating.height - rating_text_height) / 2),
+                        rating_text, '#ffffff', font=font6)
+    b30img.alpha_composite(img_rating, (1825 - img_level.width - img_rating.width - 30, 85))
+    textdraw = ImageDraw.Draw(b30img)
+    textdraw.text((5, 5), f'Based on CytoidAPI | Generated by Teahouse Studios "Akaribot"',
+                  'white', font=font6)
+    i = 0
+    fname = 1
+    t = 0
+    s = 0
+    while True:
+        try:
+            cardimg = Image.open(f'{workdir}/{str(fname)}.png')
+            w = 15 + 384 * i
+            h = 135
+            if s == 5:
+                s = 0
+                t += 1
+            h = h + 240 * t
+            w = w - 384 * 5 * t
+            i += 1
+            # cardimg = await makeShadow(cardimg, 4, 9, [0, 3], 'rgba(0,0,0,0)', '#000000')
+            b30img.alpha_composite(cardimg, (w, h))
+            fname += 1
+            s += 1
+        except FileNotFoundError:
+            break
+        except Exception:
+            traceback.print_exc()
+            break
+    return b30img
+
+
+def make_songcard(workdir, coverpath, chart_type, difficulty, chart_name, score, acc, rt, playtime, rank,
+                   havecover=True):
     if havecover:
         try:
             img = Image.open(coverpath)
@@ -239,7 +239,7 @@ BREAK 50落(一共{brk}个)等价于 {(break_50_reduce / 100):.3f} 个 TAP GREAT
             await msg.finish("格式错误，输入“~maimai scoreline help”以查看帮助信息")
 
 
-@mai.handle('b40 <username> {查询B40信息（仅限大陆版maimai使用）}')
+@mai.handle('b40 <username> {查询B40信息（仅限大陆版maimai使用）}', rate_limit=(5, 60))
 async def _(msg: MessageSession):
     username = msg.parsed_msg['<username>']
     if username == "":
@@ -256,7 +256,7 @@ async def _(msg: MessageSession):
             await msg.finish([BImage(img)])
 
 
-@mai.handle('b50 <username> {查询B50信息（仅限大陆版maimai使用）}')
+@mai.handle('b50 <username> {查询B50信息（仅限大陆版maimai使用）}', rate_limit=(5, 60))
 async def _(msg: MessageSession):
     username = msg.parsed_msg['<username>']
     if username == "":
@@ -6,6 +6,9 @@ from typing import Optional, Dict, List
 
 import aiohttp
 from PIL import Image, ImageDraw, ImageFont, ImageFilter
+
+from core.utils import render
+
 from .maimaidx_music import get_cover_len4_id, TotalList
 
 total_list = TotalList()
@@ -387,7 +390,11 @@ def computeRa(ds: float, achievement: float) -> int:
     return math.floor(ds * (min(100.5, achievement) / 100) * baseRa)
 
 
-async def generate(payload: Dict) -> (Optional[Image.Image], bool):
+def draw_best(sdBest: BestList, dxBest: BestList, userName: str, playerRating: int, musicRating: int) -> Image.Image:
+    return DrawBest(sdBest, dxBest, userName, playerRating, musicRating).getDir()
+
+
+async def generate(payload: Dict) -> (Optional[str], bool):
     async with aiohttp.request("POST", "https://www.diving-fish.com/api/maimaidxprober/query/player",
                                json=payload) as resp:
         if resp.status == 400:
@@ -403,6 +410,6 @@ async def generate(payload: Dict) -> (Optional[Image.Image], bool):
             sd_best.push(await ChartInfo.from_json(c))
         for c in dx:
             dx_best.push(await ChartInfo.from_json(c))
-        pic = DrawBest(sd_best, dx_best, obj["nickname"], obj["rating"] + obj["additional_rating"],
-                       obj["rating"]).getDir()
+        pic = await render(draw_best, sd_best, dx_best, obj["nickname"], obj["rating"] + obj["additional_rating"],
+                           obj["rating"])
         return pic, 0
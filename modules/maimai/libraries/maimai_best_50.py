@@ -4,6 +4,9 @@ from typing import Optional, Dict, List, Tuple
 
 import aiohttp
 from PIL import Image, ImageDraw, ImageFont, ImageFilter
+
+from core.utils import render
+
 from .maimaidx_music import get_cover_len4_id, TotalList
 
 total_list = TotalList()
@@ -390,7 +393,11 @@ def computeRa(ds: float, achievement: float) -> int:
     return math.floor(ds * (min(100.5, achievement) / 100) * baseRa)
 
 
-async def generate50(payload: Dict) -> Tuple[Optional[Image.Image], bool]:
+def draw_best(sdBest: BestList, dxBest: BestList, userName: str) -> Image.Image:
+    return DrawBest(sdBest, dxBest, userName).getDir()
+
+
+async def generate50(payload: Dict) -> Tuple[Optional[str], bool]:
     async with aiohttp.request("POST", "https://www.diving-fish.com/api/maimaidxprober/query/player", json=payload) as resp:
         if resp.status == 400:
             return None, 400
@@ -405,5 +412,5 @@ async def generate50(payload: Dict) -> Tuple[Optional[Image.Image], bool]:
             sd_best.push(await ChartInfo.from_json(c))
         for c in dx:
             dx_best.push(await ChartInfo.from_json(c))
-        pic = DrawBest(sd_best, dx_best, obj["nickname"]).getDir()
+        pic = await render(draw_best, sd_best, dx_best, obj["nickname"])
         return pic, 0
@@ -2,7 +2,7 @@ import random
 from copy import deepcopy
 from typing import Dict, List, Optional, Union, Tuple, Any
 
-from core.utils import get_url
+from core.utils import get_url, single_flight
 
 
 def get_cover_len4_id(mid) -> str:
@@ -156,6 +156,7 @@ class TotalList:
     def __init__(self):
         self.total_list = None
 
+    @single_flight('maimai_music_data', key=id)
     async def get(self):
         if self.total_list is None:
             obj = await get_url('https://www.diving-fish.com/api/maimaidxprober/music_data', fmt='json')
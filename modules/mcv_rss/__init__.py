@@ -11,7 +11,7 @@ from config import Config
 from core.component import on_schedule
 from core.elements import FetchTarget, IntervalTrigger, PrivateAssets
 from core.logger import Logger
-from core.utils import get_stored_list, update_stored_list, get_url
+from core.utils import FeedState, get_url, RetryPolicy
 
 
 async def get_article(version):
@@ -57,6 +57,8 @@ async def get_article(version):
 
 
 trigger_times = 60 if not Config('slower_schedule') else 180
+# 下一次轮询即是重试，失败时不再额外重试
+poll_policy = RetryPolicy(attempts=1)
 
 
 @on_schedule('mcv_rss',
@@ -67,34 +69,30 @@ trigger_times = 60 if not Config('slower_schedule') else 180
 async def mcv_rss(bot: FetchTarget):
     url = 'https://piston-meta.mojang.com/mc/game/version_manifest.json'
     try:
-        verlist = get_stored_list(bot, 'mcv_rss')
-        file = json.loads(await get_url(url))
+        verlist = FeedState(bot, 'mcv_rss')
+        file = json.loads(await get_url(url, cache_ttl=0, policy=poll_policy))
         release = file['latest']['release']
         snapshot = file['latest']['snapshot']
         if release not in verlist:
             Logger.info(f'huh, we find {release}.')
             await bot.post_message('mcv_rss', '启动器已更新' + file['latest']['release'] + '正式版。')
-            verlist.append(release)
-            update_stored_list(bot, 'mcv_rss', verlist)
+            verlist.add(release)
             article = await get_article(release)
             if article[0] != '':
-                get_stored_news_title = get_stored_list(bot, 'mcnews')
+                get_stored_news_title = FeedState(bot, 'mcnews')
                 if article[1] not in get_stored_news_title:
                     await bot.post_message('minecraft_news', f'Minecraft官网发布了{release}的更新日志：\n' + article[0])
-                    get_stored_news_title.append(article[1])
-                    update_stored_list(bot, 'mcnews', get_stored_news_title)
+                    get_stored_news_title.add(article[1])
         if snapshot not in verlist:
             Logger.info(f'huh, we find {snapshot}.')
             await bot.post_message('mcv_rss', '启动器已更新' + file['latest']['snapshot'] + '快照。')
-            verlist.append(snapshot)
-            update_stored_list(bot, 'mcv_rss', verlist)
+            verlist.add(snapshot)
             article = await get_article(snapshot)
             if article[0] != '':
-                get_stored_news_title = get_stored_list(bot, 'mcnews')
+                get_stored_news_title = FeedState(bot, 'mcnews')
                 if article[1] not in get_stored_news_title:
                     await bot.post_message('minecraft_news', f'Minecraft官网发布了{snapshot}的更新日志：\n' + article[0])
-                    get_stored_news_title.append(article[1])
-                    update_stored_list(bot, 'mcnews', get_stored_news_title)
+                    get_stored_news_title.add(article[1])
     except Exception:
         traceback.print_exc()
 
@@ -105,13 +103,12 @@ async def mcv_rss(bot: FetchTarget):
              desc='开启后当Minecraft基岩版商店更新时将会自动推送消息。', alias='mcbvrss')
 async def mcbv_rss(bot: FetchTarget):
     try:
-        verlist = get_stored_list(bot, 'mcbv_rss')
+        verlist = FeedState(bot, 'mcbv_rss')
         version = google_play_scraper('com.mojang.minecraftpe')['version']
         if version not in verlist:
             Logger.info(f'huh, we find bedrock {version}.')
             await bot.post_message('mcbv_rss', '基岩版商店已更新' + version + '正式版。')
-            verlist.append(version)
-            update_stored_list(bot, 'mcbv_rss', verlist)
+            verlist.add(version)
     except Exception:
         traceback.print_exc()
 
@@ -122,28 +119,28 @@ async def mcbv_rss(bot: FetchTarget):
              desc='开启后当Jira更新Java版时将会自动推送消息。', alias='mcvjirarss')
 async def mcv_jira_rss(bot: FetchTarget):
     try:
-        verlist = get_stored_list(bot, 'mcv_jira_rss')
-        file = json.loads(await get_url('https://bugs.mojang.com/rest/api/2/project/10400/versions'))
+        verlist = FeedState(bot, 'mcv_jira_rss')
+        file = json.loads(await get_url('https://bugs.mojang.com/rest/api/2/project/10400/versions', cache_ttl=0,
+                                          policy=poll_policy))
         releases = []
+        archived = []
         for v in file:
             if not v['archived']:
                 releases.append(v['name'])
             else:
-                if v['name'] not in verlist:
-                    verlist.append(v['name'])
-        for release in releases:
-            if release not in verlist:
-                Logger.info(f'huh, we find {release}.')
-                if release.lower().find('future version') != -1:
-                    await bot.post_message('mcv_jira_rss',
-                                           f'Jira版本库已新增Java版 {release}。'
-                                           f'\n（Future Version仅代表与此相关的版本正在规划中，不代表启动器已更新此版本）')
-                else:
-                    await bot.post_message('mcv_jira_rss',
-                                           f'Jira已更新Java版 {release}。'
-                                           f'\n（Jira上的信息仅作版本号预览用，不代表启动器已更新此版本）')
-                verlist.append(release)
-                update_stored_list(bot, 'mcv_jira_rss', verlist)
+                archived.append(v['name'])
+        verlist.add(*archived)
+        for release in verlist.new_items(releases):
+            Logger.info(f'huh, we find {release}.')
+            if release.lower().find('future version') != -1:
+                await bot.post_message('mcv_jira_rss',
+                                       f'Jira版本库已新增Java版 {release}。'
+                                       f'\n（Future Version仅代表与此相关的版本正在规划中，不代表启动器已更新此版本）')
+            else:
+                await bot.post_message('mcv_jira_rss',
+                                       f'Jira已更新Java版 {release}。'
+                                       f'\n（Jira上的信息仅作版本号预览用，不代表启动器已更新此版本）')
+            verlist.add(release)
 
     except Exception:
         traceback.print_exc()
@@ -156,24 +153,24 @@ async def mcv_jira_rss(bot: FetchTarget):
              desc='开启后当Jira更新基岩版时将会自动推送消息。', alias='mcbvjirarss')
 async def mcbv_jira_rss(bot: FetchTarget):
     try:
-        verlist = get_stored_list(bot, 'mcbv_jira_rss')
-        file = json.loads(await get_url('https://bugs.mojang.com/rest/api/2/project/10200/versions'))
+        verlist = FeedState(bot, 'mcbv_jira_rss')
+        file = json.loads(await get_url('https://bugs.mojang.com/rest/api/2/project/10200/versions', cache_ttl=0,
+                                          policy=poll_policy))
         releases = []
+        archived = []
         for v in file:
             if not v['archived']:
                 releases.append(v['name'])
             else:
-                if v['name'] not in verlist:
-                    verlist.append(v['name'])
-        for release in releases:
-            if release not in verlist:
-                Logger.info(f'huh, we find {release}.')
-
-                await bot.post_message('mcbv_jira_rss',
-                                       f'Jira已更新基岩版 {release}。'
-                                       f'\n（Jira上的信息仅作版本号预览用，不代表商城已更新此版本）')
-                verlist.append(release)
-                update_stored_list(bot, 'mcbv_jira_rss', verlist)
+                archived.append(v['name'])
+        verlist.add(*archived)
+        for release in verlist.new_items(releases):
+            Logger.info(f'huh, we find {release}.')
+
+            await bot.post_message('mcbv_jira_rss',
+                                   f'Jira已更新基岩版 {release}。'
+                                   f'\n（Jira上的信息仅作版本号预览用，不代表商城已更新此版本）')
+            verlist.add(release)
     except Exception:
         traceback.print_exc()
 
@@ -185,23 +182,23 @@ async def mcbv_jira_rss(bot: FetchTarget):
              desc='开启后当Jira更新Dungeons版本时将会自动推送消息。', alias='mcdvjirarss')
 async def mcdv_jira_rss(bot: FetchTarget):
     try:
-        verlist = get_stored_list(bot, 'mcdv_jira_rss')
-        file = json.loads(await get_url('https://bugs.mojang.com/rest/api/2/project/11901/versions'))
+        verlist = FeedState(bot, 'mcdv_jira_rss')
+        file = json.loads(await get_url('https://bugs.mojang.com/rest/api/2/project/11901/versions', cache_ttl=0,
+                                          policy=poll_policy))
         releases = []
+        archived = []
         for v in file:
             if not v['archived']:
                 releases.append(v['name'])
             else:
-                if v['name'] not in verlist:
-                    verlist.append(v['name'])
-        for release in releases:
-            if release not in verlist:
-                Logger.info(f'huh, we find {release}.')
-
-                await bot.post_message('mcdv_jira_rss',
-                                       f'Jira已更新Minecraft Dungeons {release}。'
-                                       f'\n（Jira上的信息仅作版本号预览用，不代表启动器/商城已更新此版本）')
-                verlist.append(release)
-                update_stored_list(bot, 'mcdv_jira_rss', verlist)
+                archived.append(v['name'])
+        verlist.add(*archived)
+        for release in verlist.new_items(releases):
+            Logger.info(f'huh, we find {release}.')
+
+            await bot.post_message('mcdv_jira_rss',
+                                   f'Jira已更新Minecraft Dungeons {release}。'
+                                   f'\n（Jira上的信息仅作版本号预览用，不代表启动器/商城已更新此版本）')
+            verlist.add(release)
     except Exception:
         traceback.print_exc()
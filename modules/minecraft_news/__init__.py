@@ -10,7 +10,7 @@ from config import Config
 from core.component import on_schedule
 from core.elements import FetchTarget, IntervalTrigger, PrivateAssets, Url
 from core.logger import Logger
-from core.utils import get_url, get_stored_list, update_stored_list
+from core.utils import get_url, FeedState, RetryPolicy
 
 
 class Article:
@@ -39,6 +39,10 @@ class Article:
         return random_tags
 
 
+# 下一次轮询即是重试，失败时不再额外重试
+poll_policy = RetryPolicy(attempts=1)
+
+
 @on_schedule('minecraft_news', developers=['_LittleC_', 'OasisAkari', 'Dianliang233'],
              recommend_modules=['feedback_news'], trigger=IntervalTrigger(seconds=60 if not Config('slower_schedule') else 180),
              desc='开启后将会自动推送来自Minecraft官网的新闻。', alias='minecraftnews')
@@ -50,9 +54,9 @@ async def start_check_news(bot: FetchTarget):
     if not webrender:
         return
     get = webrender + 'source?url=' + url
-    getpage = await get_url(get)
+    getpage = await get_url(get, policy=poll_policy)
     if getpage:
-        alist = get_stored_list(bot, 'mcnews')
+        alist = FeedState(bot, 'mcnews')
         o_json = json.loads(getpage)
         o_nws = o_json['article_grid']
         Article.count = o_json['article_count']
@@ -67,8 +71,7 @@ async def start_check_news(bot: FetchTarget):
                 now = datetime.now()
                 if now - publish_date < timedelta(days=2):
                     await bot.post_message('minecraft_news', articletext)
-                alist.append(title)
-                update_stored_list(bot, 'mcnews', alist)
+                alist.add(title)
 
 
 @on_schedule('feedback_news', developers=['Dianliang233'], recommend_modules=['minecraft_news'],
@@ -81,8 +84,8 @@ async def feedback_news(bot: FetchTarget):
                  'url': 'https://minecraftfeedback.zendesk.com/api/v2/help_center/en-us/sections/360001186971/articles?per_page=5'}]
     for section in sections:
         try:
-            alist = get_stored_list(bot, 'mcfeedbacknews')
-            get = await get_url(section['url'])
+            alist = FeedState(bot, 'mcfeedbacknews')
+            get = await get_url(section['url'], policy=poll_policy)
             res = json.loads(get)
             articles = []
             for i in res['articles']:
@@ -94,7 +97,6 @@ async def feedback_news(bot: FetchTarget):
                     Logger.info(f'huh, we find {name}.')
                     await bot.post_message('feedback_news',
                                            f'Minecraft Feedback 发布了新的文章：\n{name}\n{str(Url(link))}')
-                    alist.append(name)
-                    update_stored_list(bot, 'mcfeedbacknews', alist)
+                    alist.add(name)
         except Exception:
             traceback.print_exc()
@@ -5,25 +5,12 @@ from PIL import Image, ImageDraw, ImageFont
 from core.component import on_command
 from core.elements import Image as Img
 from core.builtins.message import MessageSession
-from core.utils.cache import random_cache_path
+from core.utils import render
 
 assets_path = os.path.abspath('./assets/arcaea')
 
-p = on_command('ptt',
-               developers=['OasisAkari'])
 
-
-@p.handle('<potential> {生成一张Arcaea Potential图片}')
-async def pttimg(msg: MessageSession):
-    ptt = msg.parsed_msg['<potential>']
-    # ptt
-    if ptt == '--':
-        ptt = -1
-    else:
-        try:
-            ptt = float(ptt)
-        except ValueError:
-            await msg.finish('发生错误：potential 必须为 ≥0.00 且 ≤99.99 的数字。')
+def draw_ptt(ptt: float):
     if ptt >= 13.00:
         pttimg = 7
     elif ptt >= 12.50:
@@ -59,12 +46,9 @@ async def pttimg(msg: MessageSession):
         ptttext_width, ptttext_height = ptttext.size
         font1_width, font1_height = font1.getsize(ptt1 + '.')
         font2_width, font2_height = font2.getsize(ptt2)
-        print(font1_width, font1_height)
-        print(font2_width, font2_height)
         pttimg = Image.new("RGBA", (font1_width + font2_width + 6, font1_height + 6))
         drawptt = ImageDraw.Draw(pttimg)
         drawptt.text((0, 0), ptt1 + '.', 'white', font=font1, stroke_width=3, stroke_fill='#52495d')
-        print(int(int(font1_height) - int(font2_height)))
         drawptt.text((font1_width, int(int(font1_height) - int(font2_height))), ptt2, 'white', font=font2, stroke_width=3, stroke_fill='#52495d')
     elif ptt == -1:
         ptt = '--'
@@ -73,13 +57,30 @@ async def pttimg(msg: MessageSession):
         pttimg = Image.new("RGBA", (font1_width + 6, font1_height + 6))
         drawptt = ImageDraw.Draw(pttimg)
         drawptt.text((0, 0), ptt, 'white', font=font1, stroke_width=3, stroke_fill='#52495d')
-    else:
-        return await msg.finish('发生错误：potential 必须为 ≥0.00 且 ≤99.99 的数字。')
     pttimg_width, pttimg_height = pttimg.size
     ptttext.alpha_composite(pttimg,
                             (int((ptttext_width - pttimg_width) / 2), int((ptttext_height - pttimg_height) / 2) - 11))
     ptttext = ptttext.resize(pttimgr.size)
     pttimgr.alpha_composite(ptttext, (0, 0))
-    savepath = random_cache_path() + '.png'
-    pttimgr.save(savepath)
+    return pttimgr
+
+
+p = on_command('ptt',
+               developers=['OasisAkari'])
+
+
+@p.handle('<potential> {生成一张Arcaea Potential图片}')
+async def pttimg(msg: MessageSession):
+    ptt = msg.parsed_msg['<potential>']
+    # ptt
+    if ptt == '--':
+        ptt = -1
+    else:
+        try:
+            ptt = float(ptt)
+        except ValueError:
+            await msg.finish('发生错误：potential 必须为 ≥0.00 且 ≤99.99 的数字。')
+    if not (0 <= ptt <= 99.99 or ptt == -1):
+        await msg.finish('发生错误：potential 必须为 ≥0.00 且 ≤99.99 的数字。')
+    savepath = await render(draw_ptt, ptt, fmt='PNG')
     await msg.finish([Img(path=savepath)])
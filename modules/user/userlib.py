@@ -5,6 +5,7 @@ import urllib.parse
 import aiohttp
 
 from core.elements import Url, ErrorMessage
+from core.utils import render
 from modules.wiki.utils.UTC8 import UTC8
 from modules.wiki.wikilib import WikiLib
 from .gender import gender
@@ -183,56 +184,56 @@ async def GetUser(wikiurl, username, argv=None):
                         except KeyError:
                             pass
                         if Brs == 1:
-                            imagepath = tpg(favicon=wikipng,
-                                            wikiname=Wikiname,
-                                            username=User,
-                                            gender=Gender,
-                                            registertime=Registration,
-                                            contributionwikis=d(str(dd[0])),
-                                            createcount=d(str(dd[1])),
-                                            editcount=d(str(dd[2])),
-                                            deletecount=d(str(dd[3])),
-                                            patrolcount=d(str(dd[4])),
-                                            sitetop=d(str(dd[5])),
-                                            globaltop=d(str(dd[6])),
-                                            wikipoint=point,
-                                            blockbyuser=BlockedBy,
-                                            blocktimestamp1=Blockedtimestamp,
-                                            blocktimestamp2=Blockexpiry,
-                                            bantype='YN')
+                            imagepath = await render(tpg, favicon=wikipng,
+                                                     wikiname=Wikiname,
+                                                     username=User,
+                                                     gender=Gender,
+                                                     registertime=Registration,
+                                                     contributionwikis=d(str(dd[0])),
+                                                     createcount=d(str(dd[1])),
+                                                     editcount=d(str(dd[2])),
+                                                     deletecount=d(str(dd[3])),
+                                                     patrolcount=d(str(dd[4])),
+                                                     sitetop=d(str(dd[5])),
+                                                     globaltop=d(str(dd[6])),
+                                                     wikipoint=point,
+                                                     blockbyuser=BlockedBy,
+                                                     blocktimestamp1=Blockedtimestamp,
+                                                     blocktimestamp2=Blockexpiry,
+                                                     bantype='YN')
                         elif Brs == 2:
-                            imagepath = tpg(favicon=wikipng,
-                                            wikiname=Wikiname,
-                                            username=User,
-                                            gender=Gender,
-                                            registertime=Registration,
-                                            contributionwikis=d(str(dd[0])),
-                                            createcount=d(str(dd[1])),
-                                            editcount=d(str(dd[2])),
-                                            deletecount=d(str(dd[3])),
-                                            patrolcount=d(str(dd[4])),
-                                            sitetop=d(str(dd[5])),
-                                            globaltop=d(str(dd[6])),
-                                            wikipoint=point,
-                                            blockbyuser=BlockedBy,
-                                            blocktimestamp1=Blockedtimestamp,
-                                            blocktimestamp2=Blockexpiry,
-                                            blockreason=Blockreason,
-                                            bantype='Y')
+                            imagepath = await render(tpg, favicon=wikipng,
+                                                     wikiname=Wikiname,
+                                                     username=User,
+                                                     gender=Gender,
+                                                     registertime=Registration,
+                                                     contributionwikis=d(str(dd[0])),
+                                                     createcount=d(str(dd[1])),
+                                                     editcount=d(str(dd[2])),
+                                                     deletecount=d(str(dd[3])),
+                                                     patrolcount=d(str(dd[4])),
+                                                     sitetop=d(str(dd[5])),
+                                                     globaltop=d(str(dd[6])),
+                                                     wikipoint=point,
+                                                     blockbyuser=BlockedBy,
+                                                     blocktimestamp1=Blockedtimestamp,
+                                                     blocktimestamp2=Blockexpiry,
+                                                     blockreason=Blockreason,
+                                                     bantype='Y')
                 else:
-                    imagepath = tpg(favicon=wikipng,
-                                    wikiname=Wikiname,
-                                    username=User,
-                                    gender=Gender,
-                                    registertime=Registration,
-                                    contributionwikis=d(str(dd[0])),
-                                    createcount=d(str(dd[1])),
-                                    editcount=d(str(dd[2])),
-                                    deletecount=d(str(dd[3])),
-                                    patrolcount=d(str(dd[4])),
-                                    sitetop=d(str(dd[5])),
-                                    globaltop=d(str(dd[6])),
-                                    wikipoint=point)
+                    imagepath = await render(tpg, favicon=wikipng,
+                                             wikiname=Wikiname,
+                                             username=User,
+                                             gender=Gender,
+                                             registertime=Registration,
+                                             contributionwikis=d(str(dd[0])),
+                                             createcount=d(str(dd[1])),
+                                             editcount=d(str(dd[2])),
+                                             deletecount=d(str(dd[3])),
+                                             patrolcount=d(str(dd[4])),
+                                             sitetop=d(str(dd[5])),
+                                             globaltop=d(str(dd[6])),
+                                             wikipoint=point)
         if argv == '-p':
             return str(Url(f'{GetArticleUrl}'.replace('$1', f'User:{urllib.parse.quote(rmuser.encode("UTF-8"))}'))) + f'[[uimgc:{imagepath}]]'
         GlobalAuthData = (
@@ -11,6 +11,7 @@ from bs4 import BeautifulSoup, Comment
 
 from config import Config
 from core.logger import Logger
+from core.utils import HttpClient
 
 web_render = Config('web_render')
 
@@ -23,9 +24,9 @@ async def get_pic(link, page_link, headers, section=None, allow_special_page=Fal
         if link[-1] != '/':
             link += '/'
         try:
-            async with aiohttp.ClientSession(headers=headers) as session:
-                async with session.get(page_link, timeout=aiohttp.ClientTimeout(total=20)) as req:
-                    html = await req.read()
+            async with HttpClient.session().get(page_link, timeout=aiohttp.ClientTimeout(total=20),
+                                                headers=headers) as req:
+                html = await req.read()
         except:
             traceback.print_exc()
             return False
@@ -250,12 +251,11 @@ async def get_pic(link, page_link, headers, section=None, allow_special_page=Fal
         picname = os.path.abspath(f'./cache/{pagename}.jpg')
         if os.path.exists(picname):
             os.remove(picname)
-        async with aiohttp.ClientSession() as session:
-            async with session.post(web_render, headers={
-                'Content-Type': 'application/json',
-            }, data=json.dumps(html)) as resp:
-                with open(picname, 'wb+') as jpg:
-                    jpg.write(await resp.read())
+        async with HttpClient.session().post(web_render, headers={
+            'Content-Type': 'application/json',
+        }, data=json.dumps(html)) as resp:
+            with open(picname, 'wb+') as jpg:
+                jpg.write(await resp.read())
         return picname
     except Exception:
         traceback.print_exc()
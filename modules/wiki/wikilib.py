@@ -11,7 +11,7 @@ import core.utils.html2text as html2text
 from core.dirty_check import check
 from core.elements import Url
 from core.logger import Logger
-from core.utils import get_url
+from core.utils import get_url, single_flight
 from .dbutils import WikiSiteInfo as DBSiteInfo, Audit
 
 from config import Config
@@ -249,6 +249,8 @@ class WikiLib:
             else:
                 raise InvalidWikiError(wiki_info.message if wiki_info.message != '' else '')
 
+    @single_flight('wiki_get_json', key=lambda self, **kwargs: (self.url, str(self.headers),
+                                                               urllib.parse.urlencode(kwargs)))
     async def get_json(self, **kwargs) -> dict:
         await self.fixup_wiki_info()
         api = self.wiki_info.api